@@ -0,0 +1,292 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from SAR_Generator import generate_corpus
+from SAR_lib import SAR_Project, list_news_files
+
+# Benchmarks reproducibles del indexador y el buscador. Se mide:
+#
+#   - indexacion: tiempo, noticias por segundo y MB por segundo
+#   - tamaño del indice en disco, total y por tipo de fichero
+#   - tiempo de carga del indice
+#   - latencia de las consultas de cada tipo de operador (and, or, not, frase, proximidad, comodin, stemming,
+#     multicampo, any, rango de fechas) y de mostrar resultados con y sin evaluacion perezosa, snippets y ranking
+#
+# Las consultas se generan con una semilla a partir de palabras de noticias del propio corpus, asi que con el
+# mismo corpus y la misma semilla siempre se miden las mismas. Los resultados se guardan en JSON y se pueden
+# comparar con los de otra ejecucion con --compare.
+
+# tipos de consulta que se miden, en el orden en el que se muestran
+OPERATORS = ['term', 'and', 'or', 'not', 'and_not', 'phrase', 'near', 'wildcard', 'stem', 'multifield', 'any', 'date',
+             'show', 'lazy', 'snippet', 'rank']
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(times):
+    """
+    Resume una lista de tiempos en segundos: numero de medidas, media, percentiles 50, 90 y 99 y maximo, en ms.
+    """
+    ms = [t * 1000 for t in times]
+    return {'n': len(ms), 'mean_ms': statistics.mean(ms), 'p50_ms': percentile(ms, 50), 'p90_ms': percentile(ms, 90),
+            'p99_ms': percentile(ms, 99), 'max_ms': max(ms)}
+
+
+def directory_size(path):
+    """
+    Devuelve el tamaño total de un directorio y el de cada tipo de fichero (por extension).
+    """
+    sizes = {}
+    for dir, subdirs, files in os.walk(path):
+        for filename in files:
+            extension = os.path.splitext(filename)[1] or filename
+            sizes[extension] = sizes.get(extension, 0) + os.path.getsize(os.path.join(dir, filename))
+    return {'total_bytes': sum(sizes.values()), 'by_type': dict(sorted(sizes.items()))}
+
+
+def make_queries(searcher, n, rng):
+    """
+    Genera "n" consultas de cada tipo a partir de las palabras de noticias del corpus elegidas al azar.
+
+    return: diccionario tipo de consulta -> lista de consultas
+    """
+    texts = []
+    for _ in range(max(20, n)):
+        news = searcher.get_news_item(rng.randrange(searcher.total_news))
+        texts.append((searcher.tokenize(news['article']), searcher.tokenize(news['title']),
+                      searcher.tokenize(news['keywords'])))
+
+    def word():
+        return rng.choice(rng.choice(texts)[0])
+
+    def phrase(k):
+        tokens = rng.choice([t for (t, _, _) in texts if len(t) > k])
+        start = rng.randrange(len(tokens) - k)
+        return ' '.join(tokens[start:start + k])
+
+    dates = searcher.dindex.dates if searcher.dindex is not None else []
+    queries = {operator: [] for operator in OPERATORS}
+    for _ in range(n):
+        queries['term'].append(word())
+        queries['and'].append('%s and %s' % (word(), word()))
+        queries['or'].append('%s or %s or %s' % (word(), word(), word()))
+        queries['not'].append('not %s' % word())
+        queries['and_not'].append('%s and not %s' % (word(), word()))
+        queries['phrase'].append('"%s"' % phrase(rng.randint(2, 3)))
+        queries['near'].append('"%s"~%d' % (phrase(2), rng.randint(1, 5)))
+        queries['wildcard'].append(word()[:3] + '*')
+        queries['stem'].append('%s and %s' % (word(), word()))
+        title, keywords = rng.choice(texts)[1:]
+        queries['multifield'].append('title:%s and keywords:%s and %s' % (rng.choice(title), rng.choice(keywords),
+                                                                           word()))
+        queries['any'].append('any:%s' % word())
+        if len(dates) > 0:
+            low, high = sorted(rng.sample(dates, 2)) if len(dates) > 1 else (dates[0], dates[0])
+            queries['date'].append('%s and date:[%s TO %s]' % (word(), low, high))
+        queries['show'].append('%s or %s' % (word(), word()))
+        queries['lazy'].append(queries['show'][-1])
+        queries['snippet'].append('%s and "%s"' % (word(), phrase(2)))
+        queries['rank'].append('%s or %s' % (word(), word()))
+    return queries
+
+
+def bench_queries(searcher, queries, repeat):
+    """
+    Mide la latencia de cada consulta, sin la cache de resultados para medir siempre la evaluacion completa.
+
+    return: diccionario tipo de consulta -> resumen de tiempos
+    """
+    searcher.set_cache_size(0)
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        for operator in OPERATORS:
+            searcher.set_stemming(operator == 'stem')
+            searcher.set_ranking(operator == 'rank')
+            searcher.set_snippet(operator == 'snippet')
+            searcher.set_lazy(operator == 'lazy')
+            if operator in ('phrase', 'near', 'snippet'):
+                if not searcher.positional:
+                    continue
+            if operator == 'stem' and not searcher.stemming:
+                continue
+            if len(queries[operator]) == 0:
+                continue
+            times = []
+            for query in queries[operator]:
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    if operator in ('show', 'lazy', 'snippet', 'rank'):
+                        with contextlib.redirect_stdout(devnull):
+                            searcher.solve_and_show(query)
+                    else:
+                        len(searcher.solve_query(query))
+                    times.append(time.perf_counter() - t0)
+            results[operator] = summarize(times)
+    searcher.set_stemming(False)
+    searcher.set_ranking(False)
+    searcher.set_snippet(False)
+    searcher.set_lazy(False)
+    return results
+
+
+def run(args):
+    """
+    Ejecuta todos los benchmarks.
+
+    return: diccionario con los resultados
+    """
+    if args.generate or not os.path.isdir(args.newsdir):
+        generate_corpus(args.newsdir, args.days, args.news_per_day, args.article_words, args.vocabulary_size,
+                        args.zipf, args.seed)
+    filenames = list_news_files(args.newsdir)
+    corpus_bytes = sum(os.path.getsize(filename) for filename in filenames)
+
+    index_path = tempfile.mkdtemp(prefix='sar_bench_')
+    try:
+        indexer = SAR_Project()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            indexer.update_index(args.newsdir, index_path, multifield=True, positional=True, stem=True,
+                                 permuterm=True, workers=args.workers)
+        indexing_time = time.perf_counter() - t0
+        total_news = indexer.total_news
+        del indexer
+
+        load_times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            searcher = SAR_Project()
+            searcher.load_index(index_path)
+            load_times.append(time.perf_counter() - t0)
+
+        queries = make_queries(searcher, args.queries, random.Random(args.seed))
+        query_results = bench_queries(searcher, queries, args.repeat)
+        size = directory_size(index_path)
+    finally:
+        shutil.rmtree(index_path, ignore_errors=True)
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'workers': args.workers, 'repeat': args.repeat, 'queries': args.queries, 'seed': args.seed},
+        'corpus': {'path': args.newsdir, 'files': len(filenames), 'news': total_news, 'bytes': corpus_bytes},
+        'indexing': {'seconds': indexing_time, 'news_per_second': total_news / indexing_time,
+                     'mb_per_second': corpus_bytes / 2 ** 20 / indexing_time},
+        'index_size': size,
+        'load': summarize(load_times),
+        'queries': query_results,
+    }
+
+
+def flatten(results):
+    """
+    Devuelve las medidas comparables de unos resultados como diccionario nombre -> valor.
+    """
+    metrics = {'indexing.seconds': results['indexing']['seconds'],
+               'indexing.news_per_second': results['indexing']['news_per_second'],
+               'index_size.total_bytes': results['index_size']['total_bytes'],
+               'load.p50_ms': results['load']['p50_ms']}
+    for operator, summary in results['queries'].items():
+        metrics['queries.%s.p50_ms' % operator] = summary['p50_ms']
+        metrics['queries.%s.p90_ms' % operator] = summary['p90_ms']
+    return metrics
+
+
+def compare(old, new):
+    """
+    Muestra una tabla con las medidas de dos ejecuciones y la relacion entre ellas.
+    """
+    old_metrics = flatten(old)
+    new_metrics = flatten(new)
+    print("%-32s %14s %14s %8s" % ('metric', 'old', 'new', 'new/old'))
+    for name, value in new_metrics.items():
+        if name in old_metrics:
+            ratio = value / old_metrics[name] if old_metrics[name] else float('nan')
+            print("%-32s %14.3f %14.3f %8.2f" % (name, old_metrics[name], value, ratio))
+
+
+def show(results):
+    print("========================================")
+    print("Corpus: %d files, %d news, %.1f MB" % (results['corpus']['files'], results['corpus']['news'],
+                                                 results['corpus']['bytes'] / 2 ** 20))
+    print("Indexing: %.2fs (%.0f news/s, %.2f MB/s)" % (results['indexing']['seconds'],
+                                                       results['indexing']['news_per_second'],
+                                                       results['indexing']['mb_per_second']))
+    print("Index size: %.1f MB" % (results['index_size']['total_bytes'] / 2 ** 20))
+    print("Load time: %.1f ms" % results['load']['p50_ms'])
+    print("----------------------------------------")
+    print("%-12s %10s %10s %10s %10s" % ('query', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for operator, summary in results['queries'].items():
+        print("%-12s %10.3f %10.3f %10.3f %10.3f" % (operator, summary['mean_ms'], summary['p50_ms'],
+                                                     summary['p90_ms'], summary['p99_ms']))
+    print("========================================")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark indexing and searching on a (synthetic) news corpus.')
+
+    parser.add_argument('newsdir', metavar='newsdir', type=str,
+                        help='directory with the news; a synthetic corpus is generated there if it does not exist.')
+
+    parser.add_argument('-o', '--output', dest='output', metavar='file', type=str, default=None,
+                    help='file where the results are saved as json (default bench-<date>.json).')
+
+    parser.add_argument('--compare', dest='compare', metavar='file', type=str, default=None,
+                    help='json results of a previous run to compare with.')
+
+    parser.add_argument('--generate', dest='generate', action='store_true', default=False,
+                    help='generate the synthetic corpus even if the directory exists.')
+
+    parser.add_argument('--days', dest='days', type=int, default=30,
+                    help='days of the synthetic corpus (default 30).')
+
+    parser.add_argument('--news-per-day', dest='news_per_day', type=int, default=50,
+                    help='average news per day of the synthetic corpus (default 50).')
+
+    parser.add_argument('--article-words', dest='article_words', type=int, default=300,
+                    help='average words per article of the synthetic corpus (default 300).')
+
+    parser.add_argument('--vocabulary', dest='vocabulary_size', type=int, default=50000,
+                    help='distinct words of the synthetic corpus (default 50000).')
+
+    parser.add_argument('--zipf', dest='zipf', type=float, default=1.07,
+                    help='exponent of the Zipf distribution of the synthetic corpus (default 1.07).')
+
+    parser.add_argument('--seed', dest='seed', type=int, default=0,
+                    help='random seed for the corpus and the queries (default 0).')
+
+    parser.add_argument('-W', '--workers', dest='workers', metavar='N', type=int, default=1,
+                    help='number of processes used to index (default 1).')
+
+    parser.add_argument('--queries', dest='queries', metavar='N', type=int, default=50,
+                    help='number of queries of each type (default 50).')
+
+    parser.add_argument('--repeat', dest='repeat', metavar='N', type=int, default=3,
+                    help='times each query and the index load are measured (default 3).')
+
+    args = parser.parse_args()
+
+    results = run(args)
+    show(results)
+    output = args.output or 'bench-%s.json' % results['timestamp'].replace(':', '')
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump(results, fh, indent=2, ensure_ascii=False)
+    print("Results saved in %s" % output)
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as fh:
+            compare(json.load(fh), results)
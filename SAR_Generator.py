@@ -0,0 +1,161 @@
+import argparse
+import bisect
+import datetime
+import itertools
+import json
+import os
+import random
+
+# Generador de corpus sinteticos de noticias en castellano, con el mismo formato que los ficheros que se indexan:
+# un fichero JSON por dia ("AAAA-MM/AAAA-MM-DD.json") con una lista de noticias con los campos title, date,
+# keywords, article y summary.
+#
+# El vocabulario son palabras frecuentes del castellano seguidas de palabras inventadas a partir de silabas,
+# con variantes de genero y numero para que el stemming las agrupe. Las palabras se eligen con una distribucion
+# de Zipf: la palabra de rango r aparece con probabilidad proporcional a 1 / r^s, como en un texto real.
+# Con la misma semilla se genera siempre el mismo corpus.
+
+COMMON_WORDS = [
+    "de", "la", "que", "el", "en", "y", "a", "los", "del", "se", "las", "por", "un", "para", "con", "no", "una",
+    "su", "al", "lo", "como", "más", "pero", "sus", "le", "ya", "o", "este", "sí", "porque", "esta", "entre",
+    "cuando", "muy", "sin", "sobre", "también", "me", "hasta", "hay", "donde", "quien", "desde", "todo", "nos",
+    "durante", "todos", "uno", "les", "ni", "contra", "otros", "ese", "eso", "ante", "ellos", "e", "esto", "antes",
+    "algunos", "qué", "unos", "yo", "otro", "otras", "otra", "él", "tanto", "esa", "estos", "mucho", "quienes",
+    "nada", "muchos", "cual", "poco", "ella", "estar", "estas", "algunas", "algo", "nosotros",
+    "gobierno", "país", "año", "años", "día", "días", "presidente", "presidenta", "partido", "partidos", "política",
+    "político", "políticos", "economía", "económico", "españa", "madrid", "barcelona", "valencia", "sevilla",
+    "ministro", "ministra", "elecciones", "electoral", "ciudad", "ciudades", "mundo", "social", "sociales",
+    "empresa", "empresas", "trabajo", "trabajadores", "precio", "precios", "mercado", "bolsa", "euros", "banco",
+    "bancos", "crisis", "ley", "leyes", "juez", "jueces", "tribunal", "guerra", "paz", "fútbol", "equipo",
+    "equipos", "jugador", "jugadores", "liga", "copa", "música", "cine", "película", "películas", "libro",
+    "libros", "escuela", "universidad", "estudiantes", "salud", "hospital", "médicos", "casa", "casas", "semana",
+    "fin", "millones", "gente", "historia", "vida", "tiempo", "parte", "caso", "forma", "gobiernos", "congreso",
+    "senado", "reforma", "impuestos", "deuda", "paro", "empleo", "sanidad", "educación", "cultura", "deporte",
+]
+SYLLABLES = ["ba", "ca", "da", "fa", "ga", "la", "ma", "na", "pa", "ra", "sa", "ta", "be", "ce", "de", "le", "me",
+             "ne", "pe", "re", "se", "te", "bi", "ci", "di", "li", "mi", "ni", "pi", "ri", "si", "ti", "bo", "co",
+             "do", "lo", "mo", "no", "po", "ro", "so", "to", "bu", "cu", "du", "lu", "mu", "nu", "pu", "ru", "su",
+             "tu", "bra", "cra", "tra", "pla", "bla", "gra", "cion", "dad", "mien", "ción", "ño", "ña"]
+# terminaciones de genero y numero que se añaden a las palabras inventadas
+ENDINGS = ["o", "a", "os", "as", "e", "es"]
+
+
+def make_vocabulary(size, rng):
+    """
+    Genera un vocabulario de "size" palabras: primero las palabras frecuentes y despues palabras inventadas,
+    cada raiz con varias terminaciones seguidas para que compartan stem.
+
+    return: lista de palabras, de la mas a la menos frecuente
+    """
+    vocabulary = list(COMMON_WORDS[:size])
+    seen = set(vocabulary)
+    while len(vocabulary) < size:
+        stem = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for ending in rng.sample(ENDINGS, rng.randint(1, 3)):
+            word = stem + ending
+            if word not in seen and len(vocabulary) < size:
+                seen.add(word)
+                vocabulary.append(word)
+    return vocabulary
+
+
+class NewsGenerator:
+    """
+    Genera noticias con palabras del vocabulario elegidas con una distribucion de Zipf.
+    """
+
+    def __init__(self, vocabulary_size=50000, zipf=1.07, seed=0):
+        self.rng = random.Random(seed)
+        self.vocabulary = make_vocabulary(vocabulary_size, self.rng)
+        # pesos acumulados de la distribucion de Zipf, para elegir palabras con una busqueda binaria
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** zipf for rank in range(len(self.vocabulary))))
+
+    def words(self, n):
+        total = self.cum_weights[-1]
+        return [self.vocabulary[bisect.bisect_left(self.cum_weights, self.rng.random() * total)] for _ in range(n)]
+
+    def sentence(self, min_words, max_words):
+        text = ' '.join(self.words(self.rng.randint(min_words, max_words)))
+        return text[0].upper() + text[1:] + '.'
+
+    def news(self, date, article_words):
+        """
+        Genera una noticia del dia "date" con un articulo de aproximadamente "article_words" palabras.
+        """
+        article = []
+        n_words = 0
+        while n_words < article_words:
+            sentence = self.sentence(5, 25)
+            article.append(sentence)
+            n_words += sentence.count(' ') + 1
+        return {'title': self.sentence(4, 12), 'date': date, 'keywords': ', '.join(self.words(self.rng.randint(3, 6))),
+                'article': ' '.join(article), 'summary': self.sentence(15, 40)}
+
+
+def generate_corpus(path, days=30, news_per_day=50, article_words=300, vocabulary_size=50000, zipf=1.07, seed=0,
+                    start='2015-01-01'):
+    """
+    Genera un corpus sintetico en el directorio "path", con un fichero por dia.
+
+    param:  "path": directorio del corpus, se crea si no existe
+            "days": numero de dias (ficheros)
+            "news_per_day": numero medio de noticias por dia (varia un 50% arriba o abajo)
+            "article_words": numero medio de palabras de cada articulo
+            "vocabulary_size": numero de palabras distintas
+            "zipf": exponente de la distribucion de Zipf
+            "seed": semilla, con la misma semilla se genera el mismo corpus
+            "start": fecha del primer dia, AAAA-MM-DD
+
+    return: diccionario con el numero de ficheros, noticias y bytes generados
+    """
+    generator = NewsGenerator(vocabulary_size, zipf, seed)
+    rng = generator.rng
+    first = datetime.date.fromisoformat(start)
+    stats = {'files': 0, 'news': 0, 'bytes': 0}
+    for day in range(days):
+        date = (first + datetime.timedelta(days=day)).isoformat()
+        news = [generator.news(date, rng.randint(article_words // 2, article_words * 3 // 2))
+                for _ in range(rng.randint(max(1, news_per_day // 2), max(1, news_per_day * 3 // 2)))]
+        os.makedirs(os.path.join(path, date[:7]), exist_ok=True)
+        filename = os.path.join(path, date[:7], date + '.json')
+        with open(filename, 'w', encoding='utf-8') as fh:
+            json.dump(news, fh, ensure_ascii=False)
+        stats['files'] += 1
+        stats['news'] += len(news)
+        stats['bytes'] += os.path.getsize(filename)
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic corpus of Spanish news in json format.')
+
+    parser.add_argument('newsdir', metavar='newsdir', type=str,
+                        help='directory where the news files are written.')
+
+    parser.add_argument('--days', dest='days', type=int, default=30,
+                    help='number of days, one news file per day (default 30).')
+
+    parser.add_argument('--news-per-day', dest='news_per_day', type=int, default=50,
+                    help='average number of news per day (default 50).')
+
+    parser.add_argument('--article-words', dest='article_words', type=int, default=300,
+                    help='average number of words of each article (default 300).')
+
+    parser.add_argument('--vocabulary', dest='vocabulary_size', type=int, default=50000,
+                    help='number of distinct words (default 50000).')
+
+    parser.add_argument('--zipf', dest='zipf', type=float, default=1.07,
+                    help='exponent of the Zipf distribution of the words (default 1.07).')
+
+    parser.add_argument('--seed', dest='seed', type=int, default=0,
+                    help='random seed, the same seed always generates the same corpus (default 0).')
+
+    parser.add_argument('--start', dest='start', type=str, default='2015-01-01',
+                    help='date of the first day, YYYY-MM-DD (default 2015-01-01).')
+
+    args = parser.parse_args()
+
+    stats = generate_corpus(args.newsdir, args.days, args.news_per_day, args.article_words, args.vocabulary_size,
+                            args.zipf, args.seed, args.start)
+    print("Generated %d files with %d news (%.1f MB)." % (stats['files'], stats['news'], stats['bytes'] / 2 ** 20))
@@ -1,9 +1,9 @@
 import argparse
-import pickle
 import sys
 import time
 
 from SAR_lib import SAR_Project
+from SAR_profile import start_dump, write_dump
 
 
 if __name__ == "__main__":
@@ -13,7 +13,7 @@ if __name__ == "__main__":
                         help='directory with the news.')
 
     parser.add_argument('index', metavar='index', type=str,
-                        help='name of the file to save the project object.')
+                        help='name of the directory to save the index.')
 
     parser.add_argument('-S', '--stem', dest='stem', action='store_true', default=False, 
                     help='compute stem index.')
@@ -27,19 +27,47 @@ if __name__ == "__main__":
     parser.add_argument('-O', '--positional', dest='positional', action='store_true', default=False, 
                     help='compute positional index.')
 
+    parser.add_argument('-W', '--workers', dest='workers', metavar='N', type=int, default=1,
+                    help='number of processes used to index the news files.')
+
+    parser.add_argument('--stream', dest='stream', action='store_true', default=False,
+                    help='parse the news files one news item at a time to bound memory usage.')
+
+    parser.add_argument('--append', dest='append', action='store_true', default=False,
+                    help='update an existing index, indexing only new or changed news files into a new segment.')
+
+    parser.add_argument('--merge', dest='merge', action='store_true', default=False,
+                    help='merge all the segments of the index into one.')
+
+    parser.add_argument('--profile', dest='profile', action='store_true', default=False,
+                    help='show the time and counters of each indexing stage.')
+
+    parser.add_argument('--profile-dump', dest='profile_dump', metavar='file', type=str, default=None,
+                    help='write a cProfile dump to file, or the stage times as folded stacks for flamegraph.pl '
+                         'if file ends with .folded (implies --profile).')
+
     args = parser.parse_args()
 
     newsdir = args.newsdir
     indexfile = args.index
 
     indexer = SAR_Project()
+    indexer.set_profiling(args.profile or args.profile_dump is not None)
+    profile = start_dump(args.profile_dump)
     t0 = time.time()
-    indexer.index_dir(newsdir, **vars(args))
+    n_files = indexer.update_index(newsdir, indexfile, **vars(args))
     t1 = time.time()
-    with open(indexfile, 'wb') as fh:
-            pickle.dump(indexer, fh)
-    t2 = time.time()
-    indexer.show_stats()
+    write_dump(args.profile_dump, indexer.profiler, profile)
+    if args.append:
+        print("Indexed news files: %d" % n_files)
+        # El indexador solo tiene el segmento nuevo: las estadisticas se muestran de todo el indice
+        stats = SAR_Project()
+        stats.load_index(indexfile)
+        stats.set_stemming(stats.stemming)
+        stats.show_stats()
+    else:
+        indexer.show_stats()
     print("Time indexing: %2.2fs." % (t1 - t0))
-    print("Time saving: %2.2fs." % (t2 - t1))
-    print()
\ No newline at end of file
+    print()
+    if indexer.profiler is not None:
+        indexer.profiler.show()
\ No newline at end of file
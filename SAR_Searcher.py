@@ -2,10 +2,10 @@
 
 
 import argparse
-import pickle
 import sys
 
 from SAR_lib import SAR_Project
+from SAR_profile import start_dump, write_dump
 
 
 def syntax():
@@ -20,7 +20,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Search the index.')
 
     parser.add_argument('index', metavar='index', type=str,
-                        help='name of the file with the index object.')
+                        help='name of the directory with the index.')
 
     parser.add_argument('-S', '--stem', dest='stem', action='store_true', default=False, 
                     help='use stem index by default.')
@@ -41,6 +41,28 @@ if __name__ == "__main__":
                     help='rank results. Does not apply with -C and -T options.')
 
 
+    parser.add_argument('--lazy', dest='lazy', action='store_true', default=False,
+                    help='evaluate the queries lazily and stop after the first 10 results, showing only a lower bound '
+                         'of the number of results. Does not apply with -C, -A and -R options.')
+
+    parser.add_argument('--cache-size', dest='cache_size', metavar='N', type=int, default=SAR_Project.RESULT_CACHE_SIZE,
+                    help='maximum number of query and subquery results kept in the result cache (0 disables it).')
+
+    parser.add_argument('--cache-stats', dest='cache_stats', action='store_true', default=False,
+                    help='show the hits and misses of the query caches at the end.')
+
+    parser.add_argument('-J', '--jobs', dest='jobs', metavar='N', type=int, default=1,
+                    help='number of processes used to solve the queries of -L and -T (default 1).')
+
+
+    parser.add_argument('--profile', dest='profile', action='store_true', default=False,
+                    help='show the time and counters of each query stage at the end.')
+
+    parser.add_argument('--profile-dump', dest='profile_dump', metavar='file', type=str, default=None,
+                    help='write a cProfile dump to file (only of this process with -J), or the stage times as folded '
+                         'stacks for flamegraph.pl if file ends with .folded (implies --profile).')
+
+
     group1 = parser.add_mutually_exclusive_group()
     group1.add_argument('-Q', '--query', dest='query', metavar= 'query', type=str, action='store',
                     help='query.')
@@ -51,13 +73,17 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    with open(args.index, 'rb') as fh:
-        searcher = pickle.load(fh)
+    searcher = SAR_Project()
+    searcher.set_profiling(args.profile or args.profile_dump is not None)
+    profile = start_dump(args.profile_dump)
+    searcher.load_index(args.index)
 
     searcher.set_stemming(args.stem)
     searcher.set_ranking(args.rank)
     searcher.set_showall(args.all)
     searcher.set_snippet(args.snippet)
+    searcher.set_lazy(args.lazy)
+    searcher.set_cache_size(args.cache_size)
 
 
     # se debe contar o mostrar resultados?
@@ -71,11 +97,21 @@ if __name__ == "__main__":
 
         with open(args.test, encoding='utf-8') as fh:
             lines = fh.read().split('\n')
+            tests = [line.split('\t') for line in lines if len(line) > 0 and not line.startswith('#')]
+            if args.jobs > 1:
+                # Las consultas se resuelven en paralelo pero se comprueban en el orden del fichero
+                results = searcher.solve_queries_parallel([query for (query, _) in tests], True, args.jobs)
             for line in lines:
                 if len(line) > 0 and not line.startswith('#'):
                     query, reference = line.split('\t')
                     reference = int(reference)
-                    result = searcher.solve_and_count(query)
+                    if args.jobs > 1:
+                        output, result, exited = next(results)
+                        print(output, end='')
+                        if exited:
+                            sys.exit()
+                    else:
+                        result = searcher.solve_and_count(query)
                     if result != reference:
                         print("==> ERROR: '%s'\t%d\t%d" % (query, result, reference))
                         sys.exit(-1)
@@ -92,9 +128,19 @@ if __name__ == "__main__":
         with open(args.qlist, encoding='utf-8') as fh:
             queries = fh.read().split('\n')
             queries.pop()
+            if args.jobs > 1:
+                # Las consultas se resuelven en paralelo y se muestran en el orden del fichero
+                results = searcher.solve_queries_parallel(
+                    [query for query in queries if len(query) > 0 and not query.startswith('#')], args.count, args.jobs)
             for query in queries:
                 if len(query) > 0 and not query.startswith('#'):
-                    fnc(query)
+                    if args.jobs > 1:
+                        output, _, exited = next(results)
+                        print(output, end='')
+                        if exited:
+                            sys.exit()
+                    else:
+                        fnc(query)
                 else:
                     print(query)
     else:
@@ -102,4 +148,11 @@ if __name__ == "__main__":
         query = input("query:")
         while query != "":
             fnc(query)
-            query = input("query:")
\ No newline at end of file
+            query = input("query:")
+
+    if args.cache_stats:
+        searcher.show_cache_stats()
+
+    if searcher.profiler is not None:
+        write_dump(args.profile_dump, searcher.profiler, profile)
+        searcher.profiler.show()
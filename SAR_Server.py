@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+from urllib.parse import urlsplit, parse_qs
+
+from SAR_lib import SAR_Project
+
+# Servidor de consultas: carga el indice una sola vez y responde consultas por HTTP, en un puerto local o en un
+# socket Unix. Las consultas se resuelven en un pool de procesos creados con fork despues de cargar el indice,
+# asi que lo comparten sin volver a leerlo, y el bucle de eventos solo lee peticiones y escribe respuestas.
+#
+# Peticiones:
+#   POST /search   cuerpo JSON {"query": "...", "count": false, "snippet": false, "stem": false, "rank": false, "all": false}
+#   GET  /search?query=...&count=1&snippet=1&stem=1&rank=1&all=1
+#   GET  /health
+#
+# Respuesta de /search: {"query": ..., "count": numero de resultados, "results": [noticias]}, sin "results" si se
+# pide "count". Si la consulta no es valida se responde con el estado 400 y {"error": mensaje}.
+
+# tamaño maximo del cuerpo de una peticion
+MAX_BODY = 1 << 20
+OPTIONS = ('count', 'snippet', 'stem', 'rank', 'all')
+
+# SAR_Project con el indice cargado, lo heredan los procesos del pool
+searcher = None
+
+
+def solve(request):
+    """
+    Resuelve una peticion de busqueda en un proceso del pool. Cada proceso tiene su copia del SAR_Project
+    y resuelve una peticion cada vez, asi que se pueden cambiar sus opciones en cada peticion.
+
+    param:  "request": diccionario con la query y las opciones
+
+    return: tupla (estado HTTP, diccionario con la respuesta)
+    """
+    searcher.set_stemming(request['stem'])
+    searcher.set_ranking(request['rank'])
+    searcher.set_showall(request['all'])
+    searcher.set_snippet(request['snippet'])
+    # Los errores de las consultas se imprimen y terminan el programa con exit(): capturamos el mensaje
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            if request['count']:
+                return 200, {'query': request['query'], 'count': len(searcher.solve_query(request['query']))}
+            return 200, searcher.search(request['query'])
+    except (SystemExit, ValueError) as e:
+        message = output.getvalue().strip() or str(e)
+        return 400, {'error': message}
+
+
+def parse_request(method, target, body):
+    """
+    Obtiene la query y las opciones de una peticion a /search.
+
+    return: diccionario con la query y las opciones
+    """
+    if method == 'POST':
+        try:
+            request = json.loads(body.decode('utf-8')) if body else {}
+        except ValueError as e:
+            # json.JSONDecodeError y UnicodeDecodeError
+            raise ValueError("ERROR: el cuerpo de la peticion no es JSON valido: %s" % e)
+        if not isinstance(request, dict):
+            raise ValueError("ERROR: el cuerpo de la peticion tiene que ser un objeto JSON")
+    else:
+        request = {key: values[-1] for key, values in parse_qs(urlsplit(target).query).items()}
+        for option in OPTIONS:
+            if option in request:
+                request[option] = request[option].lower() in ('1', 'true', 'yes')
+    if not isinstance(request.get('query'), str) or len(request['query']) == 0:
+        raise ValueError("ERROR: falta la query")
+    for option in OPTIONS:
+        request[option] = bool(request.get(option, False))
+    return request
+
+
+async def run_in_pool(pool, function, *args):
+    """
+    Ejecuta una funcion en un proceso del pool y espera su resultado sin bloquear el bucle de eventos.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def finish(setter, value):
+        # La conexion se puede haber cerrado mientras tanto y el futuro estar cancelado
+        if not future.done():
+            setter(value)
+
+    # Los callbacks se llaman desde un hilo del pool, el futuro solo se puede tocar desde el bucle
+    pool.apply_async(function, args,
+                     callback=lambda value: loop.call_soon_threadsafe(finish, future.set_result, value),
+                     error_callback=lambda error: loop.call_soon_threadsafe(finish, future.set_exception, error))
+    return await future
+
+
+async def handle(reader, writer, pool):
+    """
+    Atiende una conexion: lee una peticion HTTP, la resuelve y cierra la conexion.
+    """
+    status, response = 500, {'error': 'ERROR: error interno'}
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if len(request_line) < 2:
+            status, response = 400, {'error': 'ERROR: peticion HTTP no valida'}
+        elif length > MAX_BODY:
+            status, response = 413, {'error': 'ERROR: peticion demasiado grande'}
+        else:
+            method, target = request_line[0], request_line[1]
+            body = await reader.readexactly(length) if length > 0 else b''
+            path = urlsplit(target).path
+            if path == '/health' and method == 'GET':
+                status, response = 200, {'status': 'ok', 'news': searcher.total_news}
+            elif path == '/search' and method in ('GET', 'POST'):
+                try:
+                    request = parse_request(method, target, body)
+                except ValueError as e:
+                    status, response = 400, {'error': str(e)}
+                else:
+                    # La consulta se resuelve en el pool, el bucle de eventos sigue atendiendo otras conexiones
+                    status, response = await run_in_pool(pool, solve, request)
+            else:
+                status, response = 404, {'error': 'ERROR: ruta no encontrada'}
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+        return
+    except Exception as e:
+        status, response = 500, {'error': 'ERROR: %s' % e}
+    data = json.dumps(response, ensure_ascii=False).encode('utf-8')
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}.get(status, 'Error')
+    writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: %d\r\n'
+                  'Connection: close\r\n\r\n' % (status, reason, len(data))).encode('latin-1') + data)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+def stop(signum, frame):
+    """
+    Con SIGTERM se para el servidor igual que con Ctrl-C, para cerrar el pool y borrar el socket.
+    """
+    raise KeyboardInterrupt
+
+
+async def serve(args, pool):
+    """
+    Arranca el servidor en el socket Unix o en el puerto indicados y lo mantiene hasta que se interrumpe.
+    """
+    callback = lambda reader, writer: handle(reader, writer, pool)
+    if args.unix is not None:
+        server = await asyncio.start_unix_server(callback, path=args.unix)
+        print("Serving on unix:%s" % args.unix)
+    else:
+        server = await asyncio.start_server(callback, host=args.host, port=args.port)
+        print("Serving on http://%s:%d" % (args.host, args.port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Serve queries over HTTP with JSON requests and responses.')
+
+    parser.add_argument('index', metavar='index', type=str,
+                        help='name of the directory with the index.')
+
+    parser.add_argument('--host', dest='host', type=str, default='127.0.0.1',
+                    help='address to listen on (default 127.0.0.1).')
+
+    parser.add_argument('--port', dest='port', type=int, default=8000,
+                    help='port to listen on (default 8000).')
+
+    parser.add_argument('--unix', dest='unix', metavar='path', type=str, default=None,
+                    help='listen on a Unix socket instead of a TCP port.')
+
+    parser.add_argument('-J', '--jobs', dest='jobs', metavar='N', type=int, default=os.cpu_count() or 1,
+                    help='number of processes used to solve the queries (default: number of CPUs).')
+
+    parser.add_argument('--cache-size', dest='cache_size', metavar='N', type=int, default=SAR_Project.RESULT_CACHE_SIZE,
+                    help='maximum number of query and subquery results kept in the result cache of each process.')
+
+    args = parser.parse_args()
+
+    searcher = SAR_Project()
+    searcher.load_index(args.index)
+    searcher.set_cache_size(args.cache_size)
+
+    # Pool crea todos sus procesos al construirse, antes que sus hilos: asi se hace el fork con el indice ya
+    # cargado, sin ningun hilo ni el bucle de eventos en marcha
+    pool = multiprocessing.get_context('fork').Pool(args.jobs)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        asyncio.run(serve(args, pool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.terminate()
+        pool.join()
+        if args.unix is not None and os.path.exists(args.unix):
+            os.remove(args.unix)
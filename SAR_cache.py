@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Cache de tamaño limitado con politica de reemplazo LRU: cuando esta llena se elimina la entrada
+    que hace mas tiempo que no se usa. Lleva la cuenta de aciertos y fallos para poder dimensionarla.
+    Con tamaño 0 la cache esta desactivada.
+    """
+
+    def __init__(self, max_size):
+        self.entries = OrderedDict()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Devuelve el valor guardado para "key", o "default" si no esta en la cache.
+        """
+        value = self.entries.get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Guarda un valor en la cache, eliminando las entradas menos usadas si se supera el tamaño maximo.
+        """
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def resize(self, max_size):
+        """
+        Cambia el tamaño maximo de la cache, eliminando las entradas que sobren.
+        """
+        self.max_size = max_size
+        while len(self.entries) > max(max_size, 0):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """
+        return: diccionario con el tamaño, el tamaño maximo, los aciertos, los fallos y la tasa de aciertos
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
@@ -0,0 +1,117 @@
+"""
+Indice de fechas para las busquedas por rango ("date:[2015-01-01 TO 2015-03-31]").
+
+Las fechas son cadenas "AAAA-MM-DD", que ordenadas como texto quedan en orden cronologico. El indice tiene:
+
+    - "dates": lista ordenada de las fechas distintas; el ordinal de una fecha es su posicion en la lista
+    - "news_dates": ordinal de la fecha de cada noticia, indexado por newid
+    - las particiones: bloques de noticias consecutivas (por newid) con el ordinal minimo y maximo de sus
+      fechas. Una particion se cierra cuando cambia la fecha si ya tiene PARTITION_MIN noticias, asi que con
+      ficheros de un dia cada fichero suele ser una particion con una sola fecha, y aunque las fechas esten
+      desordenadas no hay mas de total_news / PARTITION_MIN particiones.
+
+Un rango se resuelve con dos busquedas binarias en "dates", que lo convierten en un rango de ordinales, y una
+sola pasada por las particiones en orden de newid: las que no tienen ninguna fecha del rango se saltan, las
+que estan enteras dentro aportan todas sus noticias sin mirarlas, y solo en las que estan en parte se mira la
+fecha de cada noticia. El resultado sale ordenado sin leer ni mezclar las posting lists de cada dia.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+# numero minimo de noticias de una particion antes de empezar otra al cambiar de fecha
+PARTITION_MIN = 16
+
+
+class DateIndex:
+    """
+    Fechas ordenadas de las noticias y sus particiones (ver el comentario del modulo).
+    """
+
+    def __init__(self, dates, news_dates, starts, lows, highs):
+        """
+        param:  "dates": lista ordenada de fechas distintas
+                "news_dates": array con el ordinal de la fecha de cada noticia
+                "starts": array con el primer newid de cada particion
+                "lows", "highs": arrays con el ordinal minimo y maximo de cada particion
+        """
+        self.dates = dates
+        self.news_dates = news_dates
+        self.starts = starts
+        self.lows = lows
+        self.highs = highs
+
+    @classmethod
+    def from_postings(cls, field_index, total_news):
+        """
+        Construye el indice de fechas a partir del indice invertido del campo date.
+
+        param:  "field_index": diccionario fecha -> PostingList
+                "total_news": numero de noticias indexadas
+
+        return: DateIndex
+        """
+        dates = sorted(field_index.keys())
+        news_dates = array('I', bytes(4 * total_news))
+        for ordinal, date in enumerate(dates):
+            for newid in field_index[date].docs:
+                news_dates[newid] = ordinal
+        starts = array('I')
+        lows = array('I')
+        highs = array('I')
+        previous = None
+        for newid, ordinal in enumerate(news_dates):
+            if previous is None or (ordinal != previous and newid - starts[-1] >= PARTITION_MIN):
+                starts.append(newid)
+                lows.append(ordinal)
+                highs.append(ordinal)
+            elif ordinal < lows[-1]:
+                lows[-1] = ordinal
+            elif ordinal > highs[-1]:
+                highs[-1] = ordinal
+            previous = ordinal
+        return cls(dates, news_dates, starts, lows, highs)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def partitions(self):
+        """
+        Devuelve un iterador sobre las particiones como tuplas (primer newid, newid final sin incluir,
+        ordinal minimo, ordinal maximo).
+        """
+        ends = self.starts[1:]
+        ends.append(len(self.news_dates))
+        return zip(self.starts, ends, self.lows, self.highs)
+
+    def get_range(self, low=None, high=None):
+        """
+        Devuelve las noticias con fecha entre "low" y "high", ambas incluidas.
+
+        param:  "low", "high": fechas "AAAA-MM-DD", o None si el rango no tiene ese limite
+
+        return: array ordenado de newids
+        """
+        lo = 0 if low is None else bisect_left(self.dates, low)
+        hi = len(self.dates) if high is None else bisect_right(self.dates, high)
+        result = array('I')
+        if lo >= hi:
+            return result
+        news_dates = self.news_dates
+        for start, end, first, last in self.partitions():
+            if last < lo or first >= hi:
+                # Ninguna noticia de la particion puede estar en el rango
+                continue
+            if lo <= first and last < hi:
+                result.extend(range(start, end))
+            else:
+                result.extend([newid for newid in range(start, end) if lo <= news_dates[newid] < hi])
+        return result
+
+    def overlaps(self, low=None, high=None):
+        """
+        Indica si alguna noticia puede tener fecha entre "low" y "high".
+        """
+        if len(self.dates) == 0:
+            return False
+        return (low is None or self.dates[-1] >= low) and (high is None or self.dates[0] <= high)
@@ -0,0 +1,532 @@
+"""
+Formato de indice en disco, alternativa a guardar el objeto SAR_Project con pickle.
+
+El indice es un directorio con los ficheros:
+
+    - "meta.json": configuracion del indice (multifield, positional...), contadores y rutas de los documentos
+    - "news.bin": tabla de noticias, para cada newid dos enteros de 32 bits (docid, posicion en el fichero)
+    - "<campo>.lengths": longitud en tokens del campo en cada noticia, un entero de 32 bits por newid
+    - "postings.bin": posting lists codificadas con PostingList.encode, una tras otra
+    - "<campo>.terms": diccionario de terminos ordenado de cada campo
+    - "<campo>.bitmaps": terminos frecuentes de cada campo, cuyos datos son su posting list como bitmap
+    - "<campo>.stems": diccionario de stems de cada campo, si se ha hecho stemming
+    - "<campo>.perm": indice permuterm de cada campo, si se ha creado: las rotaciones de los terminos, sin datos
+    - "date.news" y "date.partitions": indice de fechas (ver SAR_dates), si el indice es multifield: el ordinal de
+      la fecha de cada noticia y, para cada particion, su primer newid y sus ordinales minimo y maximo. Las fechas
+      ordenadas estan en "meta.json"
+
+Los ficheros se abren con mmap, por lo que cargar el indice no lee las posting lists: cada consulta solo
+lee y decodifica las de los terminos que utiliza. Las ultimas posting lists decodificadas de cada diccionario se
+guardan en una cache LRU, asi los terminos que se repiten en las consultas solo se decodifican una vez.
+
+Cada diccionario de terminos esta ordenado por el termino (codificado en UTF-8) y comprimido con front coding:
+los terminos se agrupan en bloques de TERMS_BLOCK_SIZE y, dentro de cada bloque, cada termino se guarda como la
+longitud del prefijo que comparte con el anterior y el resto del termino. El fichero tiene una cabecera, la tabla
+con la posicion de cada bloque y los bloques. Para buscar un termino se hace una busqueda binaria sobre el primer
+termino de cada bloque, que esta completo, y se recorre solo ese bloque. Como los terminos estan ordenados,
+recorrer los que empiezan por un prefijo o estan en un rango es una busqueda y un recorrido secuencial.
+"""
+
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+from SAR_cache import LRUCache
+from SAR_dates import DateIndex
+from SAR_postings import PostingList, Bitmap, encode_varints, decode_varints, gaps, accumulate_gaps
+
+FORMAT_VERSION = 5
+TERMS_MAGIC = b'SART'
+# cabecera: magic, version, numero de terminos, numero de bloques
+TERMS_HEADER = struct.Struct('<4sIII')
+# numero de terminos de cada bloque del diccionario
+TERMS_BLOCK_SIZE = 16
+NEWS_RECORD = struct.Struct('<II')
+# numero de posting lists decodificadas que se guardan en la cache de cada diccionario de terminos
+POSTINGS_CACHE_SIZE = 64
+
+
+def open_mmap(filename):
+    """
+    Abre un fichero en modo solo lectura con mmap. Los ficheros vacios no se pueden mapear,
+    en ese caso se devuelve un objeto bytes vacio.
+    """
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+###############################
+###                         ###
+###        ESCRITURA        ###
+###                         ###
+###############################
+
+
+def write_index(project, path):
+    """
+    Guarda en el directorio "path" el indice de un SAR_Project ya construido.
+
+    param:  "project": SAR_Project con el indice
+            "path": directorio donde se guarda el indice, se crea si no existe
+
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'postings.bin'), 'wb') as postings_fh:
+        for field, field_index in project.index.items():
+            entries = []
+            for token, posting_list in field_index.items():
+                entries.append((token, posting_list.encode(), len(posting_list), posting_list.count))
+            write_terms(os.path.join(path, field + '.terms'), entries, postings_fh)
+        for field, field_bindex in project.bindex.items():
+            entries = []
+            for token, bitmap in field_bindex.items():
+                entries.append((token, bitmap.to_bytes(), len(bitmap), 0))
+            write_terms(os.path.join(path, field + '.bitmaps'), entries, postings_fh)
+        for field, field_sindex in project.sindex.items():
+            if len(field_sindex) == 0:
+                continue
+            entries = []
+            for stem, (terms, docs) in field_sindex.items():
+                entries.append((stem, encode_stem(terms, docs), len(docs), len(terms)))
+            write_terms(os.path.join(path, field + '.stems'), entries, postings_fh)
+
+        for field, permuterm in project.ptindex.items():
+            entries = [(rotation, b'', 0, 0) for rotation in permuterm]
+            write_terms(os.path.join(path, field + '.perm'), entries, postings_fh)
+
+    news = array('I')
+    for newid in range(project.total_news):
+        news.extend(project.news[newid])
+    write_array(os.path.join(path, 'news.bin'), news)
+    for field, lengths in project.lengths.items():
+        if len(lengths) > 0:
+            write_array(os.path.join(path, field + '.lengths'), lengths)
+    dindex = project.dindex
+    if dindex is not None:
+        write_array(os.path.join(path, 'date.news'), dindex.news_dates)
+        write_array(os.path.join(path, 'date.partitions'), dindex.starts + dindex.lows + dindex.highs)
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'multifield': project.multifield,
+        'positional': project.positional,
+        'stemming': project.stemming,
+        'permuterm': project.permuterm,
+        'total_news': project.total_news,
+        'total_doc': project.total_doc,
+        'docs': [project.docs[docid] for docid in range(project.total_doc)],
+        'stems': [field for field, field_sindex in project.sindex.items() if len(field_sindex) > 0],
+        'permuterms': list(project.ptindex),
+        'lengths': [field for field, lengths in project.lengths.items() if len(lengths) > 0],
+        'dates': dindex.dates if dindex is not None else None,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh, ensure_ascii=False)
+
+
+def write_terms(filename, entries, data_fh):
+    """
+    Escribe un diccionario de terminos ordenado y añade los datos de cada termino al fichero "data_fh".
+
+    Cada bloque empieza por el primer termino completo y la posicion de sus datos en "data_fh". Despues, para
+    cada termino: longitud del prefijo comun con el anterior, longitud y bytes del resto del termino, longitud
+    de sus datos, numero de noticias y apariciones, todo en varints. Los datos de los terminos de un bloque
+    estan seguidos en "data_fh", asi que basta con guardar la posicion de los del primero.
+
+    param:  "filename": fichero del diccionario
+            "entries": lista de tuplas (termino, datos codificados, numero de noticias, apariciones)
+            "data_fh": fichero abierto de datos (postings.bin), se escribe a partir de su posicion actual
+
+    """
+    entries = [(term.encode('utf-8'), data, n_docs, count) for (term, data, n_docs, count) in entries]
+    # Ordenamos por los bytes del termino, que es como se compara en la busqueda binaria
+    entries.sort(key=lambda x: x[0])
+    blocks = bytearray()
+    block_offsets = array('Q')
+    previous = b''
+    for i, (key, data, n_docs, count) in enumerate(entries):
+        if i % TERMS_BLOCK_SIZE == 0:
+            block_offsets.append(len(blocks))
+            shared = 0
+            encode_varints([data_fh.tell()], blocks)
+        else:
+            shared = common_prefix(previous, key)
+        encode_varints([shared, len(key) - shared], blocks)
+        blocks += key[shared:]
+        encode_varints([len(data), n_docs, count], blocks)
+        data_fh.write(data)
+        previous = key
+    if sys.byteorder == 'big':
+        block_offsets.byteswap()
+    with open(filename, 'wb') as fh:
+        fh.write(TERMS_HEADER.pack(TERMS_MAGIC, FORMAT_VERSION, len(entries), len(block_offsets)))
+        block_offsets.tofile(fh)
+        fh.write(blocks)
+
+
+def common_prefix(a, b):
+    """
+    Devuelve la longitud del prefijo comun de dos cadenas de bytes.
+    """
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def write_array(filename, values):
+    """
+    Escribe un array de enteros sin signo de 32 bits en little endian.
+    """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    with open(filename, 'wb') as fh:
+        values.tofile(fh)
+
+
+def read_array(filename):
+    """
+    Operacion inversa de "write_array".
+    """
+    values = array('I')
+    with open(filename, 'rb') as fh:
+        values.frombytes(fh.read())
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_stem(terms, docs):
+    """
+    Codifica una entrada del indice de stems: los terminos que tienen el stem (longitud en varint y
+    texto en UTF-8) seguidos de las diferencias entre los newids de su posting list.
+    """
+    data = bytearray()
+    for term in terms:
+        encoded = term.encode('utf-8')
+        encode_varints([len(encoded)], data)
+        data += encoded
+    encode_varints(gaps(docs), data)
+    return bytes(data)
+
+
+def decode_stem(data, n_docs, n_terms):
+    """
+    Operacion inversa de "encode_stem".
+
+    return: tupla ([terminos], array con los newids)
+    """
+    terms = []
+    pos = 0
+    for _ in range(n_terms):
+        (length,), pos = decode_varints(data, 1, pos)
+        terms.append(bytes(data[pos:pos + length]).decode('utf-8'))
+        pos += length
+    values, pos = decode_varints(data, n_docs, pos)
+    return (terms, array('I', accumulate_gaps(values)))
+
+
+###############################
+###                         ###
+###         LECTURA         ###
+###                         ###
+###############################
+
+
+def read_index(project, path):
+    """
+    Abre el indice guardado en "path" y lo asigna a un SAR_Project. Las posting lists no se leen
+    hasta que se consultan.
+
+    param:  "project": SAR_Project en el que se carga el indice
+            "path": directorio con el indice
+
+    """
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as fh:
+        meta = json.load(fh)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError("ERROR: version de indice no soportada en '%s'" % path)
+    postings = open_mmap(os.path.join(path, 'postings.bin'))
+    project.multifield = meta['multifield']
+    project.positional = meta['positional']
+    project.stemming = meta['stemming']
+    project.permuterm = meta['permuterm']
+    project.total_news = meta['total_news']
+    project.total_doc = meta['total_doc']
+    project.docs = dict(enumerate(meta['docs']))
+    project.news = DiskNewsTable(os.path.join(path, 'news.bin'), meta['total_news'])
+    for field in project.index:
+        project.index[field] = DiskFieldIndex(os.path.join(path, field + '.terms'), postings, meta['positional'])
+    for field in project.bindex:
+        project.bindex[field] = DiskBitmapIndex(os.path.join(path, field + '.bitmaps'), postings, meta['total_news'])
+    for field in meta['stems']:
+        project.sindex[field] = DiskStemIndex(os.path.join(path, field + '.stems'), postings)
+    for field in meta['lengths']:
+        project.lengths[field] = read_array(os.path.join(path, field + '.lengths'))
+    for field in meta['permuterms']:
+        project.ptindex[field] = DiskPermutermIndex(os.path.join(path, field + '.perm'))
+    if meta['dates'] is not None:
+        partitions = read_array(os.path.join(path, 'date.partitions'))
+        n = len(partitions) // 3
+        project.dindex = DateIndex(meta['dates'], read_array(os.path.join(path, 'date.news')), partitions[:n],
+                                   partitions[n:2 * n], partitions[2 * n:])
+
+
+class TermDictionary:
+    """
+    Diccionario de terminos ordenado y comprimido en disco (ver "write_terms"), abierto con mmap.
+    Solo se lee la tabla de bloques; los bloques se decodifican al buscar o recorrer sus terminos.
+
+    Los registros que devuelve son tuplas (termino en bytes, inicio de datos, longitud de datos,
+    numero de noticias, apariciones).
+    """
+
+    def __init__(self, filename):
+        self.mm = open_mmap(filename)
+        magic, version, self.n_terms, n_blocks = TERMS_HEADER.unpack_from(self.mm, 0)
+        if magic != TERMS_MAGIC or version != FORMAT_VERSION:
+            raise ValueError("ERROR: '%s' no es un diccionario de terminos" % filename)
+        self.block_offsets = array('Q')
+        self.block_offsets.frombytes(self.mm[TERMS_HEADER.size:TERMS_HEADER.size + 8 * n_blocks])
+        if sys.byteorder == 'big':
+            self.block_offsets.byteswap()
+        self.blocks_start = TERMS_HEADER.size + 8 * n_blocks
+
+    def __len__(self):
+        return self.n_terms
+
+    def first_key(self, b):
+        """
+        Devuelve el primer termino del bloque b, que esta guardado completo.
+        """
+        (_, _, length), pos = decode_varints(self.mm, 3, self.blocks_start + self.block_offsets[b])
+        return self.mm[pos:pos + length]
+
+    def read_block(self, b):
+        """
+        Decodifica el bloque b y devuelve la lista de sus registros.
+        """
+        (data_start,), pos = decode_varints(self.mm, 1, self.blocks_start + self.block_offsets[b])
+        n = min(TERMS_BLOCK_SIZE, self.n_terms - b * TERMS_BLOCK_SIZE)
+        records = []
+        key = b''
+        for _ in range(n):
+            (shared, length), pos = decode_varints(self.mm, 2, pos)
+            key = key[:shared] + self.mm[pos:pos + length]
+            pos += length
+            (data_len, n_docs, count), pos = decode_varints(self.mm, 3, pos)
+            records.append((key, data_start, data_len, n_docs, count))
+            data_start += data_len
+        return records
+
+    def find_block(self, key):
+        """
+        Busqueda binaria sobre los primeros terminos de los bloques: devuelve el ultimo bloque cuyo primer
+        termino es menor o igual que "key" (en bytes), o 0 si no hay ninguno.
+        """
+        low = 0
+        high = len(self.block_offsets)
+        while low < high:
+            mid = (low + high) // 2
+            if self.first_key(mid) <= key:
+                low = mid + 1
+            else:
+                high = mid
+        return max(low - 1, 0)
+
+    def find(self, key):
+        """
+        Busca un termino (en bytes) y devuelve su registro, o None si no esta en el diccionario.
+        """
+        if self.n_terms == 0:
+            return None
+        for record in self.read_block(self.find_block(key)):
+            if record[0] == key:
+                return record
+            if record[0] > key:
+                break
+        return None
+
+    def iter_from(self, key):
+        """
+        Recorre en orden los registros de los terminos mayores o iguales que "key" (en bytes).
+        """
+        if self.n_terms == 0:
+            return
+        first = self.find_block(key)
+        for b in range(first, len(self.block_offsets)):
+            for record in self.read_block(b):
+                if record[0] >= key:
+                    yield record
+
+    def iter_prefix(self, prefix):
+        """
+        Recorre en orden los registros de los terminos que empiezan por "prefix" (en bytes).
+        """
+        for record in self.iter_from(prefix):
+            if not record[0].startswith(prefix):
+                break
+            yield record
+
+    def iter_range(self, low, high):
+        """
+        Recorre en orden los registros de los terminos entre "low" y "high", ambos incluidos (en bytes).
+        """
+        for record in self.iter_from(low):
+            if record[0] > high:
+                break
+            yield record
+
+    def __iter__(self):
+        for b in range(len(self.block_offsets)):
+            yield from self.read_block(b)
+
+
+class DiskFieldIndex:
+    """
+    Indice invertido de un campo guardado en disco. Se comporta como el diccionario termino -> PostingList
+    de self.index[campo], pero cada posting list se lee y decodifica de "postings.bin" al consultarla, y se
+    guarda en una cache LRU para no volver a decodificarla. Las posting lists devueltas no se pueden modificar.
+    """
+
+    def __init__(self, filename, postings, positional):
+        self.terms = TermDictionary(filename)
+        self.postings = postings
+        self.positional = positional
+        self.cache = LRUCache(POSTINGS_CACHE_SIZE)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, token):
+        return self.terms.find(token.encode('utf-8')) is not None
+
+    def __getitem__(self, token):
+        posting_list = self.get(token)
+        if posting_list is None:
+            raise KeyError(token)
+        return posting_list
+
+    def decode(self, record):
+        _, data_start, data_len, n_docs, count = record
+        return PostingList.decode(self.postings[data_start:data_start + data_len], n_docs, count, self.positional)
+
+    def get(self, token, default=None):
+        value = self.cache.get(token)
+        if value is not None:
+            return value
+        record = self.terms.find(token.encode('utf-8'))
+        if record is None:
+            return default
+        value = self.decode(record)
+        self.cache.put(token, value)
+        return value
+
+    def keys(self):
+        return (record[0].decode('utf-8') for record in self.terms)
+
+    def iter_prefix(self, prefix):
+        """
+        Recorre en orden los terminos que empiezan por "prefix".
+        """
+        return (record[0].decode('utf-8') for record in self.terms.iter_prefix(prefix.encode('utf-8')))
+
+    def iter_range(self, low, high):
+        """
+        Recorre en orden los terminos entre "low" y "high", ambos incluidos.
+        """
+        return (record[0].decode('utf-8') for record in self.terms.iter_range(low.encode('utf-8'),
+                                                                              high.encode('utf-8')))
+
+    __iter__ = keys
+
+    def items(self):
+        return ((record[0].decode('utf-8'), self.decode(record)) for record in self.terms)
+
+    def values(self):
+        return (self.decode(record) for record in self.terms)
+
+
+class DiskStemIndex(DiskFieldIndex):
+    """
+    Indice de stems de un campo guardado en disco, se comporta como el diccionario
+    stem -> ([terminos], posting list) de self.sindex[campo].
+    """
+
+    def __init__(self, filename, postings):
+        super().__init__(filename, postings, False)
+
+    def decode(self, record):
+        _, data_start, data_len, n_docs, n_terms = record
+        return decode_stem(self.postings[data_start:data_start + data_len], n_docs, n_terms)
+
+
+class DiskBitmapIndex(DiskFieldIndex):
+    """
+    Bitmaps de los terminos frecuentes de un campo guardados en disco, se comporta como el diccionario
+    termino -> Bitmap de self.bindex[campo].
+    """
+
+    def __init__(self, filename, postings, total_news):
+        super().__init__(filename, postings, False)
+        self.total_news = total_news
+
+    def decode(self, record):
+        _, data_start, data_len, n_docs, _ = record
+        bitmap = Bitmap.from_bytes(self.postings[data_start:data_start + data_len], self.total_news)
+        bitmap.length = n_docs
+        return bitmap
+
+
+class DiskPermutermIndex:
+    """
+    Indice permuterm de un campo guardado en disco: un diccionario de terminos cuyas claves son las rotaciones
+    (ver SAR_permuterm), sin datos asociados.
+    """
+
+    def __init__(self, filename):
+        self.rotations = TermDictionary(filename)
+
+    def __len__(self):
+        return len(self.rotations)
+
+    def __iter__(self):
+        for record in self.rotations:
+            yield record[0].decode('utf-8')
+
+    def iter_prefix(self, prefix):
+        for record in self.rotations.iter_prefix(prefix.encode('utf-8')):
+            yield record[0].decode('utf-8')
+
+
+class DiskNewsTable:
+    """
+    Tabla de noticias guardada en disco, se comporta como el diccionario newid -> (docid, posicion) de self.news.
+    """
+
+    def __init__(self, filename, total_news):
+        self.mm = open_mmap(filename)
+        self.total_news = total_news
+
+    def __len__(self):
+        return self.total_news
+
+    def __contains__(self, newid):
+        return 0 <= newid < self.total_news
+
+    def __getitem__(self, newid):
+        if not 0 <= newid < self.total_news:
+            raise KeyError(newid)
+        return NEWS_RECORD.unpack_from(self.mm, newid * NEWS_RECORD.size)
+
+    def get(self, newid, default=None):
+        if newid in self:
+            return self[newid]
+        return default
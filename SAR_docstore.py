@@ -0,0 +1,202 @@
+"""
+Almacen de noticias para mostrar los resultados sin volver a parsear los ficheros originales.
+
+Al indexar se guardan las noticias, en orden de newid, en bloques de BLOCK_SIZE noticias. Cada bloque es un
+JSON comprimido con zlib con la lista de noticias y la lista de sus offsets: para cada noticia, un diccionario
+campo -> posicion del caracter en el que empieza cada token del campo (codificadas como diferencias), con los
+que se generan los snippets sin volver a tokenizar. El almacen son dos ficheros dentro del directorio del indice:
+
+    - "docs.bin": los bloques comprimidos, uno tras otro
+    - "docs.idx": numero de bloques, el newid de la primera noticia de cada bloque (32 bits) y donde empieza
+      cada bloque en "docs.bin" (64 bits), con una posicion mas para el final del ultimo bloque
+
+El fichero de bloques se abre con mmap y para leer una noticia solo hay que descomprimir su bloque. Los bloques
+descomprimidos se guardan en una cache LRU, asi mostrar varias noticias del mismo bloque solo lo lee una vez.
+"""
+
+from array import array
+from bisect import bisect_right
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+from SAR_cache import LRUCache
+from SAR_disk import open_mmap
+from SAR_postings import gaps, accumulate_gaps
+
+# numero de noticias en cada bloque comprimido
+BLOCK_SIZE = 16
+# numero de bloques descomprimidos que se guardan en la cache
+BLOCK_CACHE_SIZE = 64
+IDX_HEADER = struct.Struct('<I')
+
+
+class DocStoreWriter:
+    """
+    Escribe el almacen de noticias mientras se indexa. Los bloques se escriben en un fichero temporal
+    (o en el fichero que se indique) y se copian al directorio del indice con "save".
+    """
+
+    def __init__(self, fh=None):
+        self.fh = fh if fh is not None else tempfile.TemporaryFile()
+        self.block = []
+        self.block_offsets = []
+        self.starts = array('I')
+        self.offsets = array('Q')
+
+    def add(self, newid, news, offsets=None):
+        """
+        Añade una noticia. Las noticias se tienen que añadir en orden creciente de newid.
+
+        param:  "newid": newid de la noticia
+                "news": diccionario con los campos de la noticia
+                "offsets": diccionario campo -> posiciones de inicio de los tokens del campo en su texto
+
+        """
+        self.add_record(newid, news, {field: gaps(starts) for field, starts in (offsets or {}).items()})
+
+    def add_record(self, newid, news, offset_gaps):
+        """
+        Añade una noticia con los offsets ya codificados como diferencias, tal y como se guardan en los bloques.
+        """
+        if len(self.block) == 0:
+            self.starts.append(newid)
+        self.block.append(news)
+        self.block_offsets.append(offset_gaps)
+        if len(self.block) >= BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Comprime y escribe el bloque actual, aunque no este completo.
+        """
+        if len(self.block) == 0:
+            return
+        self.offsets.append(self.fh.tell())
+        self.fh.write(zlib.compress(json.dumps([self.block, self.block_offsets], ensure_ascii=False).encode('utf-8')))
+        self.block = []
+        self.block_offsets = []
+
+    def get_blocks(self):
+        """
+        Devuelve todos los bloques escritos y sus tablas, para fusionarlos con "append_blocks" en otro almacen.
+
+        return: tupla (bytes con los bloques, newids de inicio de los bloques, posiciones de los bloques)
+        """
+        self.flush()
+        self.fh.seek(0)
+        return (self.fh.read(), self.starts, self.offsets)
+
+    def append_blocks(self, blocks, news_offset):
+        """
+        Añade al final las noticias de otro almacen (ver "get_blocks"), desplazando sus newids.
+
+        Los bloques tienen que quedar igual que si las noticias se hubieran añadido una a una con "add", para que
+        el almacen no dependa de si se ha indexado en serie, en paralelo o por segmentos. Un bloque completo se
+        copia sin descomprimir si el bloque actual esta vacio; si no (el bloque actual esta a medias o es el
+        ultimo del otro almacen, que puede estar incompleto) se descomprime y sus noticias se vuelven a añadir.
+
+        param:  "blocks": tupla devuelta por "get_blocks" del otro almacen
+                "news_offset": desplazamiento de los newid del otro almacen
+
+        """
+        data, starts, offsets = blocks
+        for b in range(len(starts)):
+            end = offsets[b + 1] if b + 1 < len(starts) else len(data)
+            if len(self.block) == 0 and b + 1 < len(starts) and starts[b + 1] - starts[b] == BLOCK_SIZE:
+                self.starts.append(starts[b] + news_offset)
+                self.offsets.append(self.fh.tell())
+                self.fh.write(data[offsets[b]:end])
+            else:
+                block, block_offsets = json.loads(zlib.decompress(data[offsets[b]:end]).decode('utf-8'))
+                for i in range(len(block)):
+                    self.add_record(starts[b] + news_offset + i, block[i], block_offsets[i])
+
+    def save(self, path):
+        """
+        Guarda el almacen en el directorio del indice "path".
+        """
+        self.flush()
+        end = self.fh.tell()
+        self.fh.seek(0)
+        with open(os.path.join(path, 'docs.bin'), 'wb') as fh:
+            shutil.copyfileobj(self.fh, fh)
+        self.fh.seek(end)
+        offsets = array('Q', self.offsets)
+        offsets.append(end)
+        starts = array('I', self.starts)
+        if sys.byteorder == 'big':
+            starts.byteswap()
+            offsets.byteswap()
+        with open(os.path.join(path, 'docs.idx'), 'wb') as fh:
+            fh.write(IDX_HEADER.pack(len(self.starts)))
+            starts.tofile(fh)
+            offsets.tofile(fh)
+
+
+class DocStore:
+    """
+    Lee las noticias del almacen guardado en el directorio de un indice.
+    """
+
+    def __init__(self, path, cache_size=BLOCK_CACHE_SIZE):
+        with open(os.path.join(path, 'docs.idx'), 'rb') as fh:
+            (n_blocks,) = IDX_HEADER.unpack(fh.read(IDX_HEADER.size))
+            self.starts = array('I')
+            self.starts.fromfile(fh, n_blocks)
+            self.offsets = array('Q')
+            self.offsets.fromfile(fh, n_blocks + 1)
+        if sys.byteorder == 'big':
+            self.starts.byteswap()
+            self.offsets.byteswap()
+        self.data = open_mmap(os.path.join(path, 'docs.bin'))
+        self.blocks = LRUCache(cache_size)
+
+    def get_blocks(self):
+        """
+        Devuelve todos los bloques y sus tablas, como DocStoreWriter.get_blocks, para copiarlos a otro almacen.
+        """
+        return (bytes(self.data[:self.offsets[-1]]), self.starts, self.offsets[:-1])
+
+    def get_block(self, b):
+        """
+        Devuelve el bloque b, leyendolo y descomprimiendolo si no esta en la cache.
+
+        return: lista [noticias del bloque, offsets de sus tokens]
+        """
+        block = self.blocks.get(b)
+        if block is None:
+            data = self.data[self.offsets[b]:self.offsets[b + 1]]
+            block = json.loads(zlib.decompress(data).decode('utf-8'))
+            self.blocks.put(b, block)
+        return block
+
+    def find(self, newid):
+        """
+        Devuelve el numero del bloque con la noticia "newid".
+        """
+        b = bisect_right(self.starts, newid) - 1
+        if b < 0:
+            raise KeyError(newid)
+        return b
+
+    def get(self, newid):
+        """
+        Devuelve el diccionario con los campos de la noticia "newid".
+        """
+        b = self.find(newid)
+        return self.get_block(b)[0][newid - self.starts[b]]
+
+    def get_offsets(self, newid):
+        """
+        Devuelve las posiciones de los caracteres en los que empiezan los tokens de cada campo de la noticia "newid".
+
+        return: diccionario campo -> lista con la posicion de inicio de cada token, en el orden de los tokens
+        """
+        b = self.find(newid)
+        offsets = self.get_block(b)[1][newid - self.starts[b]]
+        return {field: accumulate_gaps(field_gaps) for field, field_gaps in offsets.items()}
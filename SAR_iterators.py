@@ -0,0 +1,325 @@
+"""
+Evaluacion perezosa de consultas con iteradores de newids ordenados.
+
+Cada nodo del plan de una consulta (ver SAR_query) se convierte en un iterador que apunta a una noticia y solo
+avanza: "newid()" devuelve la noticia actual (None al final), "next()" pasa a la siguiente y "advance_to(newid)"
+salta a la primera noticia con newid mayor o igual. Los operadores piden noticias a sus hijos solo cuando las
+necesitan, asi que no se construye ninguna posting list intermedia: la memoria depende de la profundidad de la
+consulta y no del numero de resultados, y si solo se quieren los primeros resultados se deja de evaluar al
+tenerlos (ver SAR_Project.solve_and_show).
+
+Los AND saltan con "advance_to" de un hijo a otro (leapfrog), empezando por el que tiene menos noticias, y
+las posting lists avanzan con "gallop", de forma que no se recorren enteras.
+"""
+
+from array import array
+import heapq
+
+from SAR_postings import BYTE_BITS, gallop, match_near, match_phrase
+
+
+class DocIterator:
+    """
+    Clase base de los iteradores. Las subclases implementan "newid" y "advance_to", y "__len__" con una
+    estimacion del numero de noticias (para ordenar los hijos de los AND).
+    """
+
+    __slots__ = ()
+
+    def next(self):
+        """
+        Pasa a la siguiente noticia.
+
+        return: newid de la nueva noticia actual, o None si no hay mas
+        """
+        newid = self.newid()
+        if newid is None:
+            return None
+        return self.advance_to(newid + 1)
+
+    def __iter__(self):
+        newid = self.newid()
+        while newid is not None:
+            yield newid
+            newid = self.next()
+
+
+class PostingIterator(DocIterator):
+    """
+    Iterador sobre una posting list ordenada (array o lista de newids).
+    """
+
+    __slots__ = ('p', 'k')
+
+    def __init__(self, p):
+        self.p = p
+        self.k = 0
+
+    def __len__(self):
+        return len(self.p)
+
+    def newid(self):
+        return self.p[self.k] if self.k < len(self.p) else None
+
+    def next(self):
+        if self.k < len(self.p):
+            self.k += 1
+        return self.newid()
+
+    def advance_to(self, newid):
+        if self.k < len(self.p) and self.p[self.k] < newid:
+            self.k = gallop(self.p, newid, self.k)
+        return self.newid()
+
+
+class BitmapIterator(DocIterator):
+    """
+    Iterador sobre un SAR_postings.Bitmap: busca el siguiente bit a 1 en su representacion en bytes.
+    """
+
+    __slots__ = ('data', 'length', 'current')
+
+    def __init__(self, bitmap):
+        self.data = bitmap.to_bytes()
+        self.length = len(bitmap)
+        self.current = self.find(0)
+
+    def __len__(self):
+        return self.length
+
+    def find(self, start):
+        """
+        Devuelve el primer newid mayor o igual que "start" que esta en el bitmap, o None.
+        """
+        b = start >> 3
+        if b >= len(self.data):
+            return None
+        byte = self.data[b] & (0xFF << (start & 7)) & 0xFF
+        while byte == 0:
+            b += 1
+            if b >= len(self.data):
+                return None
+            byte = self.data[b]
+        return (b << 3) + BYTE_BITS[byte][0]
+
+    def newid(self):
+        return self.current
+
+    def advance_to(self, newid):
+        if self.current is not None and self.current < newid:
+            self.current = self.find(newid)
+        return self.current
+
+
+class AndIterator(DocIterator):
+    """
+    Interseccion de varios iteradores. La noticia candidata sale del hijo con menos noticias y los demas saltan
+    hasta ella; si alguno se pasa, la noticia en la que se ha parado es la nueva candidata.
+    """
+
+    __slots__ = ('children', 'current')
+
+    def __init__(self, children):
+        self.children = sorted(children, key=len)
+        self.current = self.align(self.children[0].newid())
+
+    def __len__(self):
+        return len(self.children[0])
+
+    def align(self, candidate):
+        """
+        Avanza todos los hijos hasta la primera noticia mayor o igual que "candidate" que esta en todos.
+        """
+        while candidate is not None:
+            for child in self.children:
+                newid = child.advance_to(candidate)
+                if newid is None:
+                    return None
+                if newid != candidate:
+                    candidate = newid
+                    break
+            else:
+                return candidate
+        return None
+
+    def newid(self):
+        return self.current
+
+    def advance_to(self, newid):
+        if self.current is not None and self.current < newid:
+            self.current = self.align(newid)
+        return self.current
+
+
+class OrIterator(DocIterator):
+    """
+    Union de varios iteradores, con un heap con la noticia actual de cada hijo.
+    """
+
+    __slots__ = ('children', 'heap', 'length')
+
+    def __init__(self, children):
+        self.children = children
+        self.heap = [(child.newid(), i) for i, child in enumerate(children) if child.newid() is not None]
+        heapq.heapify(self.heap)
+        self.length = sum(len(child) for child in children)
+
+    def __len__(self):
+        return self.length
+
+    def newid(self):
+        return self.heap[0][0] if len(self.heap) > 0 else None
+
+    def advance_to(self, newid):
+        heap = self.heap
+        while len(heap) > 0 and heap[0][0] < newid:
+            i = heap[0][1]
+            child_newid = self.children[i].advance_to(newid)
+            if child_newid is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (child_newid, i))
+        return self.newid()
+
+
+class NotIterator(DocIterator):
+    """
+    Complemento de un iterador: todas las noticias del corpus que no estan en el.
+    """
+
+    __slots__ = ('child', 'total', 'current')
+
+    def __init__(self, child, total):
+        self.child = child
+        self.total = total
+        self.current = self.find(0)
+
+    def __len__(self):
+        # La longitud de los hijos es una estimacion (la de un OR es la suma de la de sus hijos)
+        return max(0, self.total - len(self.child))
+
+    def find(self, candidate):
+        """
+        Devuelve la primera noticia mayor o igual que "candidate" que no esta en el hijo, o None.
+        """
+        while candidate < self.total:
+            if self.child.advance_to(candidate) != candidate:
+                return candidate
+            candidate += 1
+        return None
+
+    def newid(self):
+        return self.current
+
+    def advance_to(self, newid):
+        if self.current is not None and self.current < newid:
+            self.current = self.find(newid)
+        return self.current
+
+
+class MinusIterator(DocIterator):
+    """
+    Diferencia: noticias de un iterador que no estan en ninguno de los iteradores de "excluded".
+    """
+
+    __slots__ = ('base', 'excluded', 'current')
+
+    def __init__(self, base, excluded):
+        self.base = base
+        self.excluded = excluded
+        self.current = self.skip(base.newid())
+
+    def __len__(self):
+        return len(self.base)
+
+    def skip(self, candidate):
+        """
+        Avanza el iterador base desde "candidate" hasta la primera noticia que no esta excluida.
+        """
+        while candidate is not None:
+            for child in self.excluded:
+                if child.advance_to(candidate) == candidate:
+                    break
+            else:
+                return candidate
+            candidate = self.base.next()
+        return None
+
+    def newid(self):
+        return self.current
+
+    def advance_to(self, newid):
+        if self.current is not None and self.current < newid:
+            self.current = self.skip(self.base.advance_to(newid))
+        return self.current
+
+
+class PhraseIterator(DocIterator):
+    """
+    Noticias en las que los terminos de unos SAR_postings.PositionCursor aparecen seguidos, o con como mucho
+    "distance" palabras entre ellos si se indica. Los cursores se cruzan como en AndIterator y las posiciones
+    se comprueban solo en las noticias que tienen todos los terminos.
+    """
+
+    __slots__ = ('cursors', 'order', 'distance', 'current')
+
+    def __init__(self, cursors, distance=None):
+        self.cursors = cursors
+        self.order = sorted(cursors, key=len)
+        self.distance = distance
+        if len(cursors) == 0 or len(self.order[0]) == 0:
+            self.current = None
+        else:
+            self.current = self.find(self.order[0].newid())
+
+    def __len__(self):
+        return len(self.order[0]) if len(self.order) > 0 else 0
+
+    def find(self, candidate):
+        """
+        Devuelve la primera noticia mayor o igual que "candidate" en la que aparecen los terminos, o None.
+        """
+        while candidate is not None:
+            for cursor in self.order:
+                newid = cursor.advance_to(candidate)
+                if newid is None:
+                    # Si alguna posting list se acaba, ya no puede haber más noticias con todos los términos
+                    return None
+                if newid != candidate:
+                    candidate = newid
+                    break
+            else:
+                if self.distance is None:
+                    found = match_phrase(self.cursors)
+                else:
+                    found = match_near(self.cursors, self.distance)
+                if found:
+                    return candidate
+                # Pasamos a la siguiente noticia de la posting list más corta
+                candidate = self.order[0].advance_to(candidate + 1)
+        return None
+
+    def newid(self):
+        return self.current
+
+    def advance_to(self, newid):
+        if self.current is not None and self.current < newid:
+            self.current = self.find(newid)
+        return self.current
+
+
+def collect(iterator, limit=None):
+    """
+    Devuelve las noticias de un iterador como array de newids.
+
+    param:  "iterator": iterador de noticias
+            "limit": numero maximo de noticias, o None para recorrerlo entero
+
+    return: array ordenado de newids
+    """
+    result = array('I')
+    newid = iterator.newid()
+    while newid is not None and (limit is None or len(result) < limit):
+        result.append(newid)
+        newid = iterator.next()
+    return result
@@ -1,7 +1,32 @@
+from array import array
+from bisect import bisect_left
+import contextlib
+import io
 import json
+import multiprocessing
 from nltk.stem.snowball import SnowballStemmer
 import os
 import re
+import time
+
+import SAR_disk
+import SAR_segments
+from SAR_cache import LRUCache
+from SAR_dates import DateIndex
+from SAR_docstore import DocStore, DocStoreWriter
+from SAR_iterators import AndIterator, BitmapIterator, MinusIterator, NotIterator, OrIterator, \
+    PhraseIterator, PostingIterator, collect
+from SAR_profile import Profiler
+from SAR_permuterm import PermutermIndex, has_wildcard, is_prefix_pattern, match_terms
+from SAR_postings import PostingList, PositionCursor, Complement, Bitmap, EMPTY_POSITIONAL, BITMAP_RATIO, GALLOP_RATIO, \
+    gallop, merge_sorted, to_array
+from SAR_query import QueryCompiler, is_range, parse_phrase, parse_range
+from SAR_ranking import TermScorer, merge_freqs, top_k
+
+# fichero del directorio del indice con los stems calculados al indexar (ver SAR_Project.stem)
+STEM_MEMO_FILE = 'stems.json'
+# SAR_Project con el indice cargado que heredan los procesos de SAR_Project.solve_queries_parallel
+_shared_project = None
 
 
 class SAR_Project:
@@ -25,6 +50,10 @@ class SAR_Project:
     normalized_fields = {x[0] for x in fields if x[1]}
     # numero maximo de documento a mostrar cuando self.show_all es False
     SHOW_MAX = 10
+    # numero de tokens que se muestran a cada lado de los terminos encontrados en los snippets
+    SNIPPET_CONTEXT = 6
+    # numero maximo de resultados de consultas y subconsultas en la cache de resultados
+    RESULT_CACHE_SIZE = 256
 
     def __init__(self):
 
@@ -43,19 +72,40 @@ class SAR_Project:
         self.sindex = {k[0]: {} for k in
                       SAR_Project.fields}  # hash para el indice invertido de stems --> clave: stem,
         # valor: ([lista con los terminos que tienen ese stem],[lista apariciones])
-        self.ptindex = {}  # hash para el indice permuterm.
+        self.bindex = {k[0]: {} for k in
+                      SAR_Project.fields}  # hash con los bitmaps de los terminos muy frecuentes --> clave: termino, valor: Bitmap
+        self.ptindex = {}  # hash para el indice permuterm --> clave: campo, valor: rotaciones ordenadas de sus terminos (ver SAR_permuterm)
+        self.dindex = None  # indice de fechas ordenadas y particiones de noticias por fecha, para los rangos de fechas (ver SAR_dates)
         self.docs = {}  # diccionario de documentos --> clave: entero(docid),  valor: ruta del fichero.
         self.weight = {}  # hash de terminos para el pesado, ranking de resultados. puede no utilizarse
         self.news = {}  # hash de noticias --> clave entero (newid), valor: la info necesaria para diferenciar la noticia dentro de su fichero (doc_id y posición dentro del documento)
         self.tokenizer = re.compile("\W+")  # expresion regular para hacer la tokenizacion
+        self.word = re.compile(r"\w+")  # expresion regular de un token, para tokenizar guardando los offsets
         self.stemmer = SnowballStemmer('spanish')  # stemmer en castellano
+        self.stem_memo = {}  # hash con los stems ya calculados --> clave: token, valor: stem. Se guarda con el indice, ver self.stem()
+        self.stem_memo_path = None  # fichero del que se carga self.stem_memo la primera vez que se usa, ver self.load_index()
+        self.deleted = array('I')  # newids de las noticias borradas de un indice por segmentos, ver SAR_segments
         self.show_all = False  # valor por defecto, se cambia con self.set_showall()
         self.show_snippet = False  # valor por defecto, se cambia con self.set_snippet()
         self.use_stemming = False  # valor por defecto, se cambia con self.set_stemming()
         self.use_ranking = False  # valor por defecto, se cambia con self.set_ranking()
+        self.use_lazy = False  # valor por defecto, se cambia con self.set_lazy()
 
         self.total_doc = 0  # contador de número de documentos, usado para asignar docid
         self.total_news = 0  # contador de número de noticias, usado para asignar newid
+        # compilador de consultas con cache de planes, ver SAR_query. Los operandos "any:termino" buscan en los campos tokenizados
+        self.compiler = QueryCompiler(fields=[field for (field, tokenize) in SAR_Project.fields if tokenize])
+        self.result_cache = LRUCache(SAR_Project.RESULT_CACHE_SIZE)  # cache de resultados de consultas y subconsultas, se cambia con self.set_cache_size()
+        self.generation = 0  # se incrementa cada vez que cambia el indice, para no usar resultados de la cache de un indice anterior
+        self.docstore = None  # almacen de noticias para mostrar los resultados, se abre con self.load_index()
+        self.docstore_writer = None  # almacen de noticias que se escribe mientras se indexa
+        self.streaming = False  # si es True, los ficheros JSON se parsean noticia a noticia (ver iter_json_array)
+        self.workers = 1  # numero de procesos para indexar, se cambia con el argumento "workers" de self.index_dir()
+        self.lengths = {k[0]: array('I') for k in
+                        SAR_Project.fields}  # hash con la longitud en tokens de cada campo de cada noticia --> clave: campo, valor: array indexado por newid
+        self.avg_lengths = {}  # longitud media de cada campo, se calcula al rankear --> clave: campo, valor: (self.generation, media)
+        self.scores = {}  # puntuaciones de las noticias rankeadas en la ultima consulta --> clave: newid, valor: puntuacion
+        self.profiler = None  # tiempos y contadores de las etapas de indexacion y consulta, se activa con self.set_profiling()
 
     ###############################
     ###                         ###
@@ -120,6 +170,40 @@ class SAR_Project:
         """
         self.use_ranking = v
 
+    def set_lazy(self, v):
+        """
+
+        Cambia el modo de evaluacion de las consultas al mostrar los resultados.
+
+        input: "v" booleano.
+
+        si self.use_lazy es True y no se muestran todos los resultados ni se rankean, las consultas se evaluan con
+        iteradores (ver SAR_iterators) y se dejan de evaluar al encontrar los self.SHOW_MAX primeros resultados,
+        por lo que el numero de resultados que se muestra es solo una cota inferior. No aplicable a la opcion -C
+
+        """
+        self.use_lazy = v
+
+    def set_cache_size(self, v):
+        """
+
+        Cambia el numero maximo de resultados que se guardan en la cache de resultados.
+
+        input: "v" entero, con 0 se desactiva la cache.
+
+        """
+        self.result_cache.resize(v)
+
+    def set_profiling(self, v):
+        """
+
+        Activa o desactiva la medida de tiempos y contadores de cada etapa (ver SAR_profile).
+
+        input: "v" booleano.
+
+        """
+        self.profiler = Profiler() if v else None
+
     ###############################
     ###                         ###
     ###   PARTE 1: INDEXACION   ###
@@ -140,17 +224,64 @@ class SAR_Project:
         self.positional = args['positional']
         self.stemming = args['stem']
         self.permuterm = args['permuterm']
+        self.streaming = args.get('stream', False)
+        workers = args.get('workers') or 1
+        self.workers = workers
+        self.start_docstore()
+
+        # Recogemos primero todos los ficheros en el orden del recorrido, asi la numeracion de
+        # docid y newid es la misma tanto si se indexa en serie como en paralelo.
+        # Al actualizar un indice (ver self.update_index) solo se indexan los ficheros de args['files']
+        filenames = args.get('files')
+        if filenames is None:
+            filenames = list_news_files(root)
+
+        if workers > 1 and len(filenames) > 1:
+            self.index_files_parallel(filenames, workers)
+        else:
+            for fullname in filenames:
+                self.index_file(fullname)
 
-        for dir, subdirs, files in os.walk(root):
-            for filename in files:
-                if filename.endswith('.json'):
-                    fullname = os.path.join(dir, filename)
-                    self.index_file(fullname)
+        self.finish_index()
+
+    def start_docstore(self):
+        """
+        Crea el almacen en el que se guardan las noticias a la vez que se indexan.
+        """
+        self.docstore_writer = DocStoreWriter()
+
+    def finish_index(self):
+        """
+        Construye los índices que se calculan a partir del índice de términos, una vez indexadas todas las noticias.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            t0 = time.perf_counter()
+        # Guardamos como bitmap las posting lists de los términos que aparecen en muchas noticias
+        self.make_bitmaps()
+        if profiler is not None:
+            t1 = time.perf_counter()
+            profiler.add('index.bitmaps', t1 - t0)
 
         if self.stemming:
             #si stemming=true creamios indice de stems a partir del indice ya creado
             self.set_stemming(True)
             self.make_stemming()
+            if profiler is not None:
+                t0, t1 = t1, time.perf_counter()
+                profiler.add('index.stemming', t1 - t0)
+
+        if self.permuterm:
+            self.make_permuterm()
+            if profiler is not None:
+                t0, t1 = t1, time.perf_counter()
+                profiler.add('index.permuterm', t1 - t0)
+
+        if self.multifield:
+            # El campo date solo se indexa con multifield
+            self.make_dates()
+            if profiler is not None:
+                profiler.add('index.dates', time.perf_counter() - t1)
                     ##########################################
                     ## COMPLETAR PARA FUNCIONALIDADES EXTRA ##
                     ##########################################
@@ -171,8 +302,20 @@ class SAR_Project:
 
         """
 
+        profiler = self.profiler
         with open(filename) as fh:
-            jlist = json.load(fh)
+            if self.streaming:
+                # En modo streaming no se carga el fichero entero: "jlist" es un generador que
+                # parsea las noticias de una en una, y solo se mantiene en memoria la noticia actual
+                jlist = iter_json_array(fh)
+                if profiler is not None:
+                    jlist = profiler.iter('index.parse', jlist)
+            else:
+                if profiler is not None:
+                    t0 = time.perf_counter()
+                jlist = json.load(fh)
+                if profiler is not None:
+                    profiler.add('index.parse', time.perf_counter() - t0)
 
             #
             # "jlist" es una lista con tantos elementos como noticias hay en el fichero,
@@ -184,67 +327,243 @@ class SAR_Project:
             #
             #
 
-        position = 0
-        for news in jlist:
-            for field in self.fields:
-                if not self.multifield and field[0] != 'article':
-                    # Si no estamos procesando para múltiples campos y el campo actual no es artículo, pasamos al siguiente campo
-                    continue
-                if field[1]:  # tokenize
-                    tokens = self.tokenize(news[field[0]])
-                    for i in range(len(tokens)):
-                        # Para cada token de cada campo, lo intoroducimos en el índice
-                        token = tokens[i]
-                        if token not in self.index[field[0]]:
-                            # Si no hemos visto el token antes, creamos una entrada nueva en el índice, con número de aparaciones a 0 y lista de noticias en las que aparece vacía
-                            self.index[field[0]][token] = (0, [])
-                        index_entry = self.index[field[0]][token]
-                        posting_list = index_entry[1]
-                        if self.positional:
-                            # Si estamos construyendo el índice posicioanl
-                            if len(posting_list) > 0 and posting_list[-1][0] == self.total_news:
-                                # Si ya habíamos nos habíamos encotrado con este token en esta noticia, solamente añadimos la posición
-                                # a la lista de posiciones para el token en esa noticia. Comprobamos solo la última posición de la lista
-                                # de noticias porque al tratarlas secuencialmente, si buscamos la noticia actual, solamente sería posible
-                                # que estuviese en la última posición, no es posible que hayamos tratado otra distinta de por medio
-                                posting_list[-1][1].append(i)
-                            else:
-                                # Si el token no había aparecido antes en la noticia, creamos una nueva entrada con el id de la noticia
-                                # y la lista de apariciones con la posición del token
-                                posting_list.append((self.total_news, [i]))
-                        else:
-                            # Si no estamos construyendo el índice posicional
-                            if len(posting_list) == 0 or posting_list[-1] != self.total_news:
-                                # Si no nos habíamos encotrado antes el token en la noticia, añadimos el id de la noticia a lista de
-                                # de documentos para ese token
-                                posting_list.append(self.total_news)
-                        # Actualizamos la entrada en el índice para el token, incrementando el número total de apariciones y con la lista de documentos actaulizada
-                        self.index[field[0]][token] = (index_entry[0] + 1, posting_list)
-                else:  # not tokenize
-                    token = news[field[0]]
-                    if token not in self.index[field[0]]:
-                        # Si no hemos visto el token antes, creamos una entrada nueva en el índice, con número de aparaciones a 0 y lista de noticias en las que aparece vacía
-                        self.index[field[0]][token] = (0, [])
-                    index_entry = self.index[field[0]][token]
-                    posting_list = index_entry[1]
-                    if self.positional:
-                        # Si es posicional, añadimos a la lista de aparciones el id de la noticia. Como solo hay un token de este campo por
-                        # noticia, no es posible que el id de noticia ya esté en la lista, así que no hay que comprobarlo. Y como todo el
-                        # texto va a ser el token, la posición siempre será 0
-                        posting_list.append((self.total_news, [0]))
-                    else:
-                        # Si no es posicional, añadimos a la lista de apariciones el id de la noticia. Como solo hay un token de este campo
-                        # por noticia, no es posible que el id de noticia ya esté en la lista, así que no hay que comprobarlo.
-                        posting_list.append(self.total_news)
-                    # Actualizamos la entrada en el índice para el token, incrementando el número total de apariciones y con la lista de documentos actaulizada
-                    self.index[field[0]][token] = (index_entry[0] + 1, posting_list)
-            # Registramos la noticia con el documento en el que está y su posición dentro de él
-            self.news[self.total_news] = (self.total_doc, position)
-            self.total_news += 1
-            position += 1
+            position = 0
+            for news in jlist:
+                offsets = self.index_news(news)
+                if self.docstore_writer is not None:
+                    if profiler is not None:
+                        t0 = time.perf_counter()
+                    self.docstore_writer.add(self.total_news, news, offsets)
+                    if profiler is not None:
+                        profiler.add('index.docstore', time.perf_counter() - t0)
+                # Registramos la noticia con el documento en el que está y su posición dentro de él
+                self.news[self.total_news] = (self.total_doc, position)
+                self.total_news += 1
+                position += 1
+            # Soltamos la lista para no mantener el fichero parseado en memoria mas de lo necesario
+            del jlist
+        if profiler is not None:
+            profiler.count('index.files')
+            profiler.count('index.news', position)
         # Registramos el documento con su ruta
         self.docs[self.total_doc] = filename
         self.total_doc += 1
+        self.generation += 1
+
+    def index_news(self, news):
+        """
+        Indexa una noticia con el newid "self.total_news".
+
+        param:  "news": diccionario con los campos de la noticia
+
+        return: diccionario campo -> posiciones de los caracteres en los que empieza cada token de los campos
+                tokenizados, que se guardan en el almacen de noticias para generar los snippets
+
+        """
+        profiler = self.profiler
+        offsets = {}
+        for field in self.fields:
+            if not self.multifield and field[0] != 'article':
+                # Si no estamos procesando para múltiples campos y el campo actual no es artículo, pasamos al siguiente campo
+                continue
+            field_index = self.index[field[0]]
+            if profiler is not None:
+                t0 = time.perf_counter()
+            if field[1]:  # tokenize
+                tokens, offsets[field[0]] = self.tokenize_offsets(news[field[0]])
+            else:  # not tokenize
+                # Si no se tokeniza, todo el texto del campo es un único token en la posición 0
+                tokens = [news[field[0]]]
+            if profiler is not None:
+                t1 = time.perf_counter()
+                profiler.add('index.tokenize', t1 - t0)
+                profiler.count('index.tokens', len(tokens))
+            # Guardamos la longitud del campo para la normalización de BM25
+            self.lengths[field[0]].append(len(tokens))
+            for i in range(len(tokens)):
+                # Para cada token de cada campo, lo intoroducimos en el índice
+                token = tokens[i]
+                posting_list = field_index.get(token)
+                if posting_list is None:
+                    # Si no hemos visto el token antes, creamos una posting list vacía para él
+                    posting_list = PostingList(self.positional)
+                    field_index[token] = posting_list
+                # La posting list se encarga de no repetir la noticia si el token ya había aparecido en ella (solo puede ser
+                # la última, ya que tratamos las noticias secuencialmente), de guardar la posición si el índice es posicional
+                # y de incrementar el número total de apariciones
+                posting_list.add(self.total_news, i)
+            if profiler is not None:
+                profiler.add('index.postings', time.perf_counter() - t1)
+        return offsets
+
+    def index_files_parallel(self, filenames, workers):
+        """
+        Indexa una lista de ficheros repartiendola entre "workers" procesos.
+
+        Cada proceso construye un indice parcial para un bloque de ficheros consecutivos, numerando
+        noticias y documentos desde 0. Los indices parciales se van fusionando en el orden original de
+        los ficheros con "self.merge_partial_index", de forma que el resultado es identico al de una
+        indexacion en serie.
+
+        param:  "filenames": lista con las rutas de los ficheros a indexar, en orden
+                "workers": numero de procesos a utilizar
+
+        """
+        # Hacemos varios bloques por proceso para repartir mejor la carga si los ficheros son de tamaños distintos
+        n_chunks = min(len(filenames), workers * 4)
+        chunk_size = -(-len(filenames) // n_chunks)
+        config = {'multifield': self.multifield, 'positional': self.positional, 'streaming': self.streaming,
+                  'profiler': Profiler() if self.profiler is not None else None}
+        chunks = [(filenames[i:i + chunk_size], config) for i in range(0, len(filenames), chunk_size)]
+        with multiprocessing.Pool(workers) as pool:
+            # imap devuelve los resultados en el mismo orden que los bloques
+            for partial in pool.imap(_index_files_worker, chunks):
+                self.merge_partial_index(partial)
+
+    def merge_partial_index(self, partial):
+        """
+        Añade al indice un indice parcial construido con numeracion local de noticias y documentos.
+
+        Los newid y docid del indice parcial se desplazan con los contadores actuales, y como todas sus noticias
+        son posteriores a las ya indexadas, basta con concatenar las posting lists para que sigan ordenadas.
+
+        param:  "partial": diccionario con las claves "index", "news", "docs", "lengths", "docstore" y "profiler"
+                           de un SAR_Project parcial
+
+        """
+        news_offset = self.total_news
+        doc_offset = self.total_doc
+        for field, field_index in partial['index'].items():
+            own_index = self.index[field]
+            for token, posting_list in field_index.items():
+                own_list = own_index.get(token)
+                if own_list is None:
+                    own_list = PostingList(self.positional)
+                    own_index[token] = own_list
+                own_list.extend(posting_list, news_offset)
+        for field, field_lengths in partial['lengths'].items():
+            self.lengths[field].extend(field_lengths)
+        for newid, (docid, position) in partial['news'].items():
+            self.news[newid + news_offset] = (docid + doc_offset, position)
+        for docid, filename in partial['docs'].items():
+            self.docs[docid + doc_offset] = filename
+        if self.docstore_writer is not None:
+            self.docstore_writer.append_blocks(partial['docstore'], news_offset)
+        if self.profiler is not None and partial['profiler'] is not None:
+            # Los tiempos de los procesos se suman: son tiempo de CPU de todos ellos, no tiempo transcurrido
+            self.profiler.merge(partial['profiler'])
+        self.total_news += len(partial['news'])
+        self.total_doc += len(partial['docs'])
+        self.generation += 1
+
+    def save_index(self, path):
+        """
+        Guarda el indice en el directorio "path" con el formato en disco de SAR_disk, que permite
+        abrirlo despues con "self.load_index" sin leerlo entero.
+
+        param:  "path": directorio donde se guarda el indice
+
+        """
+        SAR_disk.write_index(self, path)
+        if self.docstore_writer is not None:
+            self.docstore_writer.save(path)
+        if self.stemming:
+            with open(os.path.join(path, STEM_MEMO_FILE), 'w', encoding='utf-8') as fh:
+                json.dump(self.stem_memo, fh, ensure_ascii=False)
+
+    def update_index(self, root, path, append=False, **args):
+        """
+        Indexa el directorio "root" y lo guarda en el directorio "path" como un índice por segmentos (ver SAR_segments).
+
+        Si "append" es True y "path" ya tiene un índice, solo se indexan los ficheros nuevos o modificados
+        desde la última vez, en un segmento nuevo, y se marcan como borradas las noticias de los ficheros
+        modificados o borrados. Después se fusionan los segmentos pequeños, o todos si args['merge'] es True.
+        Los índices de stems y permuterm de cada segmento solo tienen sus términos nuevos, y los stems ya
+        calculados en los segmentos anteriores no se vuelven a calcular.
+
+        param:  "root": directorio con las noticias
+                "path": directorio del índice
+                "append": si es True se actualiza el índice existente, si no se crea de nuevo
+                "args": mismos argumentos que self.index_dir
+
+        return: número de ficheros indexados
+        """
+        manifest = SAR_segments.read_manifest(path) if append else None
+        old_segments = []
+        if manifest is None:
+            previous = SAR_segments.read_manifest(path)
+            if previous is not None:
+                # El índice se crea de nuevo: los segmentos anteriores se borran al escribir el manifiesto nuevo
+                old_segments = [segment['name'] for segment in previous['segments']]
+            manifest = SAR_segments.new_manifest({'multifield': args['multifield'], 'positional': args['positional'],
+                                                  'stemming': args['stem'], 'permuterm': args['permuterm']})
+            manifest['next_segment'] = previous['next_segment'] if previous is not None else 1
+        else:
+            # El segmento nuevo se indexa con las mismas opciones que el resto del índice
+            config = manifest['config']
+            args.update({'multifield': config['multifield'], 'positional': config['positional'],
+                         'stem': config['stemming'], 'permuterm': config['permuterm']})
+            if len(manifest['segments']) > 0:
+                last = os.path.join(path, manifest['segments'][-1]['name'], STEM_MEMO_FILE)
+                if os.path.exists(last):
+                    self.stem_memo_path = last
+
+        filenames, stale = SAR_segments.changed_files(manifest, list_news_files(root))
+        self.index_dir(root, files=filenames, **args)
+        if self.profiler is not None:
+            t0 = time.perf_counter()
+        os.makedirs(path, exist_ok=True)
+        SAR_segments.delete_files(manifest, stale)
+        if self.total_news > 0:
+            SAR_segments.add_segment(path, manifest, self)
+        SAR_segments.write_manifest(path, manifest)
+        SAR_segments.remove_segments(path, old_segments)
+        if self.profiler is not None:
+            t1 = time.perf_counter()
+            self.profiler.add('index.save', t1 - t0)
+
+        if args.get('merge'):
+            if len(manifest['segments']) > 1:
+                SAR_segments.merge_segments(path, manifest, type(self), 0, len(manifest['segments']))
+        else:
+            selected = SAR_segments.select_merge(manifest['segments'])
+            while selected is not None:
+                SAR_segments.merge_segments(path, manifest, type(self), *selected)
+                selected = SAR_segments.select_merge(manifest['segments'])
+        if self.profiler is not None:
+            self.profiler.add('index.merge_segments', time.perf_counter() - t1)
+        return len(filenames)
+
+    def load_index(self, path):
+        """
+        Abre un indice guardado con "self.save_index" o "self.update_index". Los ficheros se mapean en memoria con mmap
+        y solo se leen las posting lists que necesiten las consultas.
+
+        param:  "path": directorio con el indice
+
+        """
+        manifest = SAR_segments.read_manifest(path)
+        if manifest is not None:
+            if len(manifest['segments']) == 1:
+                self.load_index(os.path.join(path, manifest['segments'][0]['name']))
+            elif len(manifest['segments']) > 1:
+                SAR_segments.load_segments(self, path, manifest)
+            else:
+                # Índice sin noticias (se indexó un directorio vacío): solo tiene las opciones con las que se creó
+                config = manifest['config']
+                self.multifield = config['multifield']
+                self.positional = config['positional']
+                self.stemming = config['stemming']
+                self.permuterm = config['permuterm']
+            self.deleted = array('I', manifest['deleted'])
+            self.generation += 1
+            return
+        SAR_disk.read_index(self, path)
+        self.docstore = DocStore(path)
+        if os.path.exists(os.path.join(path, STEM_MEMO_FILE)):
+            # Los stems calculados al indexar no se leen hasta que se necesitan
+            self.stem_memo_path = os.path.join(path, STEM_MEMO_FILE)
+        self.generation += 1
 
     def tokenize(self, text):
         """
@@ -260,6 +579,40 @@ class SAR_Project:
         """
         return self.tokenizer.sub(' ', text.lower()).split()
 
+    def tokenize_offsets(self, text):
+        """
+        Tokeniza un texto igual que "self.tokenize" y devuelve tambien donde empieza cada token.
+
+        Como entre dos tokens solo hay simbolos no alfanumericos, cada token se encuentra con str.find
+        a partir del final del anterior.
+
+        params: 'text': texto a tokenizar
+
+        return: tupla (lista de tokens, array con la posicion en "text" del primer caracter de cada token)
+        """
+        lowered = text.lower()
+        tokens = self.word.findall(lowered)
+        starts = array('I')
+        find = lowered.find
+        pos = 0
+        for token in tokens:
+            pos = find(token, pos)
+            starts.append(pos)
+            pos += len(token)
+        return tokens, starts
+
+    def make_bitmaps(self):
+        """
+        Crea el indice de bitmaps (self.bindex) con los terminos que aparecen en al menos una de cada
+        BITMAP_RATIO noticias. Para esos terminos get_posting devuelve el bitmap en lugar del array de newids,
+        y las operaciones AND, OR y NOT entre ellos se hacen bit a bit (ver SAR_postings.Bitmap).
+
+        """
+        for field, field_index in self.index.items():
+            for token, posting_list in field_index.items():
+                if len(posting_list) * BITMAP_RATIO >= self.total_news:
+                    self.bindex[field][token] = Bitmap.from_postings(posting_list.docs, self.total_news)
+
     def make_stemming(self):
         """
         NECESARIO PARA LA AMPLIACION DE STEMMING.
@@ -271,30 +624,57 @@ class SAR_Project:
         """
         # clave: stem,
         # valor: ([lista con los terminos que tienen ese stem],[lista apariciones])
+        self.load_stem_memo()
+        vocabulary = set()
         for field in self.fields_names:
+            vocabulary.update(self.index[field].keys())
+        new_tokens = sorted(token for token in vocabulary if token not in self.stem_memo)
+        if self.workers > 1 and len(new_tokens) > 1:
+            # Repartimos los tokens que aún no tienen stem entre varios procesos
+            chunk_size = -(-len(new_tokens) // (self.workers * 4))
+            chunks = [new_tokens[i:i + chunk_size] for i in range(0, len(new_tokens), chunk_size)]
+            with multiprocessing.Pool(self.workers) as pool:
+                for chunk, stems in zip(chunks, pool.map(_stem_worker, chunks)):
+                    self.stem_memo.update(zip(chunk, stems))
+        else:
+            for token in new_tokens:
+                self.stem(token)
+
+        for field in self.fields_names:
+            # Agrupamos primero los tokens por stem y luego unimos las posting lists de cada stem de una vez,
+            # con una mezcla de k vías, en lugar de ir uniéndolas de dos en dos
+            groups = {}
             for token in self.index[field].keys():
-                stem = self.stemmer.stem(token)
-                if stem not in self.sindex[field]:
-                    #para cada token de cada campo del indice de terminos, si no esta en el indice de stems
-                    if self.positional:
-                        self.sindex[field][stem] = ([token],[y[0] for y in self.index[field][token][1]])
-                        #si el indice es posicional extraemos solo noticias sin posiciones stem:([token], [newId1, newId2, ...])
-                    else:
-                        self.sindex[field][stem] =([token],self.index[field][token][1])
-                        #si no es posicional copiamos directamente las apariciones
-                else:
-                    #si ya esta en el indice de stems
-                    if self.positional:
-                        self.sindex[field][stem] = (self.sindex[field][stem][0] + [token],
-                                                    self.or_posting(self.sindex[field][stem][1],
-                                                                    [y[0] for y in self.index[field][token][1]]))
-                        #y el indice de terminos es posicional extraemos newIds y las unimos a la lista del stem
-                    else:
-                        self.sindex[field][stem] = (self.sindex[field][stem][0] + [token],
-                                                    self.or_posting(self.sindex[field][stem][1], self.index[field][token][1]))
-                        #si no es posicional unimos directamente
+                groups.setdefault(self.stem_memo[token], []).append(token)
+            field_sindex = self.sindex[field]
+            for stem, tokens in groups.items():
+                # Usamos directamente el array de newids de la posting list, sin las posiciones si el indice es posicional
+                field_sindex[stem] = (tokens, merge_sorted([self.index[field][token].docs for token in tokens]))
+
+    def load_stem_memo(self):
+        """
+        Carga en self.stem_memo los stems guardados en self.stem_memo_path, si aún no se han cargado.
+        """
+        if self.stem_memo_path is not None:
+            with open(self.stem_memo_path, encoding='utf-8') as fh:
+                self.stem_memo.update(json.load(fh))
+            self.stem_memo_path = None
+
+    def stem(self, token):
+        """
+        Devuelve el stem de un token. Los stems se guardan en self.stem_memo, así el stemmer
+        no se ejecuta dos veces con el mismo token.
 
+        param:  "token": token normalizado
 
+        return: stem del token
+        """
+        self.load_stem_memo()
+        stem = self.stem_memo.get(token)
+        if stem is None:
+            stem = self.stemmer.stem(token)
+            self.stem_memo[token] = stem
+        return stem
 
 
     def make_permuterm(self):
@@ -304,10 +684,18 @@ class SAR_Project:
         Crea el indice permuterm (self.ptindex) para los terminos de todos los indices.
 
         """
-        pass
-        ####################################################
-        ## COMPLETAR PARA FUNCIONALIDAD EXTRA DE STEMMING ##
-        ####################################################
+        for field, field_index in self.index.items():
+            if len(field_index) > 0:
+                # Para cada campo, array ordenado con todas las rotaciones de "termino$" de sus terminos
+                self.ptindex[field] = PermutermIndex(field_index.keys())
+
+    def make_dates(self):
+        """
+        Crea el indice de fechas (self.dindex) a partir del indice del campo date, para las busquedas por rango
+        de fechas.
+
+        """
+        self.dindex = DateIndex.from_postings(self.index['date'], self.total_news)
 
     def show_stats(self):
         """
@@ -317,9 +705,16 @@ class SAR_Project:
 
         """
         print("========================================")
-        print("Number of indexed days: " + str(len(self.index['date'])))
+        days = len(self.index['date'])
+        if len(self.deleted) > 0:
+            # Los días en los que todas las noticias están borradas ya no están en el índice
+            days = sum(1 for posting_list in self.index['date'].values()
+                       if len(self.minus_posting(posting_list.docs, self.deleted)) > 0)
+        print("Number of indexed days: " + str(days))
         print("----------------------------------------")
-        print("Number of indexed news: " + str(len(self.news)))
+        print("Number of indexed news: " + str(len(self.news) - len(self.deleted)))
+        if len(self.deleted) > 0:
+            print("Deleted news still in the segments: " + str(len(self.deleted)))
         print("----------------------------------------")
         print("TOKENS:")
         if self.multifield:
@@ -336,6 +731,14 @@ class SAR_Project:
                 print("----------------------------------------")
                 print("STEMS:")
                 print("\t# of stems in \'article\': " + str(len(self.sindex['article'])))
+        if len(self.ptindex) > 0:
+            print("----------------------------------------")
+            print("PERMUTERMS:")
+            for field in self.fields:
+                if field[0] in self.ptindex:
+                    print("\t# of permuterms in \'" + field[0] + "\': " + str(len(self.ptindex[field[0]])))
+        print("----------------------------------------")
+        self.show_postings_stats()
         print("----------------------------------------")
         if self.positional:
             print("Positional queries are allowed.")
@@ -343,6 +746,58 @@ class SAR_Project:
             print("Positional queries are NOT allowed.")
         print("========================================")
 
+    def show_postings_stats(self):
+        """
+        Muestra el tamaño de las posting lists compactas (ver SAR_postings.PostingList) comparado con
+        el que tendrian con la representacion basada en listas de Python.
+
+        """
+        n_postings = 0
+        n_positions = 0
+        memory = 0
+        list_memory = 0
+        serialized = 0
+        for field_index in self.index.values():
+            for posting_list in field_index.values():
+                n_postings += len(posting_list)
+                if posting_list.positions is not None:
+                    n_positions += len(posting_list.positions)
+                memory += posting_list.memory_size()
+                list_memory += posting_list.list_memory_size()
+                serialized += len(posting_list.encode())
+        n_bitmaps = sum(len(field_bindex) for field_bindex in self.bindex.values())
+        bitmaps_size = n_bitmaps * ((self.total_news + 7) // 8)
+        mb = 1024 * 1024
+        print("POSTINGS:")
+        print("\t# of postings: " + str(n_postings))
+        if self.positional:
+            print("\t# of positions: " + str(n_positions))
+        print("\tMemory (compact arrays): %.2f MB" % (memory / mb))
+        print("\tMemory (estimated with lists): %.2f MB (x%.1f)" % (list_memory / mb, list_memory / max(memory, 1)))
+        print("\tSerialized size (varint gaps): %.2f MB" % (serialized / mb))
+        print("\t# of dense terms stored as bitmaps: %d (%.2f MB)" % (n_bitmaps, bitmaps_size / mb))
+
+    def show_cache_stats(self):
+        """
+        Muestra los aciertos y fallos de la cache de resultados, de la cache de planes de consulta y de las caches
+        de posting lists decodificadas del índice en disco (sumando las de todos los campos y segmentos).
+
+        """
+        print("========================================")
+        caches = [("Result cache", self.result_cache.stats()), ("Plan cache", self.compiler.plans.stats())]
+        postings = [part.cache.stats() for field_index in self.index.values()
+                    for (_, part) in getattr(field_index, 'parts', [(0, field_index)])
+                    if isinstance(part, SAR_disk.DiskFieldIndex)]
+        if len(postings) > 0:
+            total = {key: sum(stats[key] for stats in postings) for key in ('size', 'max_size', 'hits', 'misses')}
+            lookups = total['hits'] + total['misses']
+            total['hit_rate'] = total['hits'] / lookups if lookups > 0 else 0.0
+            caches.append(("Postings cache", total))
+        for (name, stats) in caches:
+            print("%s: %d/%d entries, %d hits, %d misses (hit rate %.1f%%)" % (
+                name, stats['size'], stats['max_size'], stats['hits'], stats['misses'], 100 * stats['hit_rate']))
+        print("========================================")
+
     ###################################
     ###                             ###
     ###   PARTE 2.1: RECUPERACION   ###
@@ -369,158 +824,186 @@ class SAR_Project:
         if query is None or len(query) == 0:
             return []
 
-        query = query.lower()
-        i = 0
-        p = []
-        # Limpiamos el posible espacio blanco al principio
-        while i < len(query) and query[i].isspace():
-            i += 1
-
-        # Procesamos el primer token, que puede ser o una subconsulta entre paréntesis,
-        # o un término negado, o un término simple
-        if query[i] == '(':
-            # Si es una subconsulta, búscamos el paréntesis de cierre
-            matching_pos = self.get_matching_parenthesis(query, i)
-            # Obtenemos la posting list de la subconsulta
-            p = self.solve_query(query[i + 1: matching_pos])
-            # Avanzamos el índice hasta después de la consulta
-            i = matching_pos + 1
-        elif query[i:i + 4] == 'not ' or query[i:i + 4] == 'not(':
-            # Si es un término negado, lo delegamos a la método para calcular posting lists
-            # de negaciones
-            (p, i) = self.solve_reversed_query(query, i)
+        # La consulta se compila una sola vez (ver SAR_query): se tokeniza, se construye su arbol y se optimiza.
+        # Los planes se guardan en una cache, por lo que las consultas repetidas no se vuelven a compilar
+        if self.profiler is not None:
+            t0 = time.perf_counter()
+            plan = self.compiler.compile(query)
+            self.profiler.add('query.parse', time.perf_counter() - t0)
+            self.profiler.count('query.queries')
         else:
-            # Si es un token normal, buscamos hasta dónde llega
-            token_end = self.get_token_end(query, i)
-            # Calculamos la posting list del término
-            p = self.get_posting(query[i:token_end])
-            # Avanzamos el índice hasta después del token
-            i = token_end
-
-        # Mientras la consulta continue, la seguimos procesando de izquierda a derecha
-        while i < len(query):
-            if query[i].isspace():
-                i += 1
-                continue
-            # Obtenemos el tipo de operación, y salimos si no se corresponde con el formato
-            if query[i:i + 2] == 'or':
-                operation = self.or_posting
-                i += 2
-            elif query[i:i + 3] == 'and':
-                operation = self.and_posting
-                i += 3
-            else:
-                break
+            plan = self.compiler.compile(query)
+        result = self.evaluate_query(plan)
+        if len(self.deleted) > 0:
+            # Quitamos las noticias de los ficheros modificados o borrados después de indexarlos
+            result = self.minus_posting(result, self.deleted)
+        return result
 
-            while i < len(query) and query[i].isspace():
-                i += 1
+    def evaluate_query(self, node):
+        """
+        Devuelve la posting list de un nodo del plan de una consulta, usando la cache de resultados.
 
-            # El otro operando puede ser también o una subconsulta, o un término
-            # negado, o un término normal, y se tratarán de la misma manera
-            if query[i] == '(':
-                matching_pos = self.get_matching_parenthesis(query, i)
-                p2 = self.solve_query(query[i + 1: matching_pos])
-                i = matching_pos + 1
-            elif query[i:i + 4] == 'not ' or query[i:i + 4] == 'not(':
-                (p2, i) = self.solve_reversed_query(query, i)
-            else:
-                token_end = self.get_token_end(query, i)
-                p2 = self.get_posting(query[i:token_end])
-                i = token_end
+        Se guardan en la cache los resultados de la consulta completa y de todas sus subconsultas (operadores
+        y grupos entre paréntesis), además de los términos que son búsquedas posicionales o que se resuelven
+        con stemming. Los términos simples no se guardan aquí: el índice en disco guarda sus últimas posting lists
+        ya decodificadas (ver SAR_disk.DiskFieldIndex), también para la evaluación perezosa y el ranking, que no
+        pasan por esta cache. La clave incluye el nodo (que se obtiene del texto normalizado de la consulta), si se usa stemming y la
+        generación del índice. Los rangos de fechas también se guardan.
 
-            # Calculamos el resultado de la operación, y continuamos si es necesario
-            p = operation(p, p2)
+        param:  "node": nodo del plan
 
-        return p
+        return: posting list con el resultado
+        """
+        if node[0] == 'term' and not (self.use_stemming or '"' in node[1] or '[' in node[1]):
+            return self.evaluate_node(node)
+        key = (self.generation, self.use_stemming, node)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self.evaluate_node(node)
+            self.result_cache.put(key, result)
+        return result
 
-    def get_token_end(self, query, start):
+    def evaluate_node(self, node):
         """
-        A partir de una query y la posición en la que comienza un token que se corresponde con el operando para
-        una operación AND, OR o NOT, devuelve la posición del siguiente carácter después del token sobre el que
-        se opera. El token puede ser o bien una cadena entre comillas para búsqueda, o bien una palabra suelta,
-        que puede incluir un especificador de campo. También podría ser una subconsulta entre paréntesis. No
-        se considera la opción de que sea una consulta negada, ese caso se trata externamente
+        Calcula la posting list de un nodo del plan de una consulta (ver SAR_query).
+
+        El orden de los operandos se decide al evaluar, segun su numero de noticias: en los AND se obtienen
+        primero las posting lists de los terminos, que son baratas, y si alguna esta vacia no se evaluan el
+        resto de operandos. Despues se cruzan todas de la mas corta a la mas larga con and_postings. Los OR
+        se unen todos a la vez con or_postings, y las diferencias restan los operandos de uno en uno hasta que
+        no quedan noticias.
+
+        param:  "node": nodo del plan
 
-        param:  "query" Cadena con la query
-                "start" Posición del primer carácter del token
-        return: posición del siguiente carácter posterior al token
+        return: posting list con el resultado
         """
-        pos = start
-        while pos < len(query) and not (query[pos] == ' ' or query[pos] == ')'):
-            # Generalmente, sabremos que hemos llegado al final del token si hemos alcanzado el final del input,
-            # si nos encotramos un espacio en blanco, o un paréntesis que cierre
-            if query[pos] == '"':
-                # Si encontramos comillas, token acabará únicamente cuando nos encontremos las comillas de cierre
-                pos += 1
-                while pos < len(query) and query[pos] != '"':
-                    pos += 1
-                if pos >= len(query):
-                    print("ERROR: No se han cerrado comillas")
-                    exit()
-            pos += 1
-        return pos
+        kind = node[0]
+        profiler = self.profiler
+        if kind == 'term':
+            if profiler is None:
+                return self.get_posting(node[1])
+            t0 = time.perf_counter()
+            result = self.get_posting(node[1])
+            profiler.add('query.fetch', time.perf_counter() - t0)
+            profiler.count('query.postings_fetched', len(result))
+            return result
+        if kind == 'not':
+            p = self.evaluate_query(node[1])
+            if profiler is None:
+                return self.reverse_posting(p)
+            return self.profile_merge('query.merge.not', [p], self.reverse_posting, p)
+        if kind == 'and':
+            postings = []
+            for child in sorted(node[1], key=lambda c: c[0] != 'term'):
+                p = self.evaluate_query(child)
+                if len(p) == 0:
+                    return p
+                postings.append(p)
+            if profiler is None:
+                return self.and_postings(postings)
+            return self.profile_merge('query.merge.and', postings, self.and_postings, postings)
+        if kind == 'or':
+            postings = [self.evaluate_query(child) for child in node[1]]
+            if profiler is not None:
+                return self.profile_merge('query.merge.or', postings, self.or_postings, postings)
+            return self.or_postings(postings)
+        if kind == 'minus':
+            result = self.evaluate_query(node[1])
+            for child in node[2]:
+                if len(result) == 0:
+                    break
+                p = self.evaluate_query(child)
+                if profiler is None:
+                    result = self.minus_posting(result, p)
+                else:
+                    result = self.profile_merge('query.merge.minus', [result, p], self.minus_posting, result, p)
+            return result
+        raise ValueError("ERROR: nodo de consulta desconocido '%s'" % kind)
 
-    def get_matching_parenthesis(self, query, start):
+    def iterate_query(self, query):
         """
-        A partir de una query y la posición de un paréntisis inicial, devuelve la posición del
-        paréntesis que lo cierra. Se asume que la query está construida correctamente
+        Devuelve los resultados de una query como un iterador perezoso de newids (ver SAR_iterators), sin calcular
+        ninguna posting list intermedia. No usa la cache de resultados.
 
-        param:  "query": query de la que se quiere extraer la posición del paréntesis de cierre
-                "start": posición del paréntisis de abertura
+        param:  "query": cadena con la query
 
-        return: posición del paréntesis de cierre
+        return: iterador con los newids de los resultados, en orden
         """
-        pos = start + 1
-        inner_parenthesis = 0
-        while pos < len(query):
-            if query[pos] == ')':
-                if inner_parenthesis == 0:
-                    # Si se corresponde con el paréntesis inicial, devolvemos la posición
-                    return pos
-                else:
-                    # Si no, descontamos del número de pares de paréntesis internos
-                    inner_parenthesis -= 1
-            elif query[pos] == '(':
-                # Si nos encontramos con otro paréntesis de apertura, tendremos que asegurarnos de que
-                # estos se cierran antes de que podamos cerrar en nuestro
-                inner_parenthesis += 1
-            pos += 1
+        iterator = self.node_iterator(self.compiler.compile(query))
+        if len(self.deleted) > 0:
+            iterator = MinusIterator(iterator, [PostingIterator(self.deleted)])
+        return iterator
 
-    def solve_reversed_query(self, query, start):
+    def node_iterator(self, node):
         """
-        Resuelve las queries del tipo NOT, devolviendo la posting list y la posición donde termina la query. Tiene
-        en cuenta los casos de que el operando sea a su vez una query NOT, como que sea una subconsulta entre
-        paréntesis, como que sea un término normal
+        Construye el iterador de un nodo del plan de una consulta (ver SAR_query).
 
-        param:  "query": query de la que se quiere extrar la query NOT
-                "start": posición donde comienza la query NOT
+        param:  "node": nodo del plan
 
-        return: (end, posting_list) La posición donde acaba la query NOT, y la posting list resultante de la query
+        return: iterador de newids
         """
-        # Pasamos el NOT inicial
-        pos = start + 3
-        while pos < len(query):
-            # Limpiamos los posibles espacios
-            if query[pos].isspace():
-                pos += 1
-                continue
-            elif query[pos] == '(':
-                # Si nos encontramos un paréntesis, obtenemos la posting list de la subconsulta,
-                # y calculamos el NOT de esa
-                matching_pos = self.get_matching_parenthesis(query, pos)
-                posting_list = self.solve_query(query[pos + 1:matching_pos])
-                return (self.reverse_posting(posting_list), matching_pos + 1)
-            elif query[pos: pos + 4] == 'not ' or query[pos:pos + 4] == 'not(':
-                # Si nos econtramos otra query NOT dentro, calculamos esa recursivamente, y devolvemos su negación
-                (posting_list, pos) = self.solve_reversed_query(query, pos)
-                return (self.reverse_posting(posting_list), pos)
-            else:
-                # Si es un término normal, calculamos su posting list, y devolvemos la negación
-                token_start = pos
-                token_end = self.get_token_end(query, token_start)
-                posting_list = self.get_posting(query[token_start:token_end])
-                return (self.reverse_posting(posting_list), token_end)
-        return []
+        kind = node[0]
+        if kind == 'term':
+            return self.term_iterator(node[1])
+        if kind == 'not':
+            return NotIterator(self.node_iterator(node[1]), self.total_news)
+        if kind == 'and':
+            return AndIterator([self.node_iterator(child) for child in node[1]])
+        if kind == 'or':
+            return OrIterator([self.node_iterator(child) for child in node[1]])
+        if kind == 'minus':
+            return MinusIterator(self.node_iterator(node[1]), [self.node_iterator(child) for child in node[2]])
+        raise ValueError("ERROR: nodo de consulta desconocido '%s'" % kind)
+
+    def term_iterator(self, term):
+        """
+        Construye el iterador de un término de una consulta. Las búsquedas posicionales comprueban las posiciones
+        noticia a noticia y los comodines unen los iteradores de sus términos; el resto de términos (simples o con
+        stemming) iteran sobre su posting list de self.get_posting.
+
+        param:  "term": término con su campo, como en self.get_posting
+
+        return: iterador de newids
+        """
+        separator_pos = term.find(':')
+        field = 'article' if separator_pos == -1 else term[:separator_pos]
+        text = term[separator_pos + 1:]
+        if text.startswith('"'):
+            if self.positional:
+                tokens, distance = self.phrase_tokens(text, field)
+                return PhraseIterator([PositionCursor(self.index.get(field, {}).get(token, EMPTY_POSITIONAL))
+                                       for token in tokens], distance)
+        elif has_wildcard(text) and not is_range(text):
+            return OrIterator([self.posting_iterator(self.get_term_docs(token, field))
+                               for token in self.wildcard_terms(text, field)])
+        return self.posting_iterator(self.get_posting(term))
+
+    def posting_iterator(self, p):
+        """
+        Devuelve un iterador sobre una posting list, un bitmap o un complemento.
+        """
+        if isinstance(p, Bitmap):
+            return BitmapIterator(p)
+        if isinstance(p, Complement):
+            return NotIterator(PostingIterator(p.excluded), p.total)
+        return PostingIterator(p)
+
+    def profile_merge(self, stage, postings, function, *args):
+        """
+        Ejecuta una operacion entre posting lists midiendo su tiempo en la etapa "stage" y contando las
+        noticias de las posting lists de entrada (ver self.set_profiling).
+
+        param:  "stage": nombre de la etapa
+                "postings": posting lists de entrada
+                "function": operacion a ejecutar con los argumentos "args"
+
+        return: resultado de la operacion
+        """
+        t0 = time.perf_counter()
+        result = function(*args)
+        self.profiler.add(stage, time.perf_counter() - t0)
+        self.profiler.count('query.postings_scanned', sum(len(p) for p in postings))
+        return result
 
     def get_posting(self, term, field='article'):
         """
@@ -551,13 +1034,19 @@ class SAR_Project:
             if not self.positional:
                 print("ERROR: La indexación no se realizó con soporte para búsquedas posicionales")
                 exit()
-            if field in SAR_Project.normalized_fields:
-                terms = self.tokenize(term[separator_pos + 2:-1])
-            else:
-                terms = term[separator_pos + 2:-1].split()
-            return self.get_positionals(terms, field)
+            terms, distance = self.phrase_tokens(term[separator_pos + 1:], field)
+            return self.get_positionals(terms, field, distance)
         else:
             # Si no es una búsquesa posicional
+            if is_range(term[separator_pos + 1:]):
+                # Los rangos se resuelven con el índice de fechas
+                if field != 'date':
+                    print("ERROR: Solo se pueden buscar rangos en el campo date")
+                    exit()
+                return self.get_date_range(term[separator_pos + 1:])
+            if has_wildcard(term[separator_pos + 1:]):
+                # Si tiene comodines, delegamos en el índice permuterm
+                return self.get_permuterm(term[separator_pos + 1:], field)
             if self.use_stemming and field in SAR_Project.normalized_fields:
                 # Si utilizamos stemming, delegamos
                 return self.get_stemming(term[separator_pos + 1:], field)
@@ -567,87 +1056,74 @@ class SAR_Project:
                 token = self.tokenize(term[separator_pos + 1:])[0]
             else:
                 token = term[separator_pos + 1:]
-            if self.positional:
-                # Si es el índice es posicional, tendremos que extraer de cada entrada de la posting list únicamente el id de noticia,
-                # e ignorar las listas de posiciones que acompañan en una tupla al id.
-                # Ej: posting_list: [(new1, [2,4]), (new7, [0]), (new10,[1,2]), ...]
-                return [x[0] for x in self.index.get(field, {}).get(token, (0, []))[1]]
-            else:
-                # Si el índice no es posicional, bastará con obtener la posting list, que solo consistirá en una lista de id de noticias.
-                # Ej: posting_list: [new1, new7, new10...]
-                return self.index.get(field, {}).get(token, (0, []))[1]
+            return self.get_term_docs(token, field)
 
-    def get_positionals(self, terms, field='article'):
+    def phrase_tokens(self, text, field='article'):
         """
-        NECESARIO PARA LA AMPLIACION DE POSICIONALES
+        Devuelve los tokens de una búsqueda posicional ("a b c" o "a b"~k) tal y como están en el índice del campo.
 
-        Devuelve la posting list asociada a una secuencia de terminos consecutivos.
+        return: tupla (lista de tokens, distancia o None si los tokens tienen que ser consecutivos)
+        """
+        phrase, distance = parse_phrase(text)
+        if field in SAR_Project.normalized_fields:
+            return self.tokenize(phrase), distance
+        return phrase.split(), distance
 
-        param:  "terms": lista con los terminos consecutivos para recuperar la posting list.
-                "field": campo sobre el que se debe recuperar la posting list, solo necesario se se hace la ampliacion de multiples indices
+    def get_date_range(self, text):
+        """
+        Devuelve la posting list de un rango de fechas, "[2015-01-01 TO 2015-03-31]", con el índice de fechas
+        (ver SAR_dates): el rango se busca en las fechas ordenadas y solo se recorren las particiones de noticias
+        que pueden tener fechas del rango.
 
-        return: posting list
+        param:  "text": rango entre corchetes, sin el campo
 
+        return: posting list
         """
-        # Aquí utilizamos una modificación de una operación AND, solo que en lugar de hacerla con solo 2 elementos, se
-        # hace con una cantidad arbitraria, y además de comprobar si están en el mismo documento, se comprueba si su
-        # posición es secuencial
-        result = []
-        posting_lists = [self.index.get(field, {}).get(term, (0, []))[1] for term in terms]
-        positions = [0] * len(posting_lists)
-        n_terms = len(posting_lists)
-        if n_terms == 0:
-            return []
-        while all([positions[i] < len(posting_lists[i]) for i in range(n_terms)]):
-            # Mientras no hayamos llegado al final de la posting list de ninguno de los elementos
-            same_doc = True
-            doc = posting_lists[0][positions[0]]
-            # Comprobamos si estamos en todas las posting list apuntando al mismo documento
-            for j in range(1, n_terms):
-                if posting_lists[j][positions[j]][0] != doc[0]:
-                    same_doc = False
-                    break
-            if same_doc:
-                # Si aparecen todos los términos en el mismo documento, comprobamos si aparecen secuencialmente
-                if self.check_sequential_in_document([posting_lists[j][positions[j]][1] for j in range(n_terms)]):
-                    # Si aparecen secuencialmente, añadimos la noticia a la posting list de resultado
-                    result.append(doc[0])
-                # Avanzamos todas las posting list de los términos a la siguiente posición
-                for j in range(n_terms):
-                    positions[j] += 1
-            else:
-                # Si no es la misma noticia, búscamos el término con la noticia más baja, y la avanzamos a la siguiente
-                min_pos = min([(j, posting_lists[j][positions[j]]) for j in range(n_terms)], key=lambda x: x[1])[0]
-                positions[min_pos] += 1
-        return result
+        low, high = parse_range(text)
+        if self.dindex is None:
+            # El campo date solo se indexa con multifield
+            return array('I')
+        return self.dindex.get_range(low, high)
 
-    def check_sequential_in_document(self, term_positions):
+    def get_term_docs(self, token, field='article'):
         """
-        Dada una lista de n listas correspondientes con las posiciones de n términos en una noticia, devuelve true
-        si los términos aparecen en la noticia consecutivamente, en el orden en el que se han pasado las listas
+        Devuelve la posting list (solo los newid) de un token ya normalizado.
 
-        param:  "term_positions": lista de n listas con las posiciones de los n términos en la noticia
+        param:  "token": token tal y como esta en el indice
+                "field": campo del token
 
-        return: true si los términos aparecen consecutivamente en el orden de las listas
+        return: posting list
+        """
+        # Si el término es muy frecuente tenemos su posting list como bitmap
+        bitmap = self.bindex.get(field, {}).get(token)
+        if bitmap is not None:
+            return bitmap
+        # Tanto si el índice es posicional como si no, los id de noticia están en el array "docs" de la posting list,
+        # separados de las posiciones, así que no hace falta extraerlos
+        posting_list = self.index.get(field, {}).get(token)
+        if posting_list is None:
+            return array('I')
+        return posting_list.docs
+
+    def get_positionals(self, terms, field='article', distance=None):
         """
-        n_terms = len(term_positions)
-        positions = [0] * n_terms
-        while positions[0] < len(term_positions[0]):
-            start_pos = term_positions[0][positions[0]]
-            for i in range(1, n_terms):
-                # Para cada término, mientras su posición no sea posterior a la del término posterior, lo avanzamos
-                while positions[i] < len(term_positions[i]) and term_positions[i][positions[i]] < start_pos + i:
-                    positions[i] += 1
-                if positions[i] >= len(term_positions[i]):
-                    # Si alguna lista se sale, no puede estar la secuencia
-                    return False
+        NECESARIO PARA LA AMPLIACION DE POSICIONALES
+
+        Devuelve la posting list asociada a una secuencia de terminos consecutivos.
+
+        param:  "terms": lista con los terminos consecutivos para recuperar la posting list.
+                "field": campo sobre el que se debe recuperar la posting list, solo necesario se se hace la ampliacion de multiples indices
+                "distance": si se indica, en lugar de consecutivos los terminos tienen que aparecer en cualquier orden
+                            con como mucho "distance" palabras entre ellos (consultas "a b"~k y NEAR/k)
 
-            # Si las posiciones de cada término son secuenciales, devolvemos true
-            if all([term_positions[i][positions[i]] == start_pos + i for i in range(n_terms)]):
-                return True
-            # Si no, incrementamos la posición del primer término, y lo seguimos intentando, hasta llegar al final o encontrarlo
-            positions[0] += 1
-        return False
+        return: posting list
+
+        """
+        # Es una modificación de una operación AND con una cantidad arbitraria de términos en la que, además de
+        # comprobar si están en el mismo documento, se comprueba si su posición es secuencial (o si están lo bastante
+        # cerca). La hace SAR_iterators.PhraseIterator, que también se usa en la evaluación perezosa
+        cursors = [PositionCursor(self.index.get(field, {}).get(term, EMPTY_POSITIONAL)) for term in terms]
+        return collect(PhraseIterator(cursors, distance))
 
     def get_stemming(self, term, field='article'):
         """
@@ -662,9 +1138,9 @@ class SAR_Project:
 
         """
 
-        stem = self.stemmer.stem(term)
+        stem = self.stem(term)
         #tomamos el stem del termino y devolvemos su posting list del indice de stems (lista de newId's)
-        return self.sindex[field].get(stem, (0,[]))[1]
+        return self.sindex[field].get(stem, (0, array('I')))[1]
 
     def get_permuterm(self, term, field='article'):
         """
@@ -678,10 +1154,68 @@ class SAR_Project:
         return: posting list
 
         """
+        return self.merge_postings([self.get_term_docs(token, field) for token in self.wildcard_terms(term, field)])
 
-        ##################################################
-        ## COMPLETAR PARA FUNCIONALIDAD EXTRA PERMUTERM ##
-        ##################################################
+    def wildcard_terms(self, term, field='article'):
+        """
+        Devuelve los terminos de un campo que encajan con un termino con comodines.
+
+        param:  "term": termino con comodines (* o ?)
+                "field": campo de los terminos
+
+        return: lista ordenada de terminos
+        """
+        if is_prefix_pattern(term):
+            # "prefijo*": basta con recorrer en orden los términos que empiezan por el prefijo,
+            # no hace falta el índice permuterm
+            return list(self.iter_prefix_terms(term[:-1], field))
+        if field not in self.ptindex:
+            if not self.permuterm:
+                print("ERROR: La indexación no se realizó con soporte para consultas con comodines")
+                exit()
+            # El campo no tiene términos
+            return []
+        # Buscamos en el índice permuterm los términos que encajan con el patrón (búsqueda binaria del prefijo
+        # de sus rotaciones y recorrido del rango)
+        return match_terms(self.ptindex[field], term)
+
+    def iter_prefix_terms(self, prefix, field='article'):
+        """
+        Recorre en orden los términos de un campo que empiezan por "prefix".
+
+        Con el índice cargado de disco se usa el diccionario de términos ordenado, que solo lee los bloques
+        del rango del prefijo. Con el índice en memoria hay que recorrer todas las claves.
+
+        param:  "prefix": prefijo de los términos
+                "field": campo de los términos
+
+        return: iterador sobre los términos
+        """
+        field_index = self.index.get(field, {})
+        if hasattr(field_index, 'iter_prefix'):
+            return field_index.iter_prefix(prefix)
+        return iter(sorted(token for token in field_index if token.startswith(prefix)))
+
+    def merge_postings(self, postings):
+        """
+        Calcula el OR de varias posting lists a la vez.
+
+        Los bitmaps se unen con un OR bit a bit, y el resto de posting lists con una mezcla de k vías con
+        un heap, en una sola pasada en lugar de ir uniéndolas de dos en dos.
+
+        param:  "postings": lista de posting lists
+
+        return: posting list con los newid incluidos en alguna de las posting lists
+        """
+        bitmaps = [p for p in postings if isinstance(p, Bitmap)]
+        sorted_lists = [p for p in postings if not isinstance(p, Bitmap) and len(p) > 0]
+        result = merge_sorted(sorted_lists)
+        if len(bitmaps) > 0:
+            bits = 0
+            for bitmap in bitmaps:
+                bits |= bitmap.bits
+            result = self.or_posting(Bitmap(bits, self.total_news), result)
+        return result
 
     def reverse_posting(self, p):
         """
@@ -698,20 +1232,15 @@ class SAR_Project:
 
         """
 
-        i = 0
-        result = []
-        for docid in p:
-            # Añadimos al resultado todos los docuemntos que hay entre cada uno de los que nos han pasado,
-            # sin incluir esos
-            result += range(i, docid)
-            i = docid + 1
-        # Añadimos todos los que pueda haber desde el último que se debe excluir hasta el final
-        result += range(i, self.total_news)
-        return result
-
-        ########################################
-        ## COMPLETAR PARA TODAS LAS VERSIONES ##
-        ########################################
+        # No construimos la lista con todas las demás noticias, que puede ser casi todo el corpus: devolvemos
+        # un complemento (ver SAR_postings.Complement) que and_posting, or_posting y minus_posting saben combinar
+        # sin materializarlo. La negación de un complemento es directamente la posting list que excluía
+        if isinstance(p, Complement):
+            return p.excluded
+        if isinstance(p, Bitmap):
+            # El complemento de un bitmap es un NOT bit a bit
+            return p.complement()
+        return Complement(p, self.total_news)
 
     def and_posting(self, p1, p2):
         """
@@ -725,7 +1254,39 @@ class SAR_Project:
         return: posting list con los newid incluidos en p1 y p2
 
         """
-        result = []
+        if isinstance(p1, Complement) or isinstance(p2, Complement):
+            if isinstance(p1, Complement) and isinstance(p2, Complement):
+                # not A and not B = not (A or B)
+                return Complement(self.or_posting(p1.excluded, p2.excluded), self.total_news)
+            if isinstance(p1, Complement):
+                p1, p2 = p2, p1
+            # A and not B = A - B
+            return self.minus_posting(p1, p2.excluded)
+        if isinstance(p1, Bitmap) or isinstance(p2, Bitmap):
+            if isinstance(p1, Bitmap) and isinstance(p2, Bitmap):
+                return Bitmap(p1.bits & p2.bits, self.total_news)
+            if isinstance(p1, Bitmap):
+                p1, p2 = p2, p1
+            # Nos quedamos con las noticias de la posting list que están en el bitmap
+            return p2.filter(p1)
+
+        result = array('I')
+        if len(p1) > len(p2):
+            # El AND es conmutativo, dejamos en p1 la lista más corta
+            p1, p2 = p2, p1
+        if len(p1) * GALLOP_RATIO < len(p2):
+            # Si una lista es mucho más corta que la otra, en lugar de recorrer la larga entera buscamos
+            # en ella cada noticia de la corta con búsqueda exponencial (galloping) desde la última posición
+            j = 0
+            for newid in p1:
+                j = gallop(p2, newid, j)
+                if j == len(p2):
+                    break
+                if p2[j] == newid:
+                    result.append(newid)
+                    j += 1
+            return result
+
         i = 0
         j = 0
         # Vamos avanzando sobre la lista mientras aún queden en las dos
@@ -744,6 +1305,50 @@ class SAR_Project:
 
         return result
 
+    def and_postings(self, postings):
+        """
+        Calcula el AND de una lista de posting lists.
+
+        Las posting lists se cruzan de la más corta a la más larga, de forma que los resultados intermedios
+        nunca son más largos que la posting list más corta, y con and_posting el coste de cada cruce depende
+        sobre todo de esa longitud gracias a la búsqueda exponencial.
+
+        param:  "postings": lista de posting lists
+
+        return: posting list con los newid incluidos en todas las posting lists
+        """
+        if len(postings) == 1:
+            return postings[0]
+        postings = sorted(postings, key=len)
+        result = postings[0]
+        for p in postings[1:]:
+            if len(result) == 0:
+                break
+            result = self.and_posting(result, p)
+        return result
+
+    def or_postings(self, postings):
+        """
+        Calcula el OR de una lista de posting lists en una sola pasada.
+
+        Las posting lists y los bitmaps se unen a la vez con merge_postings. Los complementos no se materializan:
+        not A or not B = not (A and B), y si además hay otros operandos R, not A or not B or R = not ((A and B) - R).
+
+        param:  "postings": lista de posting lists
+
+        return: posting list con los newid incluidos en alguna de las posting lists
+        """
+        if len(postings) == 1:
+            return postings[0]
+        complements = [p.excluded for p in postings if isinstance(p, Complement)]
+        others = [p for p in postings if not isinstance(p, Complement)]
+        if len(complements) == 0:
+            return self.merge_postings(others)
+        excluded = self.and_postings(complements)
+        if len(others) > 0 and len(excluded) > 0:
+            excluded = self.minus_posting(excluded, self.merge_postings(others))
+        return Complement(excluded, self.total_news)
+
     def or_posting(self, p1, p2):
         """
         NECESARIO PARA TODAS LAS VERSIONES
@@ -756,7 +1361,22 @@ class SAR_Project:
         return: posting list con los newid incluidos de p1 o p2
 
         """
-        result = []
+        if isinstance(p1, Complement) or isinstance(p2, Complement):
+            if isinstance(p1, Complement) and isinstance(p2, Complement):
+                # not A or not B = not (A and B)
+                return Complement(self.and_posting(p1.excluded, p2.excluded), self.total_news)
+            if isinstance(p1, Complement):
+                p1, p2 = p2, p1
+            # A or not B = not (B - A)
+            return Complement(self.minus_posting(p2.excluded, p1), self.total_news)
+        if isinstance(p1, Bitmap) or isinstance(p2, Bitmap):
+            if isinstance(p1, Bitmap):
+                p1, p2 = p2, p1
+            if not isinstance(p1, Bitmap):
+                p1 = Bitmap.from_postings(p1, self.total_news)
+            return Bitmap(p1.bits | p2.bits, self.total_news)
+
+        result = array('I')
         i = 0
         j = 0
         while i < len(p1) and j < len(p2):
@@ -797,11 +1417,48 @@ class SAR_Project:
         return: posting list con los newid incluidos de p1 y no en p2
 
         """
+        if isinstance(p2, Complement):
+            # A - not B = A and B, y not A - not B = B - A
+            if isinstance(p1, Complement):
+                return self.minus_posting(p2.excluded, p1.excluded)
+            return self.and_posting(p1, p2.excluded)
+        if isinstance(p1, Complement):
+            # not A - B = not (A or B)
+            return Complement(self.or_posting(p1.excluded, p2), self.total_news)
+        if isinstance(p2, Bitmap):
+            if isinstance(p1, Bitmap):
+                return Bitmap(p1.bits & ~p2.bits, self.total_news)
+            # Nos quedamos con las noticias de p1 que no están en el bitmap
+            return p2.filter(p1, keep=False)
+        if isinstance(p1, Bitmap):
+            return Bitmap(p1.bits & ~Bitmap.from_postings(p2, self.total_news).bits, self.total_news)
+
+        result = array('I')
+        if len(p1) * GALLOP_RATIO < len(p2):
+            # Si p2 es mucho más larga, buscamos en ella cada noticia de p1 con galloping en lugar de recorrerla
+            j = 0
+            for newid in p1:
+                j = gallop(p2, newid, j)
+                if j == len(p2) or p2[j] != newid:
+                    result.append(newid)
+            return result
 
-        pass
-        ########################################################
-        ## COMPLETAR PARA TODAS LAS VERSIONES SI ES NECESARIO ##
-        ########################################################
+        i = 0
+        j = 0
+        while i < len(p1) and j < len(p2):
+            if p1[i] == p2[j]:
+                # Si está en las dos, no la incluimos
+                i += 1
+                j += 1
+            elif p1[i] < p2[j]:
+                # Si solo está en p1, la incluimos
+                result.append(p1[i])
+                i += 1
+            else:
+                j += 1
+        # Todas las que quedan en p1 no están en p2
+        result.extend(p1[i:])
+        return result
 
     #####################################
     ###                               ###
@@ -825,6 +1482,32 @@ class SAR_Project:
         print("%s\t%d" % (query, len(result)))
         return len(result)  # para verificar los resultados (op: -T)
 
+    def solve_queries_parallel(self, queries, count, jobs):
+        """
+        Resuelve una lista de consultas repartiéndolas entre "jobs" procesos.
+
+        Los procesos se crean con fork después de cargar el índice, así que lo comparten con este proceso
+        (copia en escritura, y los ficheros mapeados con mmap se comparten directamente) sin volver a leerlo.
+        Cada proceso captura lo que imprime cada consulta y los resultados se devuelven en el orden original.
+
+        param:  "queries": lista de consultas
+                "count": si es True se usa self.solve_and_count, si no self.solve_and_show
+                "jobs": numero de procesos
+
+        return: generador de tuplas (salida impresa por la consulta, valor devuelto, True si la consulta
+                terminó el programa con exit())
+        """
+        global _shared_project
+        _shared_project = self
+        chunk_size = max(1, len(queries) // (jobs * 16))
+        with multiprocessing.get_context('fork').Pool(jobs) as pool:
+            for (output, value, exited, profiler) in pool.imap(_solve_query_worker, [(query, count) for query in queries],
+                                                               chunk_size):
+                if profiler is not None:
+                    # Sumamos las medidas de cada consulta hechas en los procesos
+                    self.profiler.merge(profiler)
+                yield (output, value, exited)
+
     def solve_and_show(self, query):
         """
         NECESARIO PARA TODAS LAS VERSIONES
@@ -840,137 +1523,256 @@ class SAR_Project:
         return: el numero de noticias recuperadas, para la opcion -T
 
         """
-        result = self.solve_query(query)
-        if self.use_ranking:
-            result = self.rank_result(result, query)
-
-        multifield_tokenizer = re.compile(r"(?:\w+:)?(?:\w+|(?:\".*?\"))")
-        #tokeniza separando por palabras, comillas o paralbras+comillas
-        #ejemplo "fin de semana" AND title:"el país" -> ['"fin de semana"','AND','title:"el país"']
+        lazy = self.use_lazy and not self.show_all and not self.use_ranking
+        if lazy:
+            # Solo necesitamos los self.SHOW_MAX primeros resultados, y uno más para saber si hay más
+            if self.profiler is not None:
+                t0 = time.perf_counter()
+            result = collect(self.iterate_query(query), SAR_Project.SHOW_MAX + 1)
+            if self.profiler is not None:
+                self.profiler.add('query.iterate', time.perf_counter() - t0)
+            n_results = len(result)
+        else:
+            result = self.solve_query(query)
+            # Para mostrar las noticias sí necesitamos la lista completa
+            result = to_array(result)
+            n_results = len(result)
+            if self.use_ranking:
+                result = self.rank_result(result, query)
+        shown = result if self.show_all else result[:SAR_Project.SHOW_MAX]
+        news = [self.get_news_item(newid) for newid in shown]
+        if self.show_snippet:
+            snippets = self.get_snippets(query, shown, news)
 
         print('=' * 40)
         print('Query: \'' + query + '\'')
-        print('Number of results: %d' % len(result))
-        for i in range(len(result)):
-            newid = result[i - 1]
-            (docId, pos) = self.news[newid]
-            filepath = self.docs[docId]
-            with open(filepath) as f:
-                jlist = json.load(f)
-                new = jlist[pos]
+        if lazy and n_results > len(shown):
+            print('Number of results: more than %d' % len(shown))
+        else:
+            print('Number of results: %d' % n_results)
+        for i in range(len(shown)):
+            newid = shown[i]
+            new = news[i]
 
             print('#%d' % (i + 1))
-            print('Score: 0')
+            print('Score: %s' % (round(self.scores[newid], 4) if self.use_ranking else 0))
             print(str(newid))
             print("Date: " + new['date'])
             print('Title: ' + new['title'])
             print('Keywords: ' + new['keywords'])
 
             if (self.show_snippet):
-                tokenized_query = multifield_tokenizer.findall(query.lower())
-                normalized_new = {}
-                ocurrences = {}
-                for (key, value) in SAR_Project.fields:
-                    #creamos diccionario noticia[campo]:[tokens]
-                    if value:
-                        normalized_new[key] = self.tokenize(new[key])
-                    else:
-                        normalized_new[key] = [new[key]]
-                    ocurrences[key] = []
-                j = 0
-                while (j < len(tokenized_query)):
-                    token = tokenized_query[j]
-                    if (token == 'and' or token == 'or' or token == 'not'):
-                        j += 1
-                        continue
-                    separator_pos = token.find(':')
-                    #determinamos multicfield buscando ":"
-                    if separator_pos == -1:
-                        #si no esta ":"  no es multifield
-                        field = 'article'
-                    else:
-                        #si esta ":" determinamos el campo y separamos el token x:y -> campo x , token y
-                        field = token[:separator_pos]
-                        token = token[separator_pos + 1:]
-                    if token[0] == '"':
-                        #si token empieza por " (posicional)
-                        if field in SAR_Project.normalized_fields:
-                            #si el campo no es fecha dividimos en tokens
-                            terms = self.tokenize(token[1:-1])
-                        else:
-                            terms = token.trim('"').split()
-                        for k in range(len(normalized_new[field]) - len(terms) + 1):
-                            found = True
-                            for h in range(len(terms)):
-                                #buscamos los tokens de la consulta posicional dentro del campo determinado
-                                if normalized_new[field][k + h] != terms[h]:
-                                    found = False
-                                    break
-                            left_pos = -1
-                            if found:
-                                #si se encuentra determinamos posicion del snippet
-                                left_pos = max(0, k - 6)
-                                right_pos = min(len(normalized_new[field]) - 1, k + len(terms) + 5)
-                                break
-                        if left_pos < 0:
-                            #si no encontramos la consulta continuamos sin generar snippet (consulta tipo OR o NOT)
-                            j += 1
-                            continue
-                    else:
-                        #si no es posicional
-                        if token not in normalized_new[field]:
-                            if self.use_stemming:
-                                #comprobamos si el token no aparece por que tiene el mismo stem pero es distinto token
-                                stem = self.stemmer.stem(token)
-                                token = next((token for token in normalized_new[field] if token in self.sindex[field][stem][0]), None)
-                                if token is None:
-                                    #si tampoco esta el stem continuamos
-                                    j += 1
-                                    continue
-                            else:
-                                # si no encontramos la consulta y no es stemming continuamos sin generar snippet (consulta tipo OR o NOT)
-                                j += 1
-                                continue
-                        pos = normalized_new[field].index(token)
-                        left_pos = max(0, pos - 6)
-                        right_pos = min(len(normalized_new[field]) - 1, pos + 6)
-
-                    ocurrences[field].append((left_pos, right_pos))
-                    j += 1
+                print(snippets[i])
 
-                for (field, _) in SAR_Project.fields:
-                    field_ocurrences = ocurrences[field]
-                    field_ocurrences.sort(key=lambda x: x[0])
-
-                    j = 0
-                    while (j < len(field_ocurrences) - 1):
-                        if field_ocurrences[j][1] >= field_ocurrences[j + 1][0]:
-                            field_ocurrences = field_ocurrences[:j] + [
-                                (field_ocurrences[j][0], field_ocurrences[j + 1][1])] + field_ocurrences[j + 2:]
-                        else:
-                            j += 1
-
-                print("...", end="")
-                for (field, _) in SAR_Project.fields:
-                    for snippet in ocurrences[field]:
-                        for j in range(snippet[0], snippet[1] + 1):
-                            print(normalized_new[field][j], end=" ")
-                        print("... ", end="")
-                print()
-
-            if (i < len(result) - 1):
+            if (i < len(shown) - 1):
                 print('-' * 20)
-            if not self.show_all and i == 9:
-                #si no se utiliza -A y se han mostrado 9 paramos de mostrar
-                break
         print('=' * 40)
 
+    def search(self, query):
+        """
+        Resuelve una query y devuelve sus resultados como datos, con las mismas opciones que self.solve_and_show
+        (ranking, snippets, mostrar todos o solo los self.SHOW_MAX primeros). Lo usa el servidor (ver SAR_Server).
+
+        param:  "query": query que se debe resolver.
+
+        return: diccionario con la query, el número de resultados y la lista de noticias mostradas, cada una
+                con su newid, puntuación, fecha, título, palabras clave y snippet si se ha pedido
+        """
+        result = to_array(self.solve_query(query))
+        n_results = len(result)
+        if self.use_ranking:
+            result = self.rank_result(result, query)
+        if not self.show_all:
+            result = result[:SAR_Project.SHOW_MAX]
+        news = [self.get_news_item(newid) for newid in result]
+        if self.show_snippet:
+            snippets = self.get_snippets(query, result, news)
+        items = []
+        for i in range(len(result)):
+            newid = result[i]
+            new = news[i]
+            item = {'newid': newid, 'score': self.scores[newid] if self.use_ranking else 0,
+                    'date': new['date'], 'title': new['title'], 'keywords': new['keywords']}
+            if self.show_snippet:
+                item['snippet'] = snippets[i]
+            items.append(item)
+        return {'query': query, 'count': n_results, 'results': items}
+
+    def get_snippets(self, query, newids, news):
+        """
+        Genera los snippets de las noticias mostradas de una query: los fragmentos de sus campos alrededor de los
+        términos de la query.
+
+        No se vuelve a tokenizar la noticia: con las posiciones de los caracteres de sus tokens guardadas al
+        indexar (ver SAR_docstore) se localizan los términos con str.find y una búsqueda binaria, y los fragmentos
+        se recortan directamente del texto original.
+
+        param:  "query": query resuelta
+                "newids": newids de las noticias
+                "news": diccionarios con los campos de las noticias, en el mismo orden
+
+        return: lista con el snippet de cada noticia
+        """
+        if self.profiler is not None:
+            t0 = time.perf_counter()
+        terms = self.snippet_terms(self.compiler.compile(query))
+        snippets = [self.make_snippet(newids[i], news[i], terms) for i in range(len(newids))]
+        if self.profiler is not None:
+            self.profiler.add('query.snippet', time.perf_counter() - t0)
+        return snippets
+
+    def snippet_terms(self, node):
+        """
+        Devuelve los términos de una query que se buscan en las noticias para los snippets: los que no están negados.
+
+        param:  "node": plan de la query (ver SAR_query)
+
+        return: lista de tuplas (campo, tipo, tokens). Si el tipo es 'phrase' los tokens tienen que aparecer
+                seguidos, y si es 'term' basta con cualquiera de ellos (varios si se usa stemming o comodines).
+        """
+        terms = []
+        for field, text in self.query_leaves(node):
+            if text.startswith('"'):
+                tokens, distance = self.phrase_tokens(text, field)
+                if distance is None:
+                    terms.append((field, 'phrase', tokens))
+                else:
+                    # En las búsquedas por proximidad se busca cada término por separado
+                    terms.extend((field, 'term', [token]) for token in tokens)
+            else:
+                terms.append((field, 'term', self.term_tokens(text, field)))
+        return terms
+
+    def make_snippet(self, newid, new, terms):
+        """
+        Genera el snippet de una noticia (ver self.get_snippets).
+
+        param:  "newid": newid de la noticia
+                "new": diccionario con los campos de la noticia
+                "terms": términos de la query, devueltos por self.snippet_terms
+
+        return: cadena con el snippet
+        """
+        offsets = self.get_news_offsets(newid, new)
+        lowered = {}
+        windows = {}
+        for field, kind, tokens in terms:
+            if field in SAR_Project.normalized_fields:
+                if field not in lowered:
+                    lowered[field] = new[field].lower()
+                starts = offsets.get(field, [0])
+                positions = [self.token_positions(lowered[field], token, starts) for token in tokens]
+            else:
+                starts = [0]
+                positions = [[0] if new.get(field) == token else [] for token in tokens]
+            if kind == 'phrase':
+                # Primera posición del primer token seguida del resto de tokens de la frase
+                following = [set(p) for p in positions[1:]]
+                first = next((pos for pos in positions[0]
+                              if all(pos + i + 1 in following[i] for i in range(len(following)))), None)
+                last = None if first is None else first + len(tokens) - 1
+            else:
+                first = min((p[0] for p in positions if len(p) > 0), default=None)
+                last = first
+            if first is not None:
+                # Si no se encuentra el término (está en una rama OR que no cumple la noticia) no se genera fragmento
+                windows.setdefault(field, []).append((max(0, first - SAR_Project.SNIPPET_CONTEXT),
+                                                      min(len(starts) - 1, last + SAR_Project.SNIPPET_CONTEXT)))
+
+        snippet = "..."
+        for (field, _) in SAR_Project.fields:
+            if field not in windows:
+                continue
+            text = new[field]
+            if len(text.lower()) != len(text):
+                # Los offsets son del texto en minúsculas, que en algunos casos raros cambia de longitud
+                text = text.lower()
+            starts = offsets.get(field, [0])
+            # Unimos los fragmentos que se solapan
+            merged = []
+            for (left_pos, right_pos) in sorted(windows[field]):
+                if len(merged) > 0 and merged[-1][1] >= left_pos:
+                    merged[-1][1] = max(merged[-1][1], right_pos)
+                else:
+                    merged.append([left_pos, right_pos])
+            for (left_pos, right_pos) in merged:
+                if field in SAR_Project.normalized_fields:
+                    end = self.word.match(text, starts[right_pos]).end()
+                else:
+                    end = len(text)
+                snippet += " ".join(text[starts[left_pos]:end].split()) + " ... "
+        return snippet
+
+    def token_positions(self, text, token, starts):
+        """
+        Devuelve las posiciones de un token en el texto de un campo de una noticia.
+
+        Las apariciones del token se buscan con str.find y solo se aceptan las que empiezan donde empieza un token
+        del campo (búsqueda binaria en "starts") y acaban donde acaba ese token.
+
+        param:  "text": texto del campo en minúsculas
+                "token": token tal y como está en el índice
+                "starts": posiciones de los caracteres en los que empiezan los tokens del campo
+
+        return: lista ordenada de posiciones (número de token dentro del campo)
+        """
+        positions = []
+        pos = text.find(token)
+        while pos != -1:
+            i = bisect_left(starts, pos)
+            if i < len(starts) and starts[i] == pos and self.word.match(text, pos).end() == pos + len(token):
+                positions.append(i)
+            pos = text.find(token, pos + 1)
+        return positions
+
+    def get_news_offsets(self, newid, new):
+        """
+        Devuelve las posiciones de los caracteres en los que empiezan los tokens de cada campo de una noticia.
+
+        Se leen del almacen de noticias, y si el índice no se ha cargado de disco se tokeniza la noticia.
+
+        return: diccionario campo -> posiciones
+        """
+        if self.docstore is not None:
+            return self.docstore.get_offsets(newid)
+        return {field: self.tokenize_offsets(new[field])[1] for field in SAR_Project.normalized_fields}
+
+    def get_news_item(self, newid):
+        """
+        Devuelve el diccionario con los campos de una noticia.
+
+        Si el indice se ha cargado con self.load_index se lee del almacen de noticias, que solo tiene que
+        descomprimir el bloque de la noticia. Si no, se vuelve a leer el fichero original de la noticia.
+
+        param:  "newid": newid de la noticia
+
+        return: diccionario con los campos de la noticia
+        """
+        if self.profiler is not None:
+            t0 = time.perf_counter()
+        if self.docstore is not None:
+            new = self.docstore.get(newid)
+        else:
+            (docId, pos) = self.news[newid]
+            filepath = self.docs[docId]
+            with open(filepath) as f:
+                jlist = json.load(f)
+                new = jlist[pos]
+        if self.profiler is not None:
+            self.profiler.add('query.load_doc', time.perf_counter() - t0)
+            self.profiler.count('query.docs_loaded')
+        return new
+
     def rank_result(self, result, query):
         """
         NECESARIO PARA LA AMPLIACION DE RANKING
 
         Ordena los resultados de una query.
 
+        Las noticias se puntúan con BM25 (ver SAR_ranking) sumando la puntuación de cada término de la query en
+        su campo. Si no se muestran todos los resultados solo se devuelven las self.SHOW_MAX mejores, que se
+        seleccionan con un heap y MaxScore sin puntuar todas las noticias. Las puntuaciones quedan en self.scores.
+
         param:  "result": lista de resultados sin ordenar
                 "query": query, puede ser la query original, la query procesada o una lista de terminos
 
@@ -978,9 +1780,244 @@ class SAR_Project:
         return: la lista de resultados ordenada
 
         """
+        if self.profiler is not None:
+            t0 = time.perf_counter()
+        scorers = []
+        # Las noticias borradas de un índice por segmentos siguen en las posting lists, pero no cuentan en las
+        # estadísticas de BM25: las puntuaciones son las mismas que las de un índice creado de nuevo
+        live_news = self.total_news - len(self.deleted)
+        for field, tokens in self.query_terms(self.compiler.compile(query)):
+            postings = []
+            for token in tokens:
+                posting_list = self.index[field].get(token)
+                if posting_list is not None:
+                    postings.append((posting_list.docs, posting_list.get_freqs()))
+            if len(postings) > 0:
+                docs, freqs = merge_freqs(postings)
+                n_docs = len(docs)
+                if len(self.deleted) > 0:
+                    n_docs -= len(self.and_posting(docs, self.deleted))
+                scorers.append(TermScorer(docs, freqs, self.lengths[field], self.avg_length(field), live_news, n_docs))
+        k = len(result) if self.show_all else SAR_Project.SHOW_MAX
+        ranking = top_k(result, scorers, k)
+        self.scores = {newid: score for (score, newid) in ranking}
+        if self.profiler is not None:
+            self.profiler.add('query.rank', time.perf_counter() - t0)
+        return [newid for (_, newid) in ranking]
+
+    def query_terms(self, node):
+        """
+        Devuelve los términos que puntúan en el ranking de una query: los que no están negados.
+
+        param:  "node": plan de la query (ver SAR_query)
+
+        return: lista de tuplas (campo, [tokens del índice]). Un término de la query puede corresponder a varios
+                tokens del índice si se usa stemming o tiene comodines, y una búsqueda posicional da una tupla
+                por cada token.
+        """
+        terms = []
+        for field, text in self.query_leaves(node):
+            if text.startswith('"'):
+                terms.extend((field, [token]) for token in self.phrase_tokens(text, field)[0])
+            else:
+                terms.append((field, self.term_tokens(text, field)))
+        return terms
+
+    def query_leaves(self, node):
+        """
+        Devuelve los términos de una query que no están negados.
 
-        pass
+        param:  "node": plan de la query (ver SAR_query)
 
-        ###################################################
-        ## COMPLETAR PARA FUNCIONALIDAD EXTRA DE RANKING ##
-        ###################################################
\ No newline at end of file
+        return: lista de tuplas (campo, texto del término sin el campo)
+        """
+        kind = node[0]
+        if kind == 'not':
+            return []
+        if kind == 'minus':
+            return self.query_leaves(node[1])
+        if kind in ('and', 'or'):
+            return [leaf for child in node[1] for leaf in self.query_leaves(child)]
+        term = node[1]
+        separator_pos = term.find(':')
+        field = 'article' if separator_pos == -1 else term[:separator_pos]
+        if field not in self.index or is_range(term[separator_pos + 1:]):
+            # Los rangos de fechas no puntúan ni se resaltan en los snippets
+            return []
+        return [(field, term[separator_pos + 1:])]
+
+    def term_tokens(self, text, field='article'):
+        """
+        Devuelve los tokens del índice que corresponden a un término que no es una búsqueda posicional:
+        el token normalizado, los tokens con su mismo stem si se usa stemming o los que encajan con sus comodines.
+
+        return: lista de tokens
+        """
+        if has_wildcard(text):
+            return self.wildcard_terms(text, field)
+        if field in SAR_Project.normalized_fields:
+            tokens = self.tokenize(text)
+            if len(tokens) == 0:
+                return []
+            if self.use_stemming:
+                return self.sindex[field].get(self.stem(tokens[0]), ([], None))[0]
+            return [tokens[0]]
+        return [text]
+
+    def avg_length(self, field):
+        """
+        Devuelve la longitud media de un campo en las noticias indexadas, sin contar las borradas.
+        """
+        generation, avg = self.avg_lengths.get(field, (-1, 0))
+        if generation != self.generation:
+            lengths = self.lengths[field]
+            total = sum(lengths)
+            count = len(lengths)
+            if count > 0 and len(self.deleted) > 0:
+                total -= sum(lengths[newid] for newid in self.deleted)
+                count -= len(self.deleted)
+            avg = total / count if count > 0 else 0
+            self.avg_lengths[field] = (self.generation, avg)
+        return avg
+
+
+def _solve_query_worker(args):
+    """
+    Funcion ejecutada por cada proceso al resolver consultas en paralelo (ver SAR_Project.solve_queries_parallel).
+
+    param:  "args": tupla (consulta, True para contar los resultados o False para mostrarlos)
+
+    return: tupla (salida impresa, valor devuelto, True si la consulta ha llamado a exit(), Profiler con las
+            medidas de la consulta o None)
+    """
+    query, count = args
+    if _shared_project.profiler is not None:
+        # Cada consulta devuelve solo sus medidas, el proceso principal las va sumando
+        _shared_project.profiler.reset()
+    output = io.StringIO()
+    value = None
+    exited = False
+    with contextlib.redirect_stdout(output):
+        try:
+            if count:
+                value = _shared_project.solve_and_count(query)
+            else:
+                value = _shared_project.solve_and_show(query)
+        except SystemExit:
+            # Los errores de las consultas terminan el programa: lo hara el proceso principal al llegar a esta
+            exited = True
+    return (output.getvalue(), value, exited, _shared_project.profiler)
+
+
+def _stem_worker(tokens):
+    """
+    Funcion ejecutada por cada proceso al calcular los stems en paralelo (ver SAR_Project.make_stemming).
+
+    param:  "tokens": lista de tokens
+
+    return: lista con el stem de cada token
+    """
+    stemmer = SnowballStemmer('spanish')
+    return [stemmer.stem(token) for token in tokens]
+
+
+def _index_files_worker(args):
+    """
+    Funcion ejecutada por cada proceso de la indexacion paralela (ver SAR_Project.index_files_parallel).
+    Tiene que estar a nivel de modulo para que multiprocessing la pueda serializar.
+
+    param:  "args": tupla (lista de ficheros, diccionario con los atributos de configuracion del indexado)
+
+    return: diccionario con el indice parcial y las tablas de noticias y documentos con numeracion local
+    """
+    filenames, config = args
+    partial = SAR_Project()
+    for (attr, value) in config.items():
+        setattr(partial, attr, value)
+    # Cada proceso escribe sus bloques del almacen de noticias en memoria y los devuelve con el indice
+    partial.docstore_writer = DocStoreWriter(io.BytesIO())
+    for filename in filenames:
+        partial.index_file(filename)
+    return {'index': partial.index, 'news': partial.news, 'docs': partial.docs, 'lengths': partial.lengths,
+            'docstore': partial.docstore_writer.get_blocks(), 'profiler': partial.profiler}
+
+
+def list_news_files(root):
+    """
+    Devuelve las rutas de los ficheros de noticias (.json) del directorio "root", en el orden de os.walk.
+    """
+    filenames = []
+    for dir, subdirs, files in os.walk(root):
+        for filename in files:
+            if filename.endswith('.json'):
+                filenames.append(os.path.join(dir, filename))
+    return filenames
+
+
+def iter_json_array(fh, chunk_size=1 << 16):
+    """
+    Generador que parsea un fichero con un array JSON devolviendo sus elementos de uno en uno.
+
+    Se lee el fichero por bloques y se decodifica cada elemento con json.JSONDecoder.raw_decode, descartando
+    del buffer lo ya parseado. Asi la memoria necesaria depende del tamaño del mayor elemento del array y no
+    del tamaño del fichero.
+
+    param:  "fh": fichero abierto en modo texto
+            "chunk_size": numero de caracteres que se leen en cada bloque
+
+    return: generador con los elementos del array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    read_size = chunk_size
+    while True:
+        # Saltamos los espacios y separadores entre elementos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer = fh.read(read_size)
+            pos = 0
+            eof = len(buffer) == 0
+        if pos >= len(buffer):
+            if started:
+                raise ValueError("ERROR: array JSON sin cerrar")
+            return
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError("ERROR: el fichero no contiene un array JSON")
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            return
+        if char == ',':
+            pos += 1
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+        if end is None or (not eof and (end == len(buffer) or buffer[end] not in ',] \t\n\r')):
+            # El elemento no esta completo en el buffer, o podria continuar: un numero cortado como "-0." o "1e" se
+            # decodifica como -0 o 1, pero en un array valido detras de cada elemento solo puede venir un separador.
+            # Leemos mas, doblando el tamaño de lectura para que los elementos muy grandes no se reintenten
+            # demasiadas veces
+            if eof:
+                raise ValueError("ERROR: array JSON incompleto")
+            more = fh.read(read_size)
+            eof = len(more) == 0
+            buffer = buffer[pos:] + more
+            pos = 0
+            read_size *= 2
+            continue
+        read_size = chunk_size
+        yield item
+        # Descartamos lo ya parseado para no acumular el fichero entero en el buffer
+        buffer = buffer[end:]
+        pos = 0
@@ -0,0 +1,106 @@
+"""
+Indice permuterm para las consultas con comodines.
+
+Para cada termino de un campo se guardan todas las rotaciones de "termino$" en un array ordenado. Una consulta
+con comodines (* para cualquier secuencia de caracteres, ? para un caracter) se rota para dejar los comodines al
+final: con X la parte anterior al primer comodin e Y la posterior al ultimo, todos los terminos que encajan tienen
+una rotacion que empieza por "Y$X". Esas rotaciones estan seguidas en el array ordenado, asi que se encuentran con
+una busqueda binaria y un recorrido del rango. Si hay mas de un comodin, o alguno es ?, los terminos encontrados
+se filtran despues con una expresion regular.
+"""
+
+from bisect import bisect_left
+import re
+
+
+def rotations(term):
+    """
+    Devuelve todas las rotaciones de "term$".
+    """
+    term = term + '$'
+    return [term[k:] + term[:k] for k in range(len(term))]
+
+
+def rotation_to_term(rotation):
+    """
+    Recupera el termino original a partir de una de sus rotaciones.
+    """
+    separator = rotation.index('$')
+    return rotation[separator + 1:] + rotation[:separator]
+
+
+def has_wildcard(term):
+    """
+    Indica si un termino de una consulta tiene comodines.
+    """
+    return '*' in term or '?' in term
+
+
+def is_prefix_pattern(pattern):
+    """
+    Indica si un patron solo tiene un comodin * al final, es decir, si es una consulta por prefijo.
+    """
+    return pattern.endswith('*') and not has_wildcard(pattern[:-1])
+
+
+def wildcard_key(pattern):
+    """
+    Devuelve el prefijo de las rotaciones que pueden encajar con el patron "pattern", que tiene algun comodin.
+    """
+    first = min(pos for pos in (pattern.find('*'), pattern.find('?')) if pos != -1)
+    last = max(pattern.rfind('*'), pattern.rfind('?'))
+    return pattern[last + 1:] + '$' + pattern[:first]
+
+
+def wildcard_regex(pattern):
+    """
+    Traduce un patron con comodines a una expresion regular que encaja con el termino completo.
+    """
+    return re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern) + r'\Z')
+
+
+def match_terms(permuterm, pattern):
+    """
+    Devuelve los terminos de un indice permuterm que encajan con un patron con comodines.
+
+    param:  "permuterm": indice permuterm, cualquier objeto con un metodo iter_prefix(prefijo) que recorra en orden
+                         las rotaciones que empiezan por el prefijo (PermutermIndex o SAR_disk.DiskPermutermIndex)
+            "pattern": termino con comodines
+
+    return: lista ordenada de terminos, sin repetir
+    """
+    key = wildcard_key(pattern)
+    regex = wildcard_regex(pattern)
+    terms = set()
+    for rotation in permuterm.iter_prefix(key):
+        term = rotation_to_term(rotation)
+        if regex.match(term):
+            terms.add(term)
+    return sorted(terms)
+
+
+class PermutermIndex:
+    """
+    Indice permuterm de un campo en memoria: array ordenado con las rotaciones de todos sus terminos.
+    """
+
+    def __init__(self, terms):
+        self.rotations = []
+        for term in terms:
+            self.rotations.extend(rotations(term))
+        self.rotations.sort()
+
+    def __len__(self):
+        return len(self.rotations)
+
+    def __iter__(self):
+        return iter(self.rotations)
+
+    def iter_prefix(self, prefix):
+        """
+        Recorre en orden las rotaciones que empiezan por "prefix".
+        """
+        i = bisect_left(self.rotations, prefix)
+        while i < len(self.rotations) and self.rotations[i].startswith(prefix):
+            yield self.rotations[i]
+            i += 1
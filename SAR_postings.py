@@ -0,0 +1,585 @@
+from array import array
+from bisect import bisect_left
+import heapq
+import sys
+
+# Si una posting list es mas de GALLOP_RATIO veces mas larga que la otra, el AND busca en la larga con
+# "gallop" en lugar de recorrerla entera
+GALLOP_RATIO = 8
+# Un termino se guarda tambien como bitmap si aparece en al menos 1 de cada BITMAP_RATIO noticias. A partir de
+# ahi el bitmap (1 bit por noticia) ocupa menos que el array de newids (32 bits por noticia en la que aparece)
+BITMAP_RATIO = 32
+# Para cada valor de un byte, posiciones de sus bits a 1
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class PostingList:
+    """
+    Posting list compacta de un termino.
+
+    En lugar de una lista de enteros de Python (o de tuplas (newid, [posiciones]) en el indice posicional)
+    se guardan los datos en arrays de enteros sin signo de 32 bits:
+
+        - "docs": newids ordenados en los que aparece el termino
+        - "freqs": (solo no posicional) para cada noticia de "docs", cuantas veces aparece el termino en ella
+        - "positions": (solo posicional) todas las posiciones del termino, noticia tras noticia
+        - "offsets": (solo posicional) para cada noticia de "docs", donde empiezan sus posiciones en "positions"
+        - "count": numero total de apariciones del termino
+
+    Al serializar (pickle) los newids y las posiciones se guardan como diferencias codificadas en varint,
+    por lo que el indice guardado ocupa mucho menos que los arrays en memoria.
+    """
+
+    __slots__ = ('count', 'docs', 'freqs', 'offsets', 'positions')
+
+    def __init__(self, positional=False):
+        self.count = 0
+        self.docs = array('I')
+        if positional:
+            # En el indice posicional la frecuencia es el numero de posiciones de cada noticia
+            self.freqs = None
+            self.offsets = array('I')
+            self.positions = array('I')
+        else:
+            self.freqs = array('I')
+            self.offsets = None
+            self.positions = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def add(self, newid, position=0):
+        """
+        Añade una aparicion del termino. Las noticias se tienen que añadir en orden creciente de newid.
+
+        param:  "newid": noticia en la que aparece el termino
+                "position": posicion del termino en la noticia, solo se usa en el indice posicional
+
+        """
+        docs = self.docs
+        if self.positions is not None:
+            if len(docs) == 0 or docs[-1] != newid:
+                docs.append(newid)
+                self.offsets.append(len(self.positions))
+            self.positions.append(position)
+        elif len(docs) == 0 or docs[-1] != newid:
+            docs.append(newid)
+            self.freqs.append(1)
+        else:
+            self.freqs[-1] += 1
+        self.count += 1
+
+    def extend(self, other, offset=0):
+        """
+        Añade al final todas las noticias de otra posting list, sumando "offset" a sus newids.
+        Todas las noticias de "other" (ya desplazadas) tienen que ser posteriores a las de esta.
+
+        param:  "other": PostingList que se añade
+                "offset": desplazamiento de los newid de "other"
+
+        """
+        if self.positions is not None:
+            base = len(self.positions)
+            self.offsets.extend([o + base for o in other.offsets])
+            self.positions.extend(other.positions)
+        else:
+            self.freqs.extend(other.freqs)
+        if offset:
+            self.docs.extend([d + offset for d in other.docs])
+        else:
+            self.docs.extend(other.docs)
+        self.count += other.count
+
+    def get_positions(self, k):
+        """
+        Devuelve las posiciones del termino en la k-esima noticia de la posting list.
+
+        param:  "k": indice dentro de "docs" (no el newid)
+
+        return: array con las posiciones ordenadas
+        """
+        start = self.offsets[k]
+        end = self.offsets[k + 1] if k + 1 < len(self.offsets) else len(self.positions)
+        return self.positions[start:end]
+
+    def get_freqs(self):
+        """
+        Devuelve las frecuencias del termino en cada noticia de la posting list.
+
+        return: array con, para cada noticia de "docs", el numero de apariciones del termino
+        """
+        if self.positions is None:
+            return self.freqs
+        offsets = self.offsets
+        ends = offsets[1:]
+        ends.append(len(self.positions))
+        return array('I', [end - start for start, end in zip(offsets, ends)])
+
+    def memory_size(self):
+        """
+        Devuelve el numero aproximado de bytes que ocupa la posting list en memoria.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.docs)
+        if self.positions is not None:
+            size += sys.getsizeof(self.offsets) + sys.getsizeof(self.positions)
+        else:
+            size += sys.getsizeof(self.freqs)
+        return size
+
+    def list_memory_size(self):
+        """
+        Estima los bytes que ocuparia la misma posting list con la representacion anterior basada en
+        listas: una tupla (count, lista) con enteros de Python, o tuplas (newid, [posiciones]) si es posicional.
+        """
+        n = len(self.docs)
+        # tupla (count, lista) + lista de n punteros + n enteros
+        size = sys.getsizeof((0, None)) + sys.getsizeof([]) + 8 * n + 28 * n
+        if self.positions is not None:
+            # cada noticia es una tupla (newid, lista) con su lista de posiciones
+            size += n * (sys.getsizeof((0, None)) + sys.getsizeof([])) + 36 * len(self.positions)
+        return size
+
+    def encode(self):
+        """
+        Codifica la posting list de forma compacta: las diferencias entre newids consecutivos en varint y,
+        si es posicional, para cada noticia el numero de posiciones seguido de las diferencias entre ellas.
+        Si no es posicional, las diferencias van seguidas de la frecuencia en cada noticia.
+
+        return: bytes con la posting list codificada (sin "count" ni el numero de noticias)
+        """
+        data = bytearray()
+        encode_varints(gaps(self.docs), data)
+        if self.positions is None:
+            encode_varints(self.freqs, data)
+        else:
+            positions = self.positions
+            n_positions = len(positions)
+            offsets = self.offsets
+            for k in range(len(offsets)):
+                start = offsets[k]
+                end = offsets[k + 1] if k + 1 < len(offsets) else n_positions
+                # Para cada noticia guardamos cuantas posiciones tiene y sus diferencias
+                data_k = [end - start]
+                prev = 0
+                for pos in positions[start:end]:
+                    data_k.append(pos - prev)
+                    prev = pos
+                encode_varints(data_k, data)
+        return bytes(data)
+
+    @staticmethod
+    def decode(data, n_docs, count, positional):
+        """
+        Operacion inversa de "encode".
+
+        param:  "data": bytes (o cualquier objeto indexable por bytes) con la posting list codificada
+                "n_docs": numero de noticias de la posting list
+                "count": numero total de apariciones del termino
+                "positional": si la posting list tiene posiciones
+
+        return: PostingList decodificada
+        """
+        posting_list = PostingList(positional)
+        posting_list.count = count
+        values, pos = decode_varints(data, n_docs)
+        posting_list.docs = array('I', accumulate_gaps(values))
+        if positional:
+            offsets = posting_list.offsets
+            positions = posting_list.positions
+            n_positions = 0
+            for _ in range(n_docs):
+                (n,), pos = decode_varints(data, 1, pos)
+                values, pos = decode_varints(data, n, pos)
+                offsets.append(n_positions)
+                positions.extend(accumulate_gaps(values))
+                n_positions += n
+        else:
+            values, pos = decode_varints(data, n_docs, pos)
+            posting_list.freqs = array('I', values)
+        return posting_list
+
+    def __getstate__(self):
+        return (self.count, len(self.docs), self.positions is not None, self.encode())
+
+    def __setstate__(self, state):
+        count, n_docs, positional, data = state
+        decoded = PostingList.decode(data, n_docs, count, positional)
+        self.count = count
+        self.docs = decoded.docs
+        self.freqs = decoded.freqs
+        self.offsets = decoded.offsets
+        self.positions = decoded.positions
+
+
+# Posting list vacia que se devuelve para los terminos que no estan en el indice posicional. No se debe modificar
+EMPTY_POSITIONAL = PostingList(positional=True)
+
+
+class PositionCursor:
+    """
+    Cursor sobre una posting list posicional: apunta a una noticia y, dentro de ella, a una posicion.
+    Solo avanza, y lo hace con "gallop", tanto entre noticias como entre las posiciones de una noticia.
+    """
+
+    __slots__ = ('docs', 'offsets', 'positions', 'k', 'pos', 'end')
+
+    def __init__(self, posting_list):
+        self.docs = posting_list.docs
+        self.offsets = posting_list.offsets
+        self.positions = posting_list.positions
+        self.k = 0
+        self.reset_positions()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def reset_positions(self):
+        """
+        Coloca el cursor de posiciones en la primera posicion de la noticia actual.
+        """
+        if self.k < len(self.docs):
+            self.pos = self.offsets[self.k]
+            self.end = self.offsets[self.k + 1] if self.k + 1 < len(self.docs) else len(self.positions)
+        else:
+            self.pos = self.end = 0
+
+    def newid(self):
+        """
+        Devuelve el newid de la noticia actual, o None si el cursor ha llegado al final.
+        """
+        return self.docs[self.k] if self.k < len(self.docs) else None
+
+    def advance_to(self, newid):
+        """
+        Avanza hasta la primera noticia con newid mayor o igual que "newid".
+
+        return: newid de la noticia en la que se queda el cursor, o None si no hay ninguna
+        """
+        if self.k < len(self.docs) and self.docs[self.k] < newid:
+            self.k = gallop(self.docs, newid, self.k)
+            self.reset_positions()
+        return self.newid()
+
+    def position(self):
+        """
+        Devuelve la posicion actual dentro de la noticia actual, o None si no quedan posiciones.
+        """
+        return self.positions[self.pos] if self.pos < self.end else None
+
+    def advance_to_position(self, position):
+        """
+        Avanza, dentro de la noticia actual, hasta la primera posicion mayor o igual que "position".
+
+        return: posicion en la que se queda el cursor, o None si no hay ninguna
+        """
+        if self.pos < self.end and self.positions[self.pos] < position:
+            self.pos = gallop(self.positions, position, self.pos, self.end)
+        return self.position()
+
+
+def match_phrase(cursors):
+    """
+    Comprueba si los terminos de los cursores aparecen seguidos y en orden en la noticia actual, en la
+    que tienen que estar todos los cursores.
+
+    Se parte de una posicion candidata para el primer termino y cada cursor avanza hasta la posicion que le
+    corresponderia. Si un termino no esta ahi, la posicion en la que se ha parado da la siguiente candidata,
+    asi que ninguna posicion se visita dos veces.
+
+    param:  "cursors": lista de PositionCursor, en el orden de los terminos
+
+    return: True si la secuencia aparece en la noticia
+    """
+    candidate = cursors[0].position()
+    while candidate is not None:
+        for j in range(len(cursors)):
+            position = cursors[j].advance_to_position(candidate + j)
+            if position is None:
+                return False
+            if position != candidate + j:
+                candidate = position - j
+                break
+        else:
+            return True
+    return False
+
+
+def match_near(cursors, distance):
+    """
+    Comprueba si los terminos de los cursores aparecen en la noticia actual, en cualquier orden, con como
+    mucho "distance" palabras entre ellos, es decir, dentro de una ventana de distance + n palabras.
+
+    El cursor que esta mas adelante fija el final minimo de la ventana, asi que los demas pueden saltar
+    directamente hasta su posicion menos el tamaño de la ventana. Si un termino se repite (p.ej. "a near/3 a"),
+    sus cursores no pueden quedarse en la misma posicion: dos cursores solo coinciden si son del mismo termino,
+    y entonces el de mas a la derecha en la consulta pasa a la siguiente aparicion.
+
+    param:  "cursors": lista de PositionCursor, todos en la misma noticia
+            "distance": numero maximo de palabras entre los terminos
+
+    return: True si los terminos aparecen lo bastante cerca
+    """
+    span = distance + len(cursors) - 1
+    positions = [cursor.position() for cursor in cursors]
+    while True:
+        for j in range(1, len(cursors)):
+            while positions[j] in positions[:j]:
+                positions[j] = cursors[j].advance_to_position(positions[j] + 1)
+                if positions[j] is None:
+                    return False
+        last = max(positions)
+        if last - min(positions) <= span:
+            return True
+        for j in range(len(cursors)):
+            if positions[j] < last - span:
+                positions[j] = cursors[j].advance_to_position(last - span)
+                if positions[j] is None:
+                    return False
+
+
+class Complement:
+    """
+    Posting list con todas las noticias del corpus excepto las de "excluded", sin materializarla.
+
+    Es lo que devuelve SAR_Project.reverse_posting: asi un NOT no cuesta tanto como el numero total de
+    noticias, y and_posting, or_posting y minus_posting lo combinan con otras posting lists aplicando
+    las leyes de De Morgan (p.ej. "A and not B" se resuelve como "A - B").
+    """
+
+    __slots__ = ('excluded', 'total')
+
+    def __init__(self, excluded, total):
+        self.excluded = excluded
+        self.total = total
+
+    def __len__(self):
+        return self.total - len(self.excluded)
+
+    def __iter__(self):
+        i = 0
+        for newid in self.excluded:
+            yield from range(i, newid)
+            i = newid + 1
+        yield from range(i, self.total)
+
+    def materialize(self):
+        """
+        Devuelve la posting list completa como array de newids.
+        """
+        result = array('I')
+        i = 0
+        for newid in self.excluded:
+            # Añadimos al resultado todas las noticias que hay entre cada una de las excluidas
+            result.extend(range(i, newid))
+            i = newid + 1
+        result.extend(range(i, self.total))
+        return result
+
+
+class Bitmap:
+    """
+    Posting list densa representada como un mapa de bits sobre todas las noticias del corpus: el bit i
+    esta a 1 si la noticia con newid i pertenece a la posting list.
+
+    Los bits se guardan en un entero de Python, asi el AND, OR y NOT entre bitmaps son operaciones bit a bit
+    que se hacen en C de golpe sobre todo el corpus. Para comprobar si una noticia esta en el bitmap (al
+    cruzarlo con una posting list normal) se usa su representacion en bytes.
+    """
+
+    __slots__ = ('bits', 'total', 'length', 'data')
+
+    def __init__(self, bits, total):
+        self.bits = bits
+        self.total = total
+        self.length = None
+        self.data = None
+
+    @staticmethod
+    def from_postings(p, total):
+        """
+        Construye el bitmap de una posting list ordenada.
+        """
+        data = bytearray((total + 7) // 8)
+        for newid in p:
+            data[newid >> 3] |= 1 << (newid & 7)
+        bitmap = Bitmap(int.from_bytes(data, 'little'), total)
+        bitmap.data = bytes(data)
+        bitmap.length = len(p)
+        return bitmap
+
+    @staticmethod
+    def from_bytes(data, total):
+        """
+        Construye un bitmap a partir de su representacion en bytes (ver "to_bytes").
+        """
+        bitmap = Bitmap(int.from_bytes(data, 'little'), total)
+        bitmap.data = bytes(data)
+        return bitmap
+
+    def to_bytes(self):
+        """
+        Devuelve el bitmap como bytes, el bit i en el bit (i % 8) del byte i // 8.
+        """
+        if self.data is None:
+            self.data = self.bits.to_bytes((self.total + 7) // 8, 'little')
+        return self.data
+
+    def __len__(self):
+        if self.length is None:
+            self.length = bin(self.bits).count('1')
+        return self.length
+
+    def __contains__(self, newid):
+        return self.to_bytes()[newid >> 3] >> (newid & 7) & 1 == 1
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def complement(self):
+        """
+        Devuelve el bitmap con todas las noticias que no estan en este.
+        """
+        return Bitmap(~self.bits & ((1 << self.total) - 1), self.total)
+
+    def filter(self, p, keep=True):
+        """
+        Devuelve las noticias de la posting list "p" que estan en el bitmap, o las que no estan si "keep" es False.
+        """
+        data = self.to_bytes()
+        result = array('I')
+        for newid in p:
+            if (data[newid >> 3] >> (newid & 7) & 1 == 1) == keep:
+                result.append(newid)
+        return result
+
+    def materialize(self):
+        """
+        Devuelve la posting list completa como array de newids.
+        """
+        result = array('I')
+        for i, byte in enumerate(self.to_bytes()):
+            if byte:
+                base = i << 3
+                result.extend([base + bit for bit in BYTE_BITS[byte]])
+        return result
+
+
+def to_array(p):
+    """
+    Devuelve una posting list como array (o lista) de newids, materializando los complementos y bitmaps.
+    """
+    if isinstance(p, (Complement, Bitmap)):
+        return p.materialize()
+    return p
+
+
+def merge_sorted(postings):
+    """
+    Mezcla de k vias de posting lists ordenadas con un heap, eliminando los newids repetidos.
+
+    param:  "postings": lista de posting lists ordenadas (arrays o listas)
+
+    return: array ordenado con la union de todas
+    """
+    if len(postings) == 0:
+        return array('I')
+    if len(postings) == 1:
+        return postings[0]
+    result = array('I')
+    last = -1
+    for newid in heapq.merge(*postings):
+        if newid != last:
+            result.append(newid)
+            last = newid
+    return result
+
+
+def gallop(p, value, lo=0, hi=None):
+    """
+    Busqueda exponencial (galloping) en una posting list ordenada: devuelve la primera posicion a partir
+    de "lo" cuyo newid es mayor o igual que "value", o len(p) si no hay ninguna.
+
+    Se avanza con saltos de 1, 2, 4... posiciones hasta pasarse y despues se hace busqueda binaria en el
+    ultimo salto, asi el coste es logaritmico en la distancia avanzada y no en la longitud de la lista.
+    Hace el papel de los punteros de salto (skip pointers) sin tener que guardarlos en el indice.
+
+    param:  "p": posting list ordenada (array o lista)
+            "value": newid que se busca
+            "lo": posicion desde la que se busca
+            "hi": si se indica, solo se busca hasta esa posicion (sin incluirla)
+
+    return: posicion del primer newid >= value (o "hi" si no hay ninguno)
+    """
+    n = len(p) if hi is None else hi
+    hi = lo
+    step = 1
+    while hi < n and p[hi] < value:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(p, value, lo, min(hi, n))
+
+
+def gaps(values):
+    """
+    Devuelve las diferencias entre elementos consecutivos de una secuencia ordenada (el primero se deja igual).
+    """
+    result = []
+    prev = 0
+    for value in values:
+        result.append(value - prev)
+        prev = value
+    return result
+
+
+def accumulate_gaps(values):
+    """
+    Operacion inversa de "gaps": reconstruye la secuencia original a partir de sus diferencias.
+    """
+    result = []
+    total = 0
+    for value in values:
+        total += value
+        result.append(total)
+    return result
+
+
+def encode_varints(values, out):
+    """
+    Codifica una secuencia de enteros no negativos en formato varint (7 bits por byte, el bit alto
+    indica si el numero continua) y los añade al bytearray "out".
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(data, n, pos=0):
+    """
+    Decodifica "n" enteros en formato varint de "data" a partir de la posicion "pos".
+
+    return: (lista de enteros, posicion siguiente al ultimo byte leido)
+    """
+    result = []
+    for _ in range(n):
+        byte = data[pos]
+        pos += 1
+        if byte < 0x80:
+            result.append(byte)
+            continue
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        result.append(value)
+    return result, pos
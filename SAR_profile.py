@@ -0,0 +1,126 @@
+import cProfile
+import time
+
+# Instrumentacion de la indexacion y de las consultas. SAR_Project tiene un atributo "profiler" que es None
+# si no se mide nada, y los metodos medidos solo comprueban eso antes de tomar tiempos, asi que sin --profile
+# el coste es una comparacion por noticia o por operacion.
+#
+# Las etapas tienen nombres con puntos ("index.tokenize", "query.merge.and"...) y no se solapan entre si,
+# de forma que se pueden sumar y escribir como pilas para flamegraph.pl ("index;tokenize microsegundos").
+
+
+class Profiler:
+    """
+    Acumula el tiempo y el numero de veces que se ejecuta cada etapa, y contadores de trabajo hecho
+    (tokens, posting lists, noticias leidas...).
+    """
+
+    def __init__(self):
+        self.times = {}  # etapa -> segundos
+        self.calls = {}  # etapa -> numero de veces medida
+        self.counters = {}  # contador -> valor
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        """
+        Suma "seconds" al tiempo de la etapa "stage".
+        """
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def count(self, counter, n=1):
+        """
+        Suma "n" al contador "counter".
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def iter(self, stage, iterable):
+        """
+        Recorre "iterable" sumando a la etapa "stage" el tiempo que tarda en dar cada elemento, por ejemplo
+        el de parsear cada noticia de un generador.
+        """
+        iterator = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+            yield item
+
+    def merge(self, other):
+        """
+        Suma las medidas de otro Profiler, por ejemplo el de un proceso de la indexacion paralela.
+        """
+        for stage, seconds in other.times.items():
+            self.times[stage] = self.times.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + other.calls[stage]
+        for counter, n in other.counters.items():
+            self.count(counter, n)
+
+    def reset(self):
+        self.times.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def show(self):
+        """
+        Muestra el tiempo de cada etapa y los contadores.
+        """
+        elapsed = time.perf_counter() - self.start
+        print("========================================")
+        print("PROFILE (%.3fs elapsed):" % elapsed)
+        print("\t%-28s %10s %12s %12s %7s" % ('stage', 'calls', 'total ms', 'mean us', '%'))
+        for stage in sorted(self.times):
+            seconds = self.times[stage]
+            print("\t%-28s %10d %12.2f %12.2f %6.1f%%" % (stage, self.calls[stage], seconds * 1000,
+                                                         seconds * 1e6 / self.calls[stage],
+                                                         100 * seconds / elapsed if elapsed > 0 else 0))
+        if len(self.counters) > 0:
+            print("----------------------------------------")
+            print("COUNTERS:")
+            for counter in sorted(self.counters):
+                print("\t%-28s %10d" % (counter, self.counters[counter]))
+        print("========================================")
+
+    def write_folded(self, path):
+        """
+        Escribe los tiempos de las etapas como pilas plegadas ("a;b;c microsegundos"), el formato de entrada
+        de flamegraph.pl y speedscope.
+        """
+        with open(path, 'w', encoding='utf-8') as fh:
+            for stage in sorted(self.times):
+                fh.write("%s %d\n" % (stage.replace('.', ';'), round(self.times[stage] * 1e6)))
+
+
+def start_dump(path):
+    """
+    Empieza a medir con cProfile si se ha pedido un volcado que no sea de pilas plegadas.
+
+    param:  "path": fichero del volcado o None
+
+    return: cProfile.Profile activo o None
+    """
+    if path is None or path.endswith('.folded'):
+        return None
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def write_dump(path, profiler, profile):
+    """
+    Escribe el volcado pedido con --profile-dump: las estadisticas de cProfile (para pstats, snakeviz o
+    flameprof) o, si el fichero acaba en ".folded", las etapas del Profiler como pilas plegadas.
+
+    param:  "path": fichero del volcado o None
+            "profiler": Profiler con las etapas medidas
+            "profile": cProfile.Profile devuelto por start_dump
+    """
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(path)
+    elif path is not None:
+        profiler.write_folded(path)
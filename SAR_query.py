@@ -0,0 +1,380 @@
+"""
+Compilador de consultas.
+
+Una consulta se compila en tres pasos:
+
+    1. "tokenize_query": se recorre la cadena una sola vez y se separa en parentesis, operadores (and, or, not,
+       near/k) y operandos (terminos, terminos con campo y busquedas entre comillas).
+    2. "parse_query": se construye el arbol de la consulta. Los operadores and y or tienen la misma prioridad
+       y se evaluan de izquierda a derecha, como en la version original de solve_query. El operador near/k
+       tiene mas prioridad y solo une terminos: "a near/5 b" es lo mismo que la busqueda '"a b"~5'. Despues
+       "expand_any" sustituye los operandos del pseudo-campo any ("any:a") por el or del operando en cada campo.
+    3. "optimize_query": se simplifica el arbol: se aplanan los and y or anidados, se eliminan las dobles
+       negaciones y "A and not B" se convierte en una diferencia para no calcular el complemento de B.
+
+Los nodos del arbol son tuplas:
+
+    ('term', texto)                      operando tal cual aparece en la consulta, p.ej. 'title:"el país"',
+                                         '"el país"~3' (terminos a como mucho 3 palabras, en cualquier orden)
+                                         o 'date:[2015-01-01 to 2015-03-31]' (rango de fechas, ver SAR_dates)
+    ('not', nodo)
+    ('and', (nodo, nodo, ...))
+    ('or', (nodo, nodo, ...))
+    ('minus', nodo, (nodo, nodo, ...))   noticias del primer nodo que no estan en ninguno de los demas
+"""
+
+import re
+
+from SAR_cache import LRUCache
+
+# numero maximo de planes compilados que se guardan en la cache
+PLAN_CACHE_SIZE = 1024
+
+LPAREN = ('(',)
+RPAREN = (')',)
+AND = ('and',)
+OR = ('or',)
+NOT = ('not',)
+# los operadores near/k son tuplas ('near', k)
+NEAR_RE = re.compile(r'near/(\d+)')
+# pseudo-campo de los operandos que se buscan en todos los campos
+ANY_FIELD = 'any'
+# rango de fechas "[inicio to fin]" (la consulta ya esta en minusculas), con "*" si no tiene ese limite
+RANGE_RE = re.compile(r'\[ ?(\S+) to (\S+) ?\]$')
+
+
+def normalize_query(query):
+    """
+    Normaliza el texto de una consulta para usarlo como clave de la cache de planes: minusculas, sin espacios
+    al principio y al final y con los espacios repetidos reducidos a uno, que no cambian el significado.
+    """
+    return re.sub(' +', ' ', query.lower().strip())
+
+
+def get_token_end(query, start):
+    """
+    A partir de una query y la posición en la que comienza un token que se corresponde con el operando para
+    una operación AND, OR o NOT, devuelve la posición del siguiente carácter después del token sobre el que
+    se opera. El token puede ser o bien una cadena entre comillas para búsqueda, o bien un rango entre corchetes,
+    o bien una palabra suelta, que puede incluir un especificador de campo.
+
+    param:  "query" Cadena con la query
+            "start" Posición del primer carácter del token
+    return: posición del siguiente carácter posterior al token
+    """
+    pos = start
+    while pos < len(query) and not (query[pos] == ' ' or query[pos] == ')'):
+        # Generalmente, sabremos que hemos llegado al final del token si hemos alcanzado el final del input,
+        # si nos encotramos un espacio en blanco, o un paréntesis que cierre
+        if query[pos] == '"':
+            # Si encontramos comillas, token acabará únicamente cuando nos encontremos las comillas de cierre
+            pos += 1
+            while pos < len(query) and query[pos] != '"':
+                pos += 1
+            if pos >= len(query):
+                print("ERROR: No se han cerrado comillas")
+                exit()
+        elif query[pos] == '[':
+            # Igual con los corchetes de los rangos, que tienen espacios
+            pos = query.find(']', pos)
+            if pos == -1:
+                print("ERROR: No se han cerrado corchetes")
+                exit()
+        pos += 1
+    return pos
+
+
+def parse_phrase(text):
+    """
+    Separa una busqueda entre comillas, con o sin distancia: '"a b"' o '"a b"~k'.
+
+    param:  "text": operando sin el campo, empezando por las comillas
+
+    return: tupla (texto entre comillas, distancia o None si es una busqueda de la secuencia exacta)
+    """
+    close = text.rindex('"')
+    suffix = text[close + 1:]
+    if suffix.startswith('~') and suffix[1:].isdigit():
+        return text[1:close], int(suffix[1:])
+    return text[1:close], None
+
+
+def is_range(text):
+    """
+    Indica si un operando sin el campo es un rango: '[a to b]'.
+    """
+    return text.startswith('[')
+
+
+def parse_range(text):
+    """
+    Separa los limites de un rango: '[a to b]', donde "*" indica que el rango no tiene ese limite.
+
+    param:  "text": operando sin el campo, empezando por el corchete
+
+    return: tupla (limite inferior o None, limite superior o None)
+    """
+    match = RANGE_RE.match(text)
+    if match is None:
+        raise ValueError("ERROR: rango mal formado '%s', tiene que ser [inicio TO fin]" % text)
+    low, high = match.groups()
+    return (None if low == '*' else low, None if high == '*' else high)
+
+
+def tokenize_query(query):
+    """
+    Separa una consulta (ya en minusculas) en tokens, recorriendola una sola vez.
+
+    Se alterna entre esperar un operando (un parentesis de apertura, un not o un termino) y esperar un
+    operador (and, or o un parentesis de cierre). Como en la version original, si donde se espera un
+    operador aparece otra cosa, se ignora el resto de la consulta, o el resto del parentesis actual.
+
+    param:  "query": cadena con la query
+
+    return: lista de tokens: LPAREN, RPAREN, AND, OR, NOT, ('near', k) o ('term', texto)
+    """
+    tokens = []
+    depth = 0
+    expect_operand = True
+    i = 0
+    n = len(query)
+    while True:
+        while i < n and query[i].isspace():
+            i += 1
+        if expect_operand:
+            if i >= n:
+                raise ValueError("ERROR: falta un operando al final de la consulta")
+            if query[i] == '(':
+                tokens.append(LPAREN)
+                depth += 1
+                i += 1
+            elif query[i:i + 4] == 'not ' or query[i:i + 4] == 'not(':
+                tokens.append(NOT)
+                i += 3
+            else:
+                token_end = get_token_end(query, i)
+                tokens.append(('term', query[i:token_end]))
+                i = token_end
+                expect_operand = False
+        else:
+            if i >= n:
+                break
+            if query[i] == ')' and depth > 0:
+                tokens.append(RPAREN)
+                depth -= 1
+                i += 1
+            elif query[i:i + 2] == 'or':
+                tokens.append(OR)
+                i += 2
+                expect_operand = True
+            elif NEAR_RE.match(query, i):
+                near = NEAR_RE.match(query, i)
+                tokens.append(('near', int(near.group(1))))
+                i = near.end()
+                expect_operand = True
+            elif query[i:i + 3] == 'and':
+                tokens.append(AND)
+                i += 3
+                expect_operand = True
+            elif depth == 0:
+                # Fuera de parentesis, lo que queda no forma parte de la consulta
+                break
+            else:
+                # Dentro de un parentesis, saltamos hasta el que lo cierra
+                inner_parenthesis = 0
+                while i < n and not (query[i] == ')' and inner_parenthesis == 0):
+                    if query[i] == '(':
+                        inner_parenthesis += 1
+                    elif query[i] == ')':
+                        inner_parenthesis -= 1
+                    i += 1
+                if i >= n:
+                    break
+    # Los parentesis que no se han cerrado terminan al final de la consulta
+    tokens.extend([RPAREN] * depth)
+    return tokens
+
+
+def parse_query(tokens):
+    """
+    Construye el arbol de una consulta a partir de sus tokens.
+
+    param:  "tokens": lista de tokens devuelta por "tokenize_query"
+
+    return: nodo raiz del arbol
+    """
+    node, pos = parse_expression(tokens, 0)
+    return node
+
+
+def parse_expression(tokens, pos):
+    """
+    Analiza una secuencia "operando (operador operando)*" a partir de "pos", asociando por la izquierda.
+
+    return: (nodo, posicion del primer token no consumido)
+    """
+    node, pos = parse_operand(tokens, pos)
+    while pos < len(tokens) and tokens[pos] is not RPAREN:
+        operator = tokens[pos][0]
+        right, pos = parse_operand(tokens, pos + 1)
+        node = (operator, (node, right))
+    return node, pos
+
+
+def parse_operand(tokens, pos):
+    """
+    Analiza un operando: una subconsulta entre parentesis, un operando negado o un termino, que puede
+    estar unido a otros con near/k.
+
+    return: (nodo, posicion del primer token no consumido)
+    """
+    token = tokens[pos]
+    if token is LPAREN:
+        node, pos = parse_expression(tokens, pos + 1)
+        # Saltamos el parentesis de cierre
+        return node, pos + 1
+    if token is NOT:
+        node, pos = parse_operand(tokens, pos + 1)
+        return ('not', node), pos
+    pos += 1
+    while pos < len(tokens) and tokens[pos][0] == 'near':
+        if tokens[pos + 1][0] != 'term':
+            raise ValueError("ERROR: el operador near solo se puede aplicar a terminos")
+        token = near_term(token, tokens[pos + 1], tokens[pos][1])
+        pos += 2
+    return token, pos
+
+
+def split_field(text):
+    """
+    Separa el campo de un operando.
+
+    return: tupla (campo o None si no se indica, resto del operando)
+    """
+    separator_pos = text.find(':')
+    if separator_pos == -1:
+        return None, text
+    return text[:separator_pos], text[separator_pos + 1:]
+
+
+def near_term(left, right, distance):
+    """
+    Une dos terminos con near/k en un unico termino de busqueda por proximidad: "a near/k b" pasa a ser
+    '"a b"~k', y "a near/k b near/k c" pasa a ser '"a b c"~k'.
+
+    param:  "left", "right": nodos ('term', texto)
+            "distance": numero maximo de palabras entre los terminos
+
+    return: nodo ('term', texto)
+    """
+    field, left_text = split_field(left[1])
+    right_field, right_text = split_field(right[1])
+    if (field or 'article') != (right_field or 'article'):
+        raise ValueError("ERROR: el operador near solo se puede aplicar a terminos del mismo campo")
+    if left_text.startswith('"'):
+        words, left_distance = parse_phrase(left_text)
+        if left_distance != distance:
+            raise ValueError("ERROR: el operador near solo se puede aplicar a terminos")
+    else:
+        words = left_text
+    if right_text.startswith('"'):
+        raise ValueError("ERROR: el operador near solo se puede aplicar a terminos")
+    prefix = field + ':' if field is not None else ''
+    return ('term', '%s"%s %s"~%d' % (prefix, words, right_text, distance))
+
+
+def expand_any(node, fields):
+    """
+    Sustituye los terminos del pseudo-campo any por el or del termino en cada campo: con los campos title y
+    article, "any:a" pasa a ser "title:a or article:a", y 'any:"a b"~3' pasa a ser 'title:"a b"~3 or article:"a b"~3'.
+
+    param:  "node": nodo del arbol
+            "fields": campos en los que se buscan los terminos any
+
+    return: nodo sin terminos any
+    """
+    kind = node[0]
+    if kind == 'term':
+        field, text = split_field(node[1])
+        if field != ANY_FIELD:
+            return node
+        return ('or', tuple(('term', '%s:%s' % (f, text)) for f in fields))
+    if kind == 'not':
+        return ('not', expand_any(node[1], fields))
+    if kind == 'minus':
+        return ('minus', expand_any(node[1], fields), tuple(expand_any(c, fields) for c in node[2]))
+    return (kind, tuple(expand_any(c, fields) for c in node[1]))
+
+
+def optimize_query(node):
+    """
+    Simplifica el arbol de una consulta sin cambiar su resultado:
+
+        - los and y or anidados se aplanan en un unico nodo con todos los operandos
+        - se eliminan los operandos repetidos de and y or y las dobles negaciones
+        - los operandos negados de un and se convierten en una diferencia: "A and not B and not C" pasa a
+          ser ('minus', A, (B, C)), y si todos los operandos estan negados se aplica De Morgan:
+          "not A and not B" pasa a ser "not (A or B)"
+
+    param:  "node": nodo del arbol
+
+    return: nodo optimizado
+    """
+    kind = node[0]
+    if kind == 'term':
+        return node
+    if kind == 'not':
+        child = optimize_query(node[1])
+        if child[0] == 'not':
+            return child[1]
+        return ('not', child)
+    if kind == 'minus':
+        return ('minus', optimize_query(node[1]), tuple(optimize_query(c) for c in node[2]))
+
+    children = []
+    for child in node[1]:
+        child = optimize_query(child)
+        # Aplanamos los hijos que son del mismo operador
+        for grandchild in (child[1] if child[0] == kind else (child,)):
+            if grandchild not in children:
+                children.append(grandchild)
+    if kind == 'or':
+        return children[0] if len(children) == 1 else ('or', tuple(children))
+
+    positives = [child for child in children if child[0] != 'not']
+    negatives = [child[1] for child in children if child[0] == 'not']
+    if len(negatives) == 0:
+        return children[0] if len(children) == 1 else ('and', tuple(children))
+    if len(positives) == 0:
+        return optimize_query(('not', ('or', tuple(negatives))))
+    if len(positives) == 1 and positives[0][0] == 'minus':
+        # "a and not b and not c" se analiza como "(a and not b) and not c": unimos las dos diferencias
+        return ('minus', positives[0][1], positives[0][2] + tuple(n for n in negatives if n not in positives[0][2]))
+    positive = positives[0] if len(positives) == 1 else ('and', tuple(positives))
+    return ('minus', positive, tuple(negatives))
+
+
+class QueryCompiler:
+    """
+    Compila consultas a planes optimizados y guarda los planes en una cache con politica LRU,
+    indexada por el texto normalizado de la consulta. Los terminos any se buscan en los campos "fields".
+    """
+
+    def __init__(self, max_size=PLAN_CACHE_SIZE, fields=('article',)):
+        self.plans = LRUCache(max_size)
+        self.fields = tuple(fields)
+
+    def compile(self, query):
+        """
+        Devuelve el plan optimizado de una consulta, compilandolo si no esta en la cache.
+
+        param:  "query": cadena con la query
+
+        return: nodo raiz del plan
+        """
+        key = normalize_query(query)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = optimize_query(expand_any(parse_query(tokenize_query(key)), self.fields))
+            self.plans.put(key, plan)
+        return plan
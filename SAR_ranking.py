@@ -0,0 +1,133 @@
+"""
+Ranking de resultados con BM25.
+
+Cada termino de la consulta se puntua en su campo: para un termino t del campo f y una noticia d,
+
+    idf(t) * tf * (K1 + 1) / (tf + K1 * (1 - B + B * longitud(d, f) / longitud media de f))
+
+con tf el numero de apariciones de t en el campo f de d e idf(t) = log(1 + (N - df + 0.5) / (df + 0.5)).
+La puntuacion de una noticia es la suma de la de todos los terminos.
+
+Como solo se muestran las primeras noticias, no se ordena todo el resultado: se mantiene un heap con las
+k mejores y se usa MaxScore para no puntuar noticias que no pueden entrar en el. La contribucion de un
+termino nunca supera idf(t) * (K1 + 1), asi que, recorriendo los terminos de mayor a menor cota, en cuanto
+lo acumulado mas las cotas de los terminos que faltan no supera la peor puntuacion del heap se descarta
+la noticia. Las noticias que solo tienen terminos de cota baja se descartan sin mirar sus posting lists.
+"""
+
+from array import array
+import heapq
+import math
+
+from SAR_postings import gallop
+
+K1 = 1.2
+B = 0.75
+
+
+def idf(n_docs, total_news):
+    """
+    Devuelve el idf de BM25 de un termino que aparece en "n_docs" de las "total_news" noticias.
+    """
+    return math.log(1 + (total_news - n_docs + 0.5) / (n_docs + 0.5))
+
+
+class TermScorer:
+    """
+    Puntua las noticias para un termino de la consulta. Recorre su posting list en orden creciente de newid,
+    avanzando con "gallop", por lo que las noticias se tienen que consultar en orden.
+    """
+
+    def __init__(self, docs, freqs, lengths, avg_length, total_news, n_docs=None):
+        """
+        param:  "docs": newids ordenados en los que aparece el termino
+                "freqs": frecuencia del termino en cada noticia de "docs"
+                "lengths": array con la longitud del campo del termino en cada noticia, indexado por newid
+                "avg_length": longitud media del campo
+                "total_news": numero total de noticias
+                "n_docs": numero de noticias en las que aparece el termino para el idf, si no es len(docs)
+                          (por ejemplo si "docs" tiene noticias borradas)
+
+        """
+        self.docs = docs
+        self.freqs = freqs
+        self.lengths = lengths
+        self.avg_length = avg_length if avg_length > 0 else 1
+        self.idf = idf(len(docs) if n_docs is None else n_docs, total_news)
+        # cota superior de la contribucion del termino a cualquier noticia
+        self.max_score = self.idf * (K1 + 1)
+        self.pos = 0
+
+    def score(self, newid):
+        """
+        Devuelve la contribucion del termino a la puntuacion de la noticia "newid" (0 si no aparece en ella).
+        """
+        self.pos = gallop(self.docs, newid, self.pos)
+        if self.pos >= len(self.docs) or self.docs[self.pos] != newid:
+            return 0.0
+        tf = self.freqs[self.pos]
+        norm = K1 * (1 - B + B * self.lengths[newid] / self.avg_length)
+        return self.idf * tf * (K1 + 1) / (tf + norm)
+
+
+def merge_freqs(postings):
+    """
+    Une varias posting lists con sus frecuencias, sumando las frecuencias de las noticias repetidas.
+    Se usa cuando un termino de la consulta corresponde a varios terminos del indice (stemming, comodines).
+
+    param:  "postings": lista de tuplas (newids, frecuencias)
+
+    return: tupla (array con los newids, array con las frecuencias)
+    """
+    if len(postings) == 1:
+        return postings[0]
+    docs = array('I')
+    freqs = array('I')
+    streams = [zip(p_docs, p_freqs) for (p_docs, p_freqs) in postings]
+    for newid, tf in heapq.merge(*streams):
+        if len(docs) > 0 and docs[-1] == newid:
+            freqs[-1] += tf
+        else:
+            docs.append(newid)
+            freqs.append(tf)
+    return (docs, freqs)
+
+
+def top_k(candidates, scorers, k):
+    """
+    Devuelve las "k" noticias de "candidates" con mayor puntuacion, usando MaxScore para descartar las
+    que no pueden entrar entre las k mejores.
+
+    param:  "candidates": newids ordenados de las noticias que cumplen la consulta
+            "scorers": lista de TermScorer, uno por termino de la consulta
+            "k": numero de noticias a devolver
+
+    return: lista de tuplas (puntuacion, newid) ordenada de mayor a menor puntuacion, y a igual puntuacion
+            por newid
+    """
+    if k <= 0:
+        return []
+    # Ordenamos los terminos de mayor a menor cota; remaining[i] es la suma de las cotas de los terminos i..n-1
+    scorers = sorted(scorers, key=lambda s: s.max_score, reverse=True)
+    remaining = [0.0] * (len(scorers) + 1)
+    for i in range(len(scorers) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + scorers[i].max_score
+    # heap de tuplas (puntuacion, -newid): la raiz es la peor de las k mejores noticias. Como las noticias se
+    # recorren en orden creciente de newid, una noticia con la misma puntuacion que la raiz nunca la mejora
+    heap = []
+    for newid in candidates:
+        full = len(heap) >= k
+        score = 0.0
+        pruned = False
+        for i in range(len(scorers)):
+            if full and score + remaining[i] <= heap[0][0]:
+                pruned = True
+                break
+            score += scorers[i].score(newid)
+        if pruned:
+            continue
+        if not full:
+            heapq.heappush(heap, (score, -newid))
+        elif (score, -newid) > heap[0]:
+            heapq.heapreplace(heap, (score, -newid))
+    return sorted(((score, -neg_newid) for (score, neg_newid) in heap), key=lambda x: (-x[0], x[1]))
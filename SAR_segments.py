@@ -0,0 +1,544 @@
+"""
+Indice por segmentos, para actualizarlo sin volver a indexar todas las noticias.
+
+El directorio del indice tiene un manifiesto ("manifest.json") y un subdirectorio por segmento. Cada segmento
+es un indice completo con el formato de SAR_disk (ver SAR_Project.save_index), con sus propios indices de stems
+y permuterm, y con los newid y docid numerados desde 0. El manifiesto guarda:
+
+    - "config": opciones con las que se creo el indice (multifield, positional, stemming, permuterm)
+    - "segments": los segmentos en orden, con el newid y el docid globales de su primera noticia ("base" y
+      "doc_base") y su numero de noticias y documentos
+    - "files": para cada fichero indexado, por su ruta absoluta (ver file_key), su fecha de modificacion y
+      tamaño, el segmento en el que esta y el rango de newids globales de sus noticias
+    - "deleted": newids globales de las noticias de ficheros que se han modificado o borrado despues de indexarlos
+
+Al actualizar solo se indexan los ficheros nuevos o modificados, en un segmento nuevo que se añade al final,
+asi los newids globales siguen creciendo y las posting lists de los segmentos se concatenan sin reordenarlas.
+Las noticias de los ficheros modificados o borrados se marcan como borradas y se quitan de los resultados.
+
+Para que las consultas no tengan que recorrer cada vez mas segmentos, despues de cada actualizacion se
+fusionan los segmentos pequeños: cuando hay MERGE_FACTOR segmentos seguidos del mismo nivel de tamaño se
+sustituyen por uno solo. El manifiesto se reemplaza de forma atomica despues de escribir cada segmento nuevo,
+por lo que un buscador que abra el indice durante la actualizacion siempre ve un estado completo.
+"""
+
+from array import array
+import heapq
+import json
+import math
+import os
+import shutil
+
+from SAR_postings import PostingList, Bitmap
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+# numero de segmentos seguidos del mismo nivel que se fusionan en uno
+MERGE_FACTOR = 4
+# los segmentos con menos noticias que MIN_SEGMENT_NEWS son del nivel 0, y cada nivel es MERGE_FACTOR veces mayor
+MIN_SEGMENT_NEWS = 1000
+
+
+###############################
+###                         ###
+###       MANIFIESTO        ###
+###                         ###
+###############################
+
+
+def read_manifest(path):
+    """
+    Lee el manifiesto del indice del directorio "path".
+
+    return: diccionario con el manifiesto, o None si el directorio no tiene un indice por segmentos
+    """
+    filename = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError("ERROR: version de manifiesto no soportada en '%s'" % path)
+    return manifest
+
+
+def write_manifest(path, manifest):
+    """
+    Escribe el manifiesto en un fichero temporal y lo renombra, para que el cambio sea atomico.
+    """
+    filename = os.path.join(path, MANIFEST_FILE)
+    with open(filename + '.tmp', 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, ensure_ascii=False)
+    os.replace(filename + '.tmp', filename)
+
+
+def new_manifest(config):
+    """
+    Devuelve el manifiesto de un indice vacio.
+
+    param:  "config": diccionario con las opciones multifield, positional, stemming y permuterm
+    """
+    return {'version': MANIFEST_VERSION, 'config': config, 'segments': [], 'files': {}, 'deleted': [],
+            'next_segment': 1}
+
+
+def file_state(filename):
+    """
+    Devuelve la fecha de modificacion y el tamaño de un fichero, para saber si ha cambiado.
+    """
+    st = os.stat(filename)
+    return {'mtime': st.st_mtime, 'size': st.st_size}
+
+
+def file_key(filename):
+    """
+    Devuelve la clave de un fichero en el manifiesto: su ruta absoluta y sin enlaces simbolicos, para que el
+    mismo fichero sea el mismo aunque se indexe con otra ruta ("news", "./news", "/home/.../news").
+    """
+    return os.path.realpath(filename)
+
+
+def changed_files(manifest, filenames):
+    """
+    Compara los ficheros de noticias actuales con los del manifiesto.
+
+    param:  "manifest": manifiesto del indice
+            "filenames": lista con las rutas de los ficheros de noticias actuales
+
+    return: tupla (ficheros nuevos o modificados en el orden de "filenames", claves en el manifiesto de los
+            ficheros modificados o borrados que ya estaban indexados)
+    """
+    # Los manifiestos anteriores guardaban las rutas tal y como se indexaron, relativas al directorio de trabajo
+    manifest['files'] = {file_key(filename): entry for filename, entry in manifest['files'].items()}
+    current = set()
+    updated = []
+    stale = []
+    for filename in filenames:
+        key = file_key(filename)
+        current.add(key)
+        entry = manifest['files'].get(key)
+        if entry is None:
+            updated.append(filename)
+        else:
+            state = file_state(filename)
+            if entry['mtime'] != state['mtime'] or entry['size'] != state['size']:
+                updated.append(filename)
+                stale.append(key)
+    stale.extend(key for key in manifest['files'] if key not in current)
+    return updated, stale
+
+
+def add_segment(path, manifest, project):
+    """
+    Guarda un SAR_Project recien indexado como un segmento nuevo al final del indice y actualiza el manifiesto
+    (sin escribirlo).
+
+    param:  "path": directorio del indice
+            "manifest": manifiesto del indice
+            "project": SAR_Project con las noticias nuevas, numeradas desde 0
+
+    """
+    name = 'seg-%06d' % manifest['next_segment']
+    manifest['next_segment'] += 1
+    project.save_index(os.path.join(path, name))
+    base = sum(segment['total_news'] for segment in manifest['segments'])
+    doc_base = sum(segment['total_doc'] for segment in manifest['segments'])
+    # Rango de newids de cada fichero: las noticias de cada documento estan seguidas
+    news_per_doc = [0] * project.total_doc
+    for newid in range(project.total_news):
+        news_per_doc[project.news[newid][0]] += 1
+    first = base
+    for docid in range(project.total_doc):
+        filename = project.docs[docid]
+        entry = file_state(filename)
+        entry.update({'segment': name, 'first': first, 'count': news_per_doc[docid]})
+        manifest['files'][file_key(filename)] = entry
+        first += news_per_doc[docid]
+    manifest['segments'].append({'name': name, 'base': base, 'doc_base': doc_base,
+                                 'total_news': project.total_news, 'total_doc': project.total_doc})
+
+
+def delete_files(manifest, filenames):
+    """
+    Marca como borradas las noticias de unos ficheros ya indexados y los quita del manifiesto.
+
+    param:  "filenames": claves de los ficheros en el manifiesto (ver changed_files)
+    """
+    deleted = set(manifest['deleted'])
+    for filename in filenames:
+        entry = manifest['files'].pop(filename)
+        deleted.update(range(entry['first'], entry['first'] + entry['count']))
+    manifest['deleted'] = sorted(deleted)
+
+
+###############################
+###                         ###
+###         FUSION          ###
+###                         ###
+###############################
+
+
+def segment_level(total_news):
+    """
+    Devuelve el nivel de tamaño de un segmento: 0 por debajo de MIN_SEGMENT_NEWS noticias y uno mas
+    cada vez que se multiplica por MERGE_FACTOR.
+    """
+    if total_news < MIN_SEGMENT_NEWS:
+        return 0
+    return int(math.log(total_news / MIN_SEGMENT_NEWS, MERGE_FACTOR)) + 1
+
+
+def select_merge(segments):
+    """
+    Politica de fusion: busca MERGE_FACTOR segmentos seguidos del mismo nivel.
+
+    return: tupla (primer segmento, segmento siguiente al ultimo) a fusionar, o None si no hay que fusionar
+    """
+    levels = [segment_level(segment['total_news']) for segment in segments]
+    for i in range(len(segments) - MERGE_FACTOR + 1):
+        if all(level == levels[i] for level in levels[i:i + MERGE_FACTOR]):
+            return (i, i + MERGE_FACTOR)
+    return None
+
+
+def merge_segments(path, manifest, project_class, start, end):
+    """
+    Fusiona los segmentos consecutivos [start, end) en uno nuevo y escribe el manifiesto. Los newid y docid
+    globales no cambian, ya que el segmento nuevo tiene las noticias en el mismo orden.
+
+    param:  "path": directorio del indice
+            "manifest": manifiesto del indice
+            "project_class": clase SAR_Project, para crear los indices de los segmentos
+            "start", "end": rango de segmentos a fusionar
+
+    """
+    segments = manifest['segments'][start:end]
+    config = manifest['config']
+    merged = project_class()
+    merged.multifield = config['multifield']
+    merged.positional = config['positional']
+    merged.stemming = config['stemming']
+    merged.permuterm = config['permuterm']
+    merged.start_docstore()
+    for segment in segments:
+        part = project_class()
+        part.load_index(os.path.join(path, segment['name']))
+        # El SAR_Project leido de disco ya se comporta como un indice parcial, salvo la tabla de noticias
+        merged.merge_partial_index({'index': part.index, 'lengths': part.lengths, 'docs': part.docs,
+                                    'news': {newid: part.news[newid] for newid in range(part.total_news)},
+                                    'docstore': part.docstore.get_blocks()})
+        merged.stem_memo_path = part.stem_memo_path
+    merged.finish_index()
+
+    name = 'seg-%06d' % manifest['next_segment']
+    manifest['next_segment'] += 1
+    merged.save_index(os.path.join(path, name))
+    old_names = {segment['name'] for segment in segments}
+    for entry in manifest['files'].values():
+        if entry['segment'] in old_names:
+            entry['segment'] = name
+    manifest['segments'][start:end] = [{'name': name, 'base': segments[0]['base'],
+                                        'doc_base': segments[0]['doc_base'],
+                                        'total_news': merged.total_news, 'total_doc': merged.total_doc}]
+    write_manifest(path, manifest)
+    remove_segments(path, old_names)
+
+
+def remove_segments(path, names):
+    """
+    Borra los directorios de unos segmentos que ya no estan en el manifiesto.
+    """
+    for name in names:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+###############################
+###                         ###
+###         LECTURA         ###
+###                         ###
+###############################
+
+
+def load_segments(project, path, manifest):
+    """
+    Abre todos los segmentos del indice y los asigna a un SAR_Project como un unico indice: cada diccionario
+    del indice se sustituye por una vista que une los de los segmentos, desplazando sus newids.
+
+    param:  "project": SAR_Project en el que se carga el indice
+            "path": directorio del indice
+            "manifest": manifiesto del indice
+
+    """
+    parts = []
+    for segment in manifest['segments']:
+        part = type(project)()
+        part.load_index(os.path.join(path, segment['name']))
+        parts.append((segment, part))
+    config = manifest['config']
+    project.multifield = config['multifield']
+    project.positional = config['positional']
+    project.stemming = config['stemming']
+    project.permuterm = config['permuterm']
+    project.total_news = sum(segment['total_news'] for segment in manifest['segments'])
+    project.total_doc = sum(segment['total_doc'] for segment in manifest['segments'])
+    project.docs = {}
+    for segment, part in parts:
+        for docid, filename in part.docs.items():
+            project.docs[docid + segment['doc_base']] = filename
+    project.news = SegmentedNewsTable(parts)
+    project.docstore = SegmentedDocStore(parts)
+    for field in project.index:
+        project.index[field] = SegmentedFieldIndex([(segment['base'], part.index[field]) for segment, part in parts],
+                                                   project.positional)
+        project.bindex[field] = SegmentedBitmapIndex([(segment['base'], part.bindex[field], part.index[field])
+                                                      for segment, part in parts], project.total_news)
+        if any(len(part.sindex[field]) > 0 for _, part in parts):
+            project.sindex[field] = SegmentedStemIndex([(segment['base'], part.sindex[field])
+                                                        for segment, part in parts])
+        if any(field in part.ptindex for _, part in parts):
+            project.ptindex[field] = SegmentedPermutermIndex([part.ptindex[field] for _, part in parts
+                                                              if field in part.ptindex])
+        if all(len(part.lengths[field]) == segment['total_news'] for segment, part in parts):
+            project.lengths[field] = array('I')
+            for _, part in parts:
+                project.lengths[field].extend(part.lengths[field])
+    if all(part.dindex is not None for _, part in parts):
+        project.dindex = SegmentedDateIndex([(segment['base'], part.dindex) for segment, part in parts])
+    # El ultimo segmento tiene los stems de todos los anteriores
+    project.stem_memo_path = parts[-1][1].stem_memo_path
+
+
+def merge_keys(iterables):
+    """
+    Une varias secuencias ordenadas de claves sin repetir ninguna.
+    """
+    last = None
+    for key in heapq.merge(*iterables):
+        if key != last:
+            yield key
+            last = key
+
+
+class SegmentedFieldIndex:
+    """
+    Indice invertido de un campo repartido en segmentos, se comporta como el diccionario termino -> PostingList
+    de self.index[campo]. La posting list de un termino es la concatenacion de las de los segmentos, con los
+    newids desplazados por la base de cada segmento.
+    """
+
+    def __init__(self, parts, positional):
+        """
+        param:  "parts": lista de tuplas (base, indice del campo en el segmento), en el orden de los segmentos
+                "positional": si el indice es posicional
+        """
+        self.parts = parts
+        self.positional = positional
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            self.length = sum(1 for _ in self.keys())
+        return self.length
+
+    def __contains__(self, token):
+        return any(token in part for (_, part) in self.parts)
+
+    def __getitem__(self, token):
+        posting_list = self.get(token)
+        if posting_list is None:
+            raise KeyError(token)
+        return posting_list
+
+    def get(self, token, default=None):
+        result = None
+        for base, part in self.parts:
+            posting_list = part.get(token)
+            if posting_list is not None:
+                if result is None:
+                    result = PostingList(self.positional)
+                result.extend(posting_list, base)
+        return default if result is None else result
+
+    def keys(self):
+        return merge_keys([sorted(part.keys()) if isinstance(part, dict) else part.keys()
+                           for (_, part) in self.parts])
+
+    __iter__ = keys
+
+    def items(self):
+        return ((token, self.get(token)) for token in self.keys())
+
+    def values(self):
+        return (self.get(token) for token in self.keys())
+
+    def iter_prefix(self, prefix):
+        return merge_keys([part.iter_prefix(prefix) for (_, part) in self.parts])
+
+    def iter_range(self, low, high):
+        return merge_keys([part.iter_range(low, high) for (_, part) in self.parts])
+
+
+class SegmentedStemIndex(SegmentedFieldIndex):
+    """
+    Indice de stems de un campo repartido en segmentos, se comporta como el diccionario
+    stem -> ([terminos], posting list) de self.sindex[campo].
+    """
+
+    def __init__(self, parts):
+        super().__init__(parts, False)
+
+    def get(self, stem, default=None):
+        terms = []
+        docs = None
+        for base, part in self.parts:
+            entry = part.get(stem)
+            if entry is not None:
+                if docs is None:
+                    docs = array('I')
+                terms.extend(term for term in entry[0] if term not in terms)
+                docs.extend([newid + base for newid in entry[1]])
+        return default if docs is None else (terms, docs)
+
+
+class SegmentedBitmapIndex(SegmentedFieldIndex):
+    """
+    Bitmaps de los terminos frecuentes de un campo repartido en segmentos, se comporta como el diccionario
+    termino -> Bitmap de self.bindex[campo]. Si un termino es frecuente en algun segmento su bitmap se
+    construye con los de todos los segmentos, convirtiendo a bitmap su posting list en los que no lo es.
+    """
+
+    def __init__(self, parts, total_news):
+        """
+        param:  "parts": lista de tuplas (base, bitmaps del campo en el segmento, indice del campo en el segmento)
+                "total_news": numero total de noticias
+        """
+        super().__init__([(base, bindex) for (base, bindex, _) in parts], False)
+        self.indexes = [index for (_, _, index) in parts]
+        self.total_news = total_news
+
+    def get(self, token, default=None):
+        if not any(token in part for (_, part) in self.parts):
+            return default
+        bits = 0
+        for (base, part), index in zip(self.parts, self.indexes):
+            bitmap = part.get(token)
+            if bitmap is None:
+                posting_list = index.get(token)
+                if posting_list is None:
+                    continue
+                bitmap = Bitmap.from_postings(posting_list.docs, posting_list.docs[-1] + 1)
+            bits |= bitmap.bits << base
+        return Bitmap(bits, self.total_news)
+
+
+class SegmentedPermutermIndex:
+    """
+    Indice permuterm de un campo repartido en segmentos: recorre a la vez las rotaciones de todos ellos.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            self.length = sum(1 for _ in merge_keys(self.parts))
+        return self.length
+
+    def __iter__(self):
+        return merge_keys(self.parts)
+
+    def iter_prefix(self, prefix):
+        return merge_keys([part.iter_prefix(prefix) for part in self.parts])
+
+
+class SegmentedDateIndex:
+    """
+    Indice de fechas repartido en segmentos, se usa como SAR_dates.DateIndex. Cada segmento es un grupo de
+    particiones: los que no tienen fechas del rango se saltan sin buscar en ellos.
+    """
+
+    def __init__(self, parts):
+        """
+        param:  "parts": lista de tuplas (base, indice de fechas del segmento), en el orden de los segmentos
+        """
+        self.parts = parts
+        self.dates = list(merge_keys([part.dates for (_, part) in parts]))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def get_range(self, low=None, high=None):
+        result = array('I')
+        for base, part in self.parts:
+            if part.overlaps(low, high):
+                result.extend([newid + base for newid in part.get_range(low, high)])
+        return result
+
+    def overlaps(self, low=None, high=None):
+        return any(part.overlaps(low, high) for (_, part) in self.parts)
+
+
+class SegmentedNewsTable:
+    """
+    Tabla de noticias repartida en segmentos, se comporta como el diccionario newid -> (docid, posicion)
+    de self.news, con newids y docids globales.
+    """
+
+    def __init__(self, parts):
+        """
+        param:  "parts": lista de tuplas (segmento del manifiesto, SAR_Project del segmento)
+        """
+        self.bases = [segment['base'] for segment, _ in parts]
+        self.doc_bases = [segment['doc_base'] for segment, _ in parts]
+        self.tables = [part.news for _, part in parts]
+        self.total_news = sum(segment['total_news'] for segment, _ in parts)
+
+    def __len__(self):
+        return self.total_news
+
+    def __contains__(self, newid):
+        return 0 <= newid < self.total_news
+
+    def find(self, newid):
+        """
+        Devuelve el numero del segmento con la noticia "newid".
+        """
+        s = len(self.bases) - 1
+        while self.bases[s] > newid:
+            s -= 1
+        return s
+
+    def __getitem__(self, newid):
+        if newid not in self:
+            raise KeyError(newid)
+        s = self.find(newid)
+        docid, position = self.tables[s][newid - self.bases[s]]
+        return (docid + self.doc_bases[s], position)
+
+    def get(self, newid, default=None):
+        if newid in self:
+            return self[newid]
+        return default
+
+
+class SegmentedDocStore(SegmentedNewsTable):
+    """
+    Almacen de noticias repartido en segmentos, se usa como SAR_docstore.DocStore.
+    """
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.stores = [part.docstore for _, part in parts]
+
+    def get(self, newid):
+        if newid not in self:
+            raise KeyError(newid)
+        s = self.find(newid)
+        return self.stores[s].get(newid - self.bases[s])
+
+    def get_offsets(self, newid):
+        if newid not in self:
+            raise KeyError(newid)
+        s = self.find(newid)
+        return self.stores[s].get_offsets(newid - self.bases[s])
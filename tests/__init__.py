@@ -0,0 +1,5 @@
+"""
+Pruebas del indexador y el buscador. Se ejecutan desde la raiz del repositorio con:
+
+    python -m unittest discover tests
+"""
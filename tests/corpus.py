@@ -0,0 +1,123 @@
+"""
+Utilidades comunes de las pruebas: un corpus sintetico pequeño (ver SAR_Generator) y funciones para indexarlo
+y comparar los resultados de las consultas entre indices.
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+
+from SAR_Generator import generate_corpus
+from SAR_lib import SAR_Project, list_news_files
+
+# opciones con las que se indexa el corpus de las pruebas, todas las ampliaciones activadas
+OPTIONS = {'multifield': True, 'positional': True, 'stem': True, 'permuterm': True}
+
+# consultas con todos los tipos de operador, para comparar indices construidos de formas distintas
+QUERIES = [
+    'gobierno',
+    'precios and gobierno',
+    'precios or casa or ley',
+    'not gobierno',
+    'precios and not ley',
+    '"de la"',
+    '"de la"~3',
+    'gob*',
+    'pre?ios',
+    'title:gobierno or keywords:precios',
+    'summary:ley and not article:crisis',
+    'any:casa',
+    'gobierno and date:[2015-01-02 TO 2015-01-04]',
+    'date:[* TO 2015-01-03]',
+]
+
+
+def make_corpus(path, days=6):
+    """
+    Genera en "path" un corpus pequeño, siempre el mismo, con un fichero por dia.
+
+    return: lista de ficheros del corpus en el orden en el que se indexan
+    """
+    generate_corpus(path, days=days, news_per_day=10, article_words=80, vocabulary_size=500, seed=7)
+    return list_news_files(path)
+
+
+def copy_files(filenames, src, dst):
+    """
+    Copia unos ficheros de "src" a "dst" manteniendo su ruta relativa.
+    """
+    for filename in filenames:
+        target = os.path.join(dst, os.path.relpath(filename, src))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy(filename, target)
+
+
+def build_index(newsdir, path, **args):
+    """
+    Indexa "newsdir" en "path" como SAR_Indexer.py (ver SAR_Project.update_index) y abre el indice guardado.
+
+    param:  "args": opciones del indexador (workers, stream, append, merge...) ademas de las de OPTIONS
+
+    return: SAR_Project con el indice cargado de disco
+    """
+    options = dict(OPTIONS)
+    options.update(args)
+    with contextlib.redirect_stdout(io.StringIO()):
+        SAR_Project().update_index(newsdir, path, **options)
+    return open_index(path)
+
+
+def open_index(path):
+    """
+    Abre un indice guardado, sin cache de resultados para que cada consulta se evalue entera.
+    """
+    searcher = SAR_Project()
+    searcher.load_index(path)
+    searcher.set_cache_size(0)
+    return searcher
+
+
+def news_key(searcher, newid):
+    """
+    Identifica una noticia por su fichero y su posicion en el, que no dependen de como se numeren los newids.
+    """
+    docid, position = searcher.news[newid]
+    return (os.path.basename(searcher.docs[docid]), position)
+
+
+def query_results(searcher, queries=QUERIES, stemming=False):
+    """
+    Resuelve unas consultas.
+
+    return: diccionario consulta -> lista ordenada de las noticias del resultado (ver "news_key")
+    """
+    searcher.set_stemming(stemming)
+    return {query: sorted(news_key(searcher, newid) for newid in searcher.solve_query(query)) for query in queries}
+
+
+def ranked_results(searcher, queries):
+    """
+    Resuelve y rankea unas consultas, mostrando todos los resultados.
+
+    return: diccionario consulta -> lista de tuplas (puntuacion redondeada, noticia) ordenada
+    """
+    searcher.set_ranking(True)
+    searcher.set_showall(True)
+    results = {}
+    for query in queries:
+        items = searcher.search(query)['results']
+        results[query] = sorted((round(item['score'], 6), news_key(searcher, item['newid'])) for item in items)
+    return results
+
+
+def edit_news(filename, text):
+    """
+    Añade un texto al articulo de la primera noticia de un fichero.
+    """
+    with open(filename, encoding='utf-8') as fh:
+        news = json.load(fh)
+    news[0]['article'] += ' ' + text
+    with open(filename, 'w', encoding='utf-8') as fh:
+        json.dump(news, fh, ensure_ascii=False)
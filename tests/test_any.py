@@ -0,0 +1,88 @@
+"""
+Pseudo-campo any (ver SAR_query.expand_any) y or de varios operandos en una sola pasada
+(ver SAR_Project.merge_postings).
+"""
+
+from array import array
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from SAR_iterators import collect
+from SAR_lib import SAR_Project
+from SAR_postings import Bitmap, to_array
+from SAR_query import expand_any
+from tests.corpus import build_index, make_corpus
+
+
+class ExpandAnyTest(unittest.TestCase):
+
+    def test_expand(self):
+        fields = ('title', 'article')
+        self.assertEqual(expand_any(('term', 'any:casa'), fields),
+                         ('or', (('term', 'title:casa'), ('term', 'article:casa'))))
+        self.assertEqual(expand_any(('not', ('term', 'any:"a b"~3')), fields),
+                         ('not', ('or', (('term', 'title:"a b"~3'), ('term', 'article:"a b"~3')))))
+        # Los terminos de otros campos no cambian
+        node = ('and', (('term', 'casa'), ('term', 'title:ley')))
+        self.assertEqual(expand_any(node, fields), node)
+
+
+class MergePostingsTest(unittest.TestCase):
+
+    def test_merge(self):
+        rng = random.Random(24)
+        searcher = SAR_Project()
+        searcher.total_news = 300
+        for _ in range(100):
+            sets = [frozenset(rng.sample(range(300), rng.choice([0, 1, 20, 150]))) for _ in range(rng.randint(1, 8))]
+            postings = [Bitmap.from_postings(sorted(docs), 300) if rng.random() < 0.3 else array('I', sorted(docs))
+                        for docs in sets]
+            self.assertEqual(list(searcher.merge_postings(postings)), sorted(frozenset.union(*sets)))
+
+
+class AnyFieldTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def solve(self, query):
+        return list(to_array(self.searcher.solve_query(query)))
+
+    def test_same_as_or(self):
+        # any:t es el or de t en todos los campos tokenizados, con cualquier tipo de termino
+        fields = [field for (field, tokenize) in SAR_Project.fields if tokenize]
+        for stemming in [False, True]:
+            self.searcher.set_stemming(stemming)
+            for term in ['gobierno', 'casas', '"de la"', 'gob*', 'ca?a', '"de la"~2', 'noexiste']:
+                explicit = ' or '.join('%s:%s' % (field, term) for field in fields)
+                for query, expected in [('any:' + term, explicit), ('not any:' + term, 'not (%s)' % explicit),
+                                        ('any:%s and not ley' % term, '(%s) and not ley' % explicit)]:
+                    result = self.solve(query)
+                    self.assertEqual(result, self.solve(expected), (stemming, query))
+                    self.assertEqual(list(collect(self.searcher.iterate_query(query))), result, (stemming, query))
+
+    def test_text(self):
+        # Sin stemming, any:t son las noticias con t en el texto de alguno de los campos tokenizados
+        searcher = self.searcher
+        searcher.set_stemming(False)
+        fields = [field for (field, tokenize) in SAR_Project.fields if tokenize]
+        for term in ['gobierno', 'ley', 'de']:
+            expected = [newid for newid in range(searcher.total_news)
+                        if any(term in searcher.tokenize(searcher.get_news_item(newid)[field]) for field in fields)]
+            self.assertGreater(len(expected), 0)
+            self.assertEqual(self.solve('any:' + term), expected, term)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Caches de consultas (ver SAR_cache): la cache LRU y la cache de resultados de SAR_Project, que no debe devolver
+resultados calculados con otro modo de stemming o con otro indice.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from SAR_cache import LRUCache
+from SAR_disk import DiskFieldIndex
+from tests.corpus import QUERIES, build_index, make_corpus, open_index, query_results
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_resize(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache.put(key, key)
+        cache.resize(1)
+        self.assertEqual(list(cache.entries), ['c'])
+        cache.resize(0)
+        cache.put('d', 'd')
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('d'))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.index = os.path.join(cls.tmp, 'index')
+        build_index(newsdir, cls.index)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def cached_index(self):
+        searcher = open_index(self.index)
+        searcher.set_cache_size(1000)
+        return searcher
+
+    def test_same_results(self):
+        # Las consultas repetidas salen de la cache y dan lo mismo que sin cache
+        reference = open_index(self.index)
+        searcher = self.cached_index()
+        for stemming in [False, True, False]:
+            self.assertEqual(query_results(searcher, QUERIES, stemming), query_results(reference, QUERIES, stemming))
+        self.assertGreater(searcher.result_cache.stats()['hits'], 0)
+
+    def test_stemming_change(self):
+        # Los resultados de la cache no se reutilizan si cambia el modo de stemming
+        reference = open_index(self.index)
+        queries = ['precios', 'gobierno and precios', 'title:ley or casa', 'not precios']
+        without = query_results(reference, queries, False)
+        with_stemming = query_results(reference, queries, True)
+        self.assertNotEqual(without, with_stemming)
+        searcher = self.cached_index()
+        for _ in range(2):
+            self.assertEqual(query_results(searcher, queries, False), without)
+            self.assertEqual(query_results(searcher, queries, True), with_stemming)
+
+    def test_keys(self):
+        searcher = self.cached_index()
+        searcher.set_stemming(False)
+        searcher.solve_query('gobierno')
+        # Los terminos simples no se guardan en la cache de resultados, sino ya decodificados en el indice
+        self.assertEqual(len(searcher.result_cache), 0)
+        field_index = searcher.index['article']
+        self.assertIsInstance(field_index, DiskFieldIndex)
+        self.assertIs(field_index.get('gobierno'), field_index.get('gobierno'))
+        searcher.solve_query('gobierno and precios')
+        searcher.solve_query('  Gobierno  AND precios')
+        self.assertEqual(searcher.result_cache.stats()['hits'], 1)
+        searcher.set_stemming(True)
+        searcher.solve_query('gobierno and precios')
+        self.assertEqual(searcher.result_cache.stats()['hits'], 1)
+        keys = list(searcher.result_cache.entries)
+        self.assertEqual({key[1] for key in keys}, {False, True})
+
+    def test_new_index(self):
+        # Al cargar otro indice cambia la generacion y no se usan los resultados anteriores
+        searcher = self.cached_index()
+        searcher.solve_query('gobierno and precios')
+        searcher.load_index(self.index)
+        searcher.solve_query('gobierno and precios')
+        self.assertEqual(searcher.result_cache.stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Las distintas formas de construir el indice (en paralelo con -W, --stream y --append) tienen que dar los mismos
+resultados que una indexacion en serie normal.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from SAR_lib import SAR_Project
+from tests.corpus import (OPTIONS, QUERIES, build_index, copy_files, edit_news, make_corpus, query_results,
+                          open_index, ranked_results)
+
+# consultas para comparar los resultados rankeados con BM25
+RANKED_QUERIES = ['gobierno', 'precios or casa', '"de la"', 'gob* and not ley', 'title:gobierno']
+
+
+def segment_files(path):
+    """
+    Lee los ficheros del unico segmento de un indice.
+
+    return: diccionario nombre del fichero -> contenido
+    """
+    names = [name for name in os.listdir(path) if name.startswith('seg-')]
+    assert len(names) == 1, names
+    segment = os.path.join(path, names[0])
+    files = {}
+    for name in sorted(os.listdir(segment)):
+        with open(os.path.join(segment, name), 'rb') as fh:
+            files[name] = fh.read()
+    return files
+
+
+class ConsistencyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        cls.newsdir = os.path.join(cls.tmp, 'news')
+        cls.filenames = make_corpus(cls.newsdir)
+        cls.serial_path = os.path.join(cls.tmp, 'serial')
+        cls.serial = build_index(cls.newsdir, cls.serial_path)
+        cls.expected = query_results(cls.serial)
+        cls.expected_stems = query_results(cls.serial, stemming=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def assertSameResults(self, searcher):
+        self.assertEqual(query_results(searcher), self.expected)
+        self.assertEqual(query_results(searcher, stemming=True), self.expected_stems)
+
+    def test_queries_have_results(self):
+        # Sin resultados la comparacion no comprobaria nada
+        for query in QUERIES:
+            self.assertTrue(self.expected[query], query)
+
+    def test_workers(self):
+        path = os.path.join(self.tmp, 'workers')
+        self.assertSameResults(build_index(self.newsdir, path, workers=3))
+        # Los ficheros del indice son identicos byte a byte (se comparan por nombre para no mostrar su contenido)
+        files = segment_files(path)
+        serial_files = segment_files(self.serial_path)
+        self.assertEqual(sorted(files), sorted(serial_files))
+        self.assertEqual([name for name in files if files[name] != serial_files[name]], [])
+
+    def test_workers_term_order(self):
+        # Los terminos de cada campo quedan en el orden de aparicion tambien al fusionar en paralelo, que es el orden
+        # de los terminos de cada stem en el indice de stems
+        vocabularies = []
+        for workers in (1, 3):
+            indexer = SAR_Project()
+            with contextlib.redirect_stdout(io.StringIO()):
+                indexer.index_dir(self.newsdir, workers=workers, **OPTIONS)
+            vocabularies.append({field: list(field_index) for field, field_index in indexer.index.items()})
+        self.assertEqual(vocabularies[1], vocabularies[0])
+
+    def test_stream(self):
+        self.assertSameResults(build_index(self.newsdir, os.path.join(self.tmp, 'stream'), stream=True))
+
+    def test_stream_workers(self):
+        path = os.path.join(self.tmp, 'stream_workers')
+        self.assertSameResults(build_index(self.newsdir, path, stream=True, workers=2))
+
+    def test_append(self):
+        newsdir = os.path.join(self.tmp, 'append_news')
+        path = os.path.join(self.tmp, 'append')
+        half = len(self.filenames) // 2
+        copy_files(self.filenames[:half], self.newsdir, newsdir)
+        build_index(newsdir, path)
+        copy_files(self.filenames[half:], self.newsdir, newsdir)
+        searcher = build_index(newsdir, path, append=True)
+        self.assertEqual(query_results(searcher), self.expected)
+        self.assertEqual(query_results(searcher, stemming=True), self.expected_stems)
+        self.assertEqual(ranked_results(searcher, RANKED_QUERIES), ranked_results(self.serial, RANKED_QUERIES))
+        # Fusionando todos los segmentos en uno se obtiene lo mismo
+        merged = build_index(newsdir, path, append=True, merge=True)
+        self.assertEqual(query_results(merged), self.expected)
+
+    def test_append_changed_files(self):
+        # Un fichero modificado y otro borrado: el indice actualizado tiene que ser como uno creado de nuevo,
+        # tambien en las puntuaciones de BM25, que no pueden contar las noticias borradas
+        newsdir = os.path.join(self.tmp, 'changed_news')
+        path = os.path.join(self.tmp, 'changed')
+        copy_files(self.filenames, self.newsdir, newsdir)
+        build_index(newsdir, path)
+        edited, removed = [os.path.join(newsdir, os.path.relpath(filename, self.newsdir))
+                           for filename in self.filenames[1:3]]
+        edit_news(edited, 'gobierno gobierno precios')
+        os.remove(removed)
+        searcher = build_index(newsdir, path, append=True)
+        fresh = build_index(newsdir, os.path.join(self.tmp, 'fresh'))
+        self.assertEqual(query_results(searcher), query_results(fresh))
+        self.assertEqual(query_results(searcher, stemming=True), query_results(fresh, stemming=True))
+        self.assertEqual(ranked_results(searcher, RANKED_QUERIES), ranked_results(fresh, RANKED_QUERIES))
+        # Las estadisticas solo cuentan las noticias y los dias que siguen en el indice (un fichero por dia)
+        stats = io.StringIO()
+        with contextlib.redirect_stdout(stats):
+            searcher.show_stats()
+        self.assertIn('Number of indexed days: %d\n' % (len(self.filenames) - 1), stats.getvalue())
+        self.assertIn('Number of indexed news: %d\n' % fresh.total_news, stats.getvalue())
+
+    def test_append_same_files_other_path(self):
+        # El mismo directorio con otra ruta ("news" y "./news") tiene los mismos ficheros: no se vuelve a indexar nada
+        path = os.path.join(self.tmp, 'other_path')
+        build_index(self.newsdir, path)
+        other = os.path.join(self.tmp, '.', 'x', '..', 'news')
+        os.makedirs(os.path.join(self.tmp, 'x'), exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            n_files = SAR_Project().update_index(other, path, append=True, **OPTIONS)
+        self.assertEqual(n_files, 0)
+        searcher = open_index(path)
+        self.assertEqual(len(searcher.deleted), 0)
+        self.assertEqual(query_results(searcher), self.expected)
+
+    def test_empty_newsdir(self):
+        # Un indice sin noticias se puede abrir y actualizar, y no tiene resultados
+        newsdir = os.path.join(self.tmp, 'empty_news')
+        os.makedirs(newsdir)
+        path = os.path.join(self.tmp, 'empty')
+        build_index(newsdir, path)
+        searcher = build_index(newsdir, path, append=True)
+        self.assertEqual(searcher.stemming, OPTIONS['stem'])
+        self.assertEqual(query_results(searcher), {query: [] for query in QUERIES})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Indice de fechas (ver SAR_dates): rangos de fechas en los limites y particiones de noticias.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from SAR_dates import PARTITION_MIN, DateIndex
+from SAR_iterators import collect
+from SAR_postings import PostingList, to_array
+from SAR_query import parse_range
+from tests.corpus import build_index, make_corpus
+
+
+def date_index(news_dates):
+    """
+    Construye el indice de fechas de unas noticias a partir de la fecha de cada una, como al indexar.
+    """
+    field_index = {}
+    for newid, date in enumerate(news_dates):
+        field_index.setdefault(date, PostingList()).add(newid)
+    return DateIndex.from_postings(field_index, len(news_dates))
+
+
+def random_news_dates(rng):
+    """
+    Fechas de noticias en bloques, como en ficheros de un dia, con algun bloque desordenado o mezclado.
+    """
+    days = ['2015-%02d-%02d' % (month, day) for month in (1, 2) for day in range(1, 29, 3)]
+    news_dates = []
+    while len(news_dates) < 300:
+        if rng.random() < 0.2:
+            news_dates.extend(rng.choice(days) for _ in range(rng.randint(1, 20)))
+        else:
+            news_dates.extend([rng.choice(days)] * rng.randint(1, 40))
+    return news_dates, days
+
+
+class DateIndexTest(unittest.TestCase):
+
+    def test_ranges(self):
+        rng = random.Random(25)
+        for _ in range(20):
+            news_dates, days = random_news_dates(rng)
+            index = date_index(news_dates)
+            # Limites que son fechas del indice, que estan entre dos fechas, antes de la primera y despues de la ultima
+            bounds = [None, '2014-12-31', '2015-01-01', '2015-01-02', '2015-01-28', '2015-02-01', '2015-02-15',
+                      '2015-02-28', '2016-01-01'] + rng.sample(days, 4)
+            for low in bounds:
+                for high in bounds:
+                    expected = [newid for newid, date in enumerate(news_dates)
+                                if (low is None or date >= low) and (high is None or date <= high)]
+                    self.assertEqual(list(index.get_range(low, high)), expected, (low, high))
+
+    def test_partitions(self):
+        rng = random.Random(26)
+        for _ in range(20):
+            news_dates, days = random_news_dates(rng)
+            index = date_index(news_dates)
+            partitions = list(index.partitions())
+            self.assertEqual(partitions[0][0], 0)
+            self.assertEqual(partitions[-1][1], len(news_dates))
+            for (start, end, first, last), following in zip(partitions, partitions[1:] + [None]):
+                ordinals = [index.dates.index(date) for date in news_dates[start:end]]
+                self.assertEqual((first, last), (min(ordinals), max(ordinals)))
+                if following is not None:
+                    # Las particiones son consecutivas y solo se cierran con PARTITION_MIN noticias al cambiar de fecha
+                    self.assertEqual(end, following[0])
+                    self.assertGreaterEqual(end - start, PARTITION_MIN)
+                    self.assertNotEqual(news_dates[end - 1], news_dates[end])
+            self.assertLessEqual(len(partitions), len(news_dates) // PARTITION_MIN + 1)
+
+    def test_single_date(self):
+        index = date_index(['2015-01-01'] * 40)
+        self.assertEqual(len(list(index.partitions())), 1)
+        self.assertEqual(list(index.get_range('2015-01-01', '2015-01-01')), list(range(40)))
+        self.assertEqual(list(index.get_range('2015-01-02', None)), [])
+        self.assertTrue(index.overlaps(None, '2015-01-01'))
+        self.assertFalse(index.overlaps('2015-01-02', None))
+        self.assertFalse(date_index([]).overlaps())
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('[2015-01-01 to 2015-02-01]'), ('2015-01-01', '2015-02-01'))
+        self.assertEqual(parse_range('[* to 2015-02-01]'), (None, '2015-02-01'))
+        self.assertEqual(parse_range('[2015-01-01 to *]'), ('2015-01-01', None))
+        for text in ['[2015-01-01]', '[2015-01-01 to]', '2015-01-01 to 2015-02-01']:
+            with self.assertRaises(ValueError):
+                parse_range(text)
+
+
+class DateQueryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_queries(self):
+        # Un rango es el or de todas sus fechas, tambien combinado con otros terminos y en la evaluacion perezosa
+        searcher = self.searcher
+        dates = sorted(searcher.index['date'].keys())
+        bounds = ['*', '2014-12-31', '2099-01-01'] + dates
+        for low in bounds:
+            for high in bounds:
+                selected = [d for d in dates if (low == '*' or d >= low) and (high == '*' or d <= high)]
+                for extra in ['', ' and gobierno', ' and not ley', ' or title:casa']:
+                    query = 'date:[%s TO %s]%s' % (low, high, extra)
+                    explicit = '(%s)%s' % (' or '.join('date:' + d for d in selected), extra) if selected else None
+                    result = list(to_array(searcher.solve_query(query)))
+                    if explicit is not None:
+                        self.assertEqual(result, list(to_array(searcher.solve_query(explicit))), query)
+                    elif extra.startswith(' or'):
+                        self.assertEqual(result, list(to_array(searcher.solve_query(extra[4:]))), query)
+                    else:
+                        self.assertEqual(result, [], query)
+                    self.assertEqual(list(collect(searcher.iterate_query(query))), result, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
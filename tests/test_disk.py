@@ -0,0 +1,143 @@
+"""
+Formato del indice en disco (ver SAR_disk): un indice guardado y vuelto a abrir tiene que ser igual que el
+indice en memoria con el que se guardo.
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import SAR_disk
+from SAR_lib import SAR_Project
+from tests.corpus import OPTIONS, make_corpus
+
+
+class DiskIndexTest(unittest.TestCase):
+
+    options = OPTIONS
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        cls.newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(cls.newsdir)
+        cls.memory = SAR_Project()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.memory.index_dir(cls.newsdir, **cls.options)
+        cls.path = os.path.join(cls.tmp, 'index')
+        os.makedirs(cls.path)
+        cls.memory.save_index(cls.path)
+        cls.disk = SAR_Project()
+        cls.disk.load_index(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def fields(self):
+        return [field for field in self.memory.fields_names if len(self.memory.index[field]) > 0]
+
+    def test_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), encoding='utf-8') as fh:
+            self.assertEqual(json.load(fh)['version'], SAR_disk.FORMAT_VERSION)
+        self.assertEqual(self.disk.total_news, self.memory.total_news)
+        self.assertEqual(self.disk.total_doc, self.memory.total_doc)
+        self.assertEqual(self.disk.positional, self.memory.positional)
+        self.assertEqual(self.disk.docs, self.memory.docs)
+
+    def test_news_table(self):
+        for newid in range(self.memory.total_news):
+            self.assertEqual(tuple(self.disk.news[newid]), tuple(self.memory.news[newid]))
+
+    def test_postings(self):
+        for field in self.fields():
+            memory_index = self.memory.index[field]
+            disk_index = self.disk.index[field]
+            self.assertEqual(sorted(disk_index.keys()), sorted(memory_index.keys()))
+            for token, posting_list in memory_index.items():
+                decoded = disk_index[token]
+                self.assertEqual(decoded.docs, posting_list.docs, (field, token))
+                self.assertEqual(decoded.count, posting_list.count)
+                self.assertEqual(decoded.get_freqs(), posting_list.get_freqs())
+                if self.memory.positional:
+                    self.assertEqual(decoded.positions, posting_list.positions)
+                    self.assertEqual(decoded.offsets, posting_list.offsets)
+            self.assertNotIn('palabra que no esta', disk_index)
+
+    def test_prefix_scan(self):
+        # El diccionario de terminos esta ordenado y comprimido por prefijos
+        for field in self.fields():
+            terms = sorted(self.memory.index[field].keys())
+            for prefix in ('g', 'pre', 'z', ''):
+                self.assertEqual(list(self.disk.index[field].iter_prefix(prefix)),
+                                 [term for term in terms if term.startswith(prefix)])
+
+    def test_bitmaps(self):
+        for field in self.fields():
+            self.assertEqual(sorted(self.disk.bindex[field].keys()), sorted(self.memory.bindex[field].keys()))
+            for token, bitmap in self.memory.bindex[field].items():
+                self.assertEqual(list(self.disk.bindex[field][token]), list(bitmap))
+
+    def test_lengths(self):
+        for field in self.fields():
+            self.assertEqual(list(self.disk.lengths[field]), list(self.memory.lengths[field]))
+
+    def test_stems(self):
+        if not self.memory.stemming:
+            self.skipTest('index without stems')
+        for field in self.fields():
+            self.assertEqual(sorted(self.disk.sindex[field].keys()), sorted(self.memory.sindex[field].keys()))
+            for stem, (terms, docs) in self.memory.sindex[field].items():
+                disk_terms, disk_docs = self.disk.sindex[field][stem]
+                self.assertEqual(list(disk_terms), list(terms))
+                self.assertEqual(list(disk_docs), list(docs))
+
+    def test_permuterm(self):
+        if not self.memory.permuterm:
+            self.skipTest('index without permuterm')
+        for field in self.fields():
+            for pattern in ('gob*', '*os', 'p?ecio*', 'c*s*'):
+                self.assertEqual(sorted(self.disk.wildcard_terms(pattern, field)),
+                                 sorted(self.memory.wildcard_terms(pattern, field)))
+
+    def test_dates(self):
+        if not self.memory.multifield:
+            self.skipTest('index without date field')
+        self.assertEqual(list(self.disk.dindex.dates), list(self.memory.dindex.dates))
+        dates = self.memory.dindex.dates
+        for low, high in [(None, None), (dates[1], dates[3]), (dates[-1], None), ('2000-01-01', '2000-12-31')]:
+            self.assertEqual(list(self.disk.dindex.get_range(low, high)),
+                             list(self.memory.dindex.get_range(low, high)))
+
+    def test_docstore(self):
+        for newid in range(self.memory.total_news):
+            docid, position = self.memory.news[newid]
+            with open(self.memory.docs[docid], encoding='utf-8') as fh:
+                self.assertEqual(self.disk.get_news_item(newid), json.load(fh)[position])
+
+    def test_unsupported_version(self):
+        path = os.path.join(self.tmp, 'old_index')
+        shutil.copytree(self.path, path)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as fh:
+            meta = json.load(fh)
+        meta['version'] = SAR_disk.FORMAT_VERSION - 1
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as fh:
+            json.dump(meta, fh)
+        with self.assertRaises(ValueError):
+            SAR_Project().load_index(path)
+
+
+class BasicDiskIndexTest(DiskIndexTest):
+    """
+    Igual que DiskIndexTest con un indice de la version basica: solo el articulo y sin posiciones.
+    """
+
+    options = {'multifield': False, 'positional': False, 'stem': False, 'permuterm': False}
+
+
+if __name__ == '__main__':
+    unittest.main()
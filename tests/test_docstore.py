@@ -0,0 +1,145 @@
+"""
+Almacen de noticias (ver SAR_docstore): lectura de lo escrito, fusion de almacenes parciales y noticias mostradas
+por solve_and_show.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from SAR_docstore import BLOCK_SIZE, DocStore, DocStoreWriter
+from SAR_lib import SAR_Project
+from tests.corpus import build_index, make_corpus
+
+
+def make_news(newid):
+    text = 'noticia %d con ñ y acentos: canción' % newid
+    news = {'title': 'Titulo %d' % newid, 'date': '2015-01-%02d' % (newid % 28 + 1), 'keywords': 'k%d' % newid,
+            'article': text, 'summary': text[:10]}
+    offsets = {'article': [0, 8, 8 + len(str(newid)) + 1], 'title': [0, 7]}
+    return news, offsets
+
+
+class DocStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='sar_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, writer):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(path)
+        writer.save(path)
+        return path
+
+    def read_files(self, path):
+        with open(os.path.join(path, 'docs.bin'), 'rb') as fh:
+            data = fh.read()
+        with open(os.path.join(path, 'docs.idx'), 'rb') as fh:
+            return data, fh.read()
+
+    def test_round_trip(self):
+        n = 3 * BLOCK_SIZE + 5
+        writer = DocStoreWriter()
+        for newid in range(n):
+            writer.add(newid, *make_news(newid))
+        store = DocStore(self.write('store', writer), cache_size=2)
+        self.assertEqual(len(store.starts), 4)
+        # En orden inverso para que los bloques salgan y vuelvan a entrar en la cache
+        for newid in reversed(range(n)):
+            news, offsets = make_news(newid)
+            self.assertEqual(store.get(newid), news)
+            self.assertEqual(store.get_offsets(newid), offsets)
+        with self.assertRaises(IndexError):
+            store.get(n)
+
+    def test_append_blocks_same_as_serial(self):
+        # Almacenes parciales como los de la indexacion en paralelo: cada uno numera sus noticias desde 0
+        sizes = [BLOCK_SIZE + 3, 5, 2 * BLOCK_SIZE, BLOCK_SIZE - 1, 1]
+        serial = DocStoreWriter()
+        merged = DocStoreWriter()
+        newid = 0
+        for size in sizes:
+            partial = DocStoreWriter(io.BytesIO())
+            for local in range(size):
+                serial.add(newid + local, *make_news(newid + local))
+                partial.add(local, *make_news(newid + local))
+            merged.append_blocks(partial.get_blocks(), newid)
+            newid += size
+        self.assertEqual(self.read_files(self.write('merged', merged)), self.read_files(self.write('serial', serial)))
+
+    def test_append_blocks_from_store(self):
+        # Al fusionar segmentos se copian los bloques de almacenes ya guardados
+        first = DocStoreWriter()
+        for newid in range(BLOCK_SIZE + 7):
+            first.add(newid, *make_news(newid))
+        second = DocStoreWriter()
+        for newid in range(2 * BLOCK_SIZE):
+            second.add(newid, *make_news(BLOCK_SIZE + 7 + newid))
+        serial = DocStoreWriter()
+        for newid in range(3 * BLOCK_SIZE + 7):
+            serial.add(newid, *make_news(newid))
+        merged = DocStoreWriter()
+        merged.append_blocks(DocStore(self.write('first', first)).get_blocks(), 0)
+        merged.append_blocks(DocStore(self.write('second', second)).get_blocks(), BLOCK_SIZE + 7)
+        path = self.write('merged', merged)
+        self.assertEqual(self.read_files(path), self.read_files(self.write('serial', serial)))
+        store = DocStore(path)
+        for newid in range(3 * BLOCK_SIZE + 7):
+            self.assertEqual(store.get(newid), make_news(newid)[0])
+
+
+class ShowTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def show(self, query, lazy=False, showall=False):
+        self.searcher.set_lazy(lazy)
+        self.searcher.set_showall(showall)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.searcher.solve_and_show(query)
+        return output.getvalue().split('\n')
+
+    def test_separators(self):
+        # Hay un separador entre cada dos noticias mostradas, y ninguno despues de la ultima
+        query = 'not gobierno'
+        n_results = len(self.searcher.solve_query(query))
+        self.assertGreater(n_results, SAR_Project.SHOW_MAX)
+        for lazy, showall, shown in [(False, False, SAR_Project.SHOW_MAX), (True, False, SAR_Project.SHOW_MAX),
+                                     (False, True, n_results)]:
+            with self.subTest(lazy=lazy, showall=showall):
+                lines = self.show(query, lazy, showall)
+                self.assertEqual(sum(1 for line in lines if line.startswith('#')), shown)
+                self.assertEqual(lines.count('-' * 20), shown - 1)
+                self.assertEqual(lines[-3:], ['Keywords: ' + self.last_keywords(query, shown), '=' * 40, ''])
+
+    def last_keywords(self, query, shown):
+        newid = list(self.searcher.solve_query(query))[shown - 1]
+        return self.searcher.get_news_item(newid)['keywords']
+
+    def test_shown_news(self):
+        # Las noticias se leen del almacen, en el orden de los resultados
+        lines = self.show('gobierno', showall=True)
+        newids = [int(lines[i + 2]) for i in range(len(lines)) if lines[i].startswith('#')]
+        self.assertEqual(newids, list(self.searcher.solve_query('gobierno')))
+        titles = [line[len('Title: '):] for line in lines if line.startswith('Title: ')]
+        self.assertEqual(titles, [self.searcher.get_news_item(newid)['title'] for newid in newids])
+
+
+if __name__ == '__main__':
+    unittest.main()
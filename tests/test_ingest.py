@@ -0,0 +1,57 @@
+"""
+Lectura de ficheros de noticias por bloques (ver SAR_lib.iter_json_array), comparada con json.loads.
+"""
+
+import io
+import json
+import unittest
+
+from SAR_lib import iter_json_array
+
+
+ITEMS = [
+    {'id': 1, 'title': 'Cierre ] del array', 'article': 'texto con [corchetes], comas y "comillas"'},
+    {'id': 22, 'title': '\\]', 'article': 'ñandú, acentos á é í y €'},
+    [], {}, [[]], '', ']', '[', ',', 123456789, -0.5, 1e10, True, None,
+    {'nested': {'a': [1, [2, ']'], {'b': '}'}]}},
+]
+
+
+def parse(text, chunk_size):
+    return list(iter_json_array(io.StringIO(text), chunk_size))
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def test_split_buffers(self):
+        # Con cualquier tamaño de bloque los elementos quedan partidos en posiciones distintas
+        for text in [json.dumps(ITEMS), json.dumps(ITEMS, indent=4), json.dumps(ITEMS, separators=(',', ':'))]:
+            for chunk_size in [1, 2, 3, 5, 7, 16, 1 << 16]:
+                with self.subTest(chunk_size=chunk_size):
+                    self.assertEqual(parse(text, chunk_size), ITEMS)
+
+    def test_numbers_at_chunk_end(self):
+        # Un numero al final del buffer podria continuar en el siguiente bloque, tambien si se corta en el punto
+        # o en el exponente
+        for chunk_size in range(1, 12):
+            self.assertEqual(parse('[123456789, 42,7, -0.25,1.5e-3 ,2E+2]', chunk_size),
+                             [123456789, 42, 7, -0.25, 1.5e-3, 2e2])
+
+    def test_empty(self):
+        for text in ['[]', '[ ]', ' \n[\n]\n', '']:
+            for chunk_size in [1, 2, 1 << 16]:
+                self.assertEqual(parse(text, chunk_size), [])
+
+    def test_stops_at_end_of_array(self):
+        self.assertEqual(parse('[1, 2] basura', 2), [1, 2])
+
+    def test_errors(self):
+        for text in ['{"a": 1}', '1', '[1, 2', '[{"title": "sin cerrar', '[', '[1, {]']:
+            for chunk_size in [1, 4, 1 << 16]:
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        parse(text, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Evaluacion perezosa con iteradores (ver SAR_iterators): da las mismas noticias que la evaluacion con posting
+lists completas, tambien si solo se piden las primeras o se salta con advance_to.
+"""
+
+from array import array
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from SAR_iterators import (AndIterator, BitmapIterator, MinusIterator, NotIterator, OrIterator, PostingIterator,
+                           collect)
+from SAR_postings import Bitmap, to_array
+from tests.corpus import QUERIES, build_index, make_corpus
+
+TOTAL = 200
+
+
+def random_tree(rng, depth=0):
+    """
+    Devuelve una funcion que construye un iterador al azar, y el conjunto de noticias que debe recorrer.
+    """
+    choice = rng.random()
+    if depth >= 3 or choice < 0.3:
+        docs = sorted(rng.sample(range(TOTAL), rng.choice([0, 1, 10, 60, 180])))
+        if rng.random() < 0.5:
+            return (lambda: PostingIterator(array('I', docs))), frozenset(docs)
+        return (lambda: BitmapIterator(Bitmap.from_postings(docs, TOTAL))), frozenset(docs)
+    if choice < 0.45:
+        build, docs = random_tree(rng, depth + 1)
+        return (lambda: NotIterator(build(), TOTAL)), frozenset(range(TOTAL)) - docs
+    children = [random_tree(rng, depth + 1) for _ in range(rng.randint(2, 3))]
+    sets = [docs for build, docs in children]
+    if choice < 0.65:
+        return (lambda: AndIterator([build() for build, docs in children])), frozenset.intersection(*sets)
+    if choice < 0.85:
+        return (lambda: OrIterator([build() for build, docs in children])), frozenset.union(*sets)
+    return ((lambda: MinusIterator(children[0][0](), [build() for build, docs in children[1:]])),
+            sets[0] - frozenset.union(*sets[1:]))
+
+
+class IteratorTest(unittest.TestCase):
+
+    def test_random_trees(self):
+        rng = random.Random(22)
+        for _ in range(300):
+            build, docs = random_tree(rng)
+            expected = sorted(docs)
+            self.assertEqual(list(collect(build())), expected)
+            self.assertEqual(list(collect(build(), 5)), expected[:5])
+            # Saltos con advance_to: cada salto deja el iterador en la primera noticia mayor o igual
+            iterator = build()
+            target = 0
+            while target < TOTAL + 5:
+                newid = iterator.advance_to(target)
+                following = [n for n in expected if n >= target]
+                self.assertEqual(newid, following[0] if following else None)
+                target += rng.randint(1, 30)
+
+
+class LazyQueryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def queries(self):
+        rng = random.Random(23)
+        words = ['de', 'la', 'casa', 'gobierno', 'precios', 'ley', 'crisis', 'el']
+        queries = list(QUERIES)
+        for _ in range(150):
+            operands = ['%s', 'not %s', '"%s %s"', 'title:%s', '"%s %s"~2', '%.2s*', 'any:%s']
+            query = ''
+            for i in range(rng.randint(1, 4)):
+                operand = rng.choice(operands)
+                operand = operand % tuple(rng.choice(words) for _ in range(operand.count('%')))
+                query = operand if i == 0 else '%s %s %s' % (query, rng.choice(['and', 'or', 'and not']), operand)
+            if rng.random() < 0.3:
+                query = '(%s) and %s' % (query, rng.choice(words))
+            queries.append(query)
+        return queries
+
+    def check(self):
+        searcher = self.searcher
+        for stemming in [False, True]:
+            searcher.set_stemming(stemming)
+            for query in self.queries():
+                expected = list(to_array(searcher.solve_query(query)))
+                self.assertEqual(list(collect(searcher.iterate_query(query))), expected, (stemming, query))
+                self.assertEqual(list(collect(searcher.iterate_query(query), 10)), expected[:10], (stemming, query))
+
+    def test_queries(self):
+        self.check()
+
+    def test_deleted(self):
+        # Las noticias borradas se quitan tambien de los resultados perezosos
+        searcher = self.searcher
+        deleted = searcher.deleted
+        try:
+            searcher.deleted = array('I', range(0, searcher.total_news, 3))
+            self.check()
+        finally:
+            searcher.deleted = deleted
+
+
+if __name__ == '__main__':
+    unittest.main()
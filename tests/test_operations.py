@@ -0,0 +1,111 @@
+"""
+Operaciones entre posting lists de SAR_Project (and, or, not y diferencia) con arrays, complementos y bitmaps,
+comparadas con las mismas operaciones sobre conjuntos.
+"""
+
+from array import array
+import random
+import unittest
+
+from SAR_lib import SAR_Project
+from SAR_postings import Bitmap, Complement
+
+TOTAL = 300
+
+
+def random_docs(rng):
+    # Longitudes muy distintas para pasar tambien por el cruce con galloping
+    size = rng.choice([0, 1, 5, 40, 150, 290])
+    return frozenset(rng.sample(range(TOTAL), size))
+
+
+class OperationsTest(unittest.TestCase):
+    """
+    Cada operando se prueba en todas sus representaciones, que se obtienen con "forms" a partir del conjunto
+    de noticias que debe contener.
+    """
+
+    def setUp(self):
+        self.searcher = SAR_Project()
+        self.searcher.total_news = TOTAL
+
+    def forms(self, docs):
+        complement = Complement(array('I', sorted(set(range(TOTAL)) - docs)), TOTAL)
+        return [array('I', sorted(docs)), complement]
+
+    def bitmap_forms(self, docs):
+        # Tambien complementos cuyas noticias excluidas son un bitmap, como los que devuelve "not A - B" con B denso
+        excluded = set(range(TOTAL)) - docs
+        return self.forms(docs) + [Bitmap.from_postings(sorted(docs), TOTAL),
+                                   Complement(Bitmap.from_postings(sorted(excluded), TOTAL), TOTAL)]
+
+    def assertPosting(self, p, expected, msg=None):
+        # El resultado tiene las noticias esperadas, en orden y sin repetir
+        self.assertEqual(len(p), len(expected), msg)
+        self.assertEqual(list(p), sorted(expected), msg)
+
+    def check_pairs(self, seed, forms):
+        rng = random.Random(seed)
+        searcher = self.searcher
+        for _ in range(60):
+            a, b = random_docs(rng), random_docs(rng)
+            for p1 in forms(a):
+                for p2 in forms(b):
+                    msg = (type(p1).__name__, type(p2).__name__, len(a), len(b))
+                    self.assertPosting(searcher.and_posting(p1, p2), a & b, msg)
+                    self.assertPosting(searcher.or_posting(p1, p2), a | b, msg)
+                    self.assertPosting(searcher.minus_posting(p1, p2), a - b, msg)
+                    self.assertPosting(searcher.and_postings([p1, p2]), a & b, msg)
+                    self.assertPosting(searcher.or_postings([p1, p2]), a | b, msg)
+                self.assertPosting(searcher.reverse_posting(p1), set(range(TOTAL)) - a)
+                self.assertPosting(searcher.reverse_posting(searcher.reverse_posting(p1)), a)
+
+    def check_lists(self, seed, forms):
+        rng = random.Random(seed)
+        searcher = self.searcher
+        for _ in range(200):
+            sets = [random_docs(rng) for _ in range(rng.randint(1, 5))]
+            postings = [rng.choice(forms(docs)) for docs in sets]
+            msg = [type(p).__name__ for p in postings]
+            self.assertPosting(searcher.and_postings(postings), frozenset.intersection(*sets), msg)
+            self.assertPosting(searcher.or_postings(postings), frozenset.union(*sets), msg)
+
+    def test_complement_pairs(self):
+        self.check_pairs(7, self.forms)
+
+    def test_complement_lists(self):
+        # Las leyes de De Morgan con varios operandos, p.ej. "not A or not B or C" = "not ((A and B) - C)"
+        self.check_lists(8, self.forms)
+
+    def test_complement_is_lazy(self):
+        p = array('I', [3, 10])
+        complement = self.searcher.reverse_posting(p)
+        self.assertIsInstance(complement, Complement)
+        self.assertIs(complement.excluded, p)
+        # "A and not B" no materializa el complemento: es la diferencia A - B
+        self.assertEqual(list(self.searcher.and_posting(array('I', [1, 3, 5]), complement)), [1, 5])
+        self.assertIsInstance(self.searcher.and_posting(complement, complement), Complement)
+        self.assertIsInstance(self.searcher.or_posting(array('I', [1]), complement), Complement)
+
+    def test_bitmap_pairs(self):
+        # Todas las combinaciones de bitmap, array y complemento
+        self.check_pairs(9, self.bitmap_forms)
+
+    def test_bitmap_lists(self):
+        self.check_lists(10, self.bitmap_forms)
+
+    def test_bitmap_results(self):
+        searcher = self.searcher
+        b1 = Bitmap.from_postings(range(0, TOTAL, 2), TOTAL)
+        b2 = Bitmap.from_postings(range(0, TOTAL, 3), TOTAL)
+        p = array('I', [1, 2, 3, 4])
+        # Entre bitmaps el resultado es otro bitmap, y al cruzar con un array se filtra el array
+        self.assertIsInstance(searcher.and_posting(b1, b2), Bitmap)
+        self.assertIsInstance(searcher.minus_posting(b1, b2), Bitmap)
+        self.assertIsInstance(searcher.reverse_posting(b1), Bitmap)
+        self.assertEqual(searcher.and_posting(p, b1), array('I', [2, 4]))
+        self.assertEqual(searcher.minus_posting(p, b1), array('I', [1, 3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Consultas con comodines (ver SAR_permuterm): los terminos que devuelve el indice permuterm, en memoria y en disco,
+son los mismos que se obtienen comprobando el patron con todos los terminos.
+"""
+
+from fnmatch import fnmatchcase
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from SAR_permuterm import PermutermIndex, match_terms
+from tests.corpus import build_index, make_corpus, news_key
+
+
+def random_patterns(rng, terms, n):
+    """
+    Devuelve patrones al azar, la mayoria obtenidos cambiando por comodines partes de algun termino.
+    """
+    patterns = ['*', '?', '??', '*a*', 'a*', '*s', 'c*a*s', '?a*', '*?', 'x*y', '**']
+    while len(patterns) < n:
+        chars = list(rng.choice(terms))
+        for _ in range(rng.randint(1, 3)):
+            i = rng.randrange(len(chars))
+            if rng.random() < 0.5:
+                chars[i] = '?'
+            else:
+                j = rng.randint(i, len(chars))
+                chars[i:j] = ['*']
+        patterns.append(''.join(chars))
+    return patterns
+
+
+class PermutermTest(unittest.TestCase):
+
+    def test_memory(self):
+        rng = random.Random(11)
+        terms = sorted({''.join(rng.choice('abcs') for _ in range(rng.randint(1, 6))) for _ in range(300)})
+        permuterm = PermutermIndex(terms)
+        for pattern in random_patterns(rng, terms, 400):
+            self.assertEqual(match_terms(permuterm, pattern), [t for t in terms if fnmatchcase(t, pattern)], pattern)
+
+
+class IndexWildcardTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_terms(self):
+        # Indice permuterm en disco y patrones de prefijo, que se resuelven con el diccionario de terminos
+        rng = random.Random(12)
+        for field in ['article', 'title']:
+            terms = sorted(self.searcher.index[field].keys())
+            for pattern in random_patterns(rng, terms, 300) + [terms[0][:2] + '*', terms[-1] + '*']:
+                self.assertEqual(self.searcher.wildcard_terms(pattern, field),
+                                 [t for t in terms if fnmatchcase(t, pattern)], (field, pattern))
+
+    def test_query(self):
+        searcher = self.searcher
+        searcher.set_stemming(False)
+        # El resultado es el or de los terminos que encajan con el patron
+        for pattern in ['gob*', 'pre?ios', '*ern*', 'title:?a*']:
+            field, text = pattern.split(':') if ':' in pattern else ('article', pattern)
+            expected = set()
+            for term in searcher.index[field].keys():
+                if fnmatchcase(term, text):
+                    expected.update(searcher.solve_query('%s:%s' % (field, term)))
+            self.assertGreater(len(expected), 0, pattern)
+            self.assertEqual(sorted(news_key(searcher, n) for n in searcher.solve_query(pattern)),
+                             sorted(news_key(searcher, n) for n in expected), pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Busquedas posicionales: frases ("a b c"), terminos cercanos ('"a b"~k') y el operador near/k, comparadas con
+una busqueda exhaustiva en el texto de las noticias.
+"""
+
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from SAR_postings import to_array
+from tests.corpus import build_index, make_corpus
+
+# palabras frecuentes del corpus, para que las consultas tengan resultados
+WORDS = ['de', 'la', 'el', 'que', 'y', 'en', 'gobierno', 'precios', 'casa', 'ley']
+
+
+class PhraseQueryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        cls.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+        cls.searcher.set_stemming(False)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def tokens(self, field):
+        return [self.searcher.tokenize(self.searcher.get_news_item(newid)[field])
+                for newid in range(self.searcher.total_news)]
+
+    def solve(self, query):
+        return list(to_array(self.searcher.solve_query(query)))
+
+    def phrase(self, terms, field):
+        n = len(terms)
+        return [newid for newid, tokens in enumerate(self.tokens(field))
+                if any(tokens[i:i + n] == terms for i in range(len(tokens) - n + 1))]
+
+    def near(self, terms, distance, field):
+        # Cada termino en una posicion distinta, todas dentro de una ventana de distance + n palabras
+        result = []
+        for newid, tokens in enumerate(self.tokens(field)):
+            occurrences = [[i for i, token in enumerate(tokens) if token == term] for term in terms]
+            if any(len(set(positions)) == len(terms) and max(positions) - min(positions) <= distance + len(terms) - 1
+                   for positions in itertools.product(*occurrences)):
+                result.append(newid)
+        return result
+
+    def test_phrases(self):
+        rng = random.Random(15)
+        tokens = self.tokens('article')
+        phrases = [[rng.choice(WORDS) for _ in range(rng.randint(2, 3))] for _ in range(20)]
+        # Tambien frases sacadas del texto, que seguro que aparecen
+        for _ in range(10):
+            words = rng.choice(tokens)
+            start = rng.randrange(len(words) - 4)
+            phrases.append(words[start:start + rng.randint(2, 4)])
+        for terms in phrases:
+            expected = self.phrase(terms, 'article')
+            self.assertEqual(self.solve('"%s"' % ' '.join(terms)), expected, terms)
+            self.assertEqual(self.solve('article:"%s"' % ' '.join(terms)), expected, terms)
+        self.assertEqual(self.solve('title:"%s"' % ' '.join(phrases[-1])), self.phrase(phrases[-1], 'title'))
+
+    def test_near(self):
+        rng = random.Random(16)
+        cases = [(['de', 'de'], 2), (['la', 'la', 'la'], 5), (['gobierno', 'gobierno'], 10)]
+        cases += [([rng.choice(WORDS) for _ in range(rng.randint(2, 3))], rng.randint(0, 8)) for _ in range(20)]
+        for terms, distance in cases:
+            for field in ['article', 'title']:
+                prefix = '' if field == 'article' else field + ':'
+                expected = self.near(terms, distance, field)
+                query = (' near/%d ' % distance).join(prefix + term for term in terms)
+                self.assertEqual(self.solve(query), expected, query)
+                self.assertEqual(self.solve('%s"%s"~%d' % (prefix, ' '.join(terms), distance)), expected, query)
+
+    def test_near_errors(self):
+        for query in ['title:a near/3 b', 'a near/3 "b c"', '"a b"~2 near/3 c']:
+            with self.assertRaises(ValueError):
+                self.searcher.solve_query(query)
+
+
+if __name__ == '__main__':
+    unittest.main()
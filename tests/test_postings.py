@@ -0,0 +1,179 @@
+"""
+Codificacion de las posting lists (ver SAR_postings): varints, diferencias, PostingList y Bitmap, y busqueda
+de frases y terminos cercanos con PositionCursor.
+"""
+
+from array import array
+import itertools
+import pickle
+import random
+import unittest
+
+from SAR_postings import (Bitmap, PositionCursor, PostingList, accumulate_gaps, decode_varints, encode_varints,
+                          gaps, match_near, match_phrase, merge_sorted)
+
+
+def random_posting_list(rng, positional, n_news=200):
+    """
+    Construye una posting list con noticias y posiciones al azar, añadiendolas como al indexar.
+    """
+    posting_list = PostingList(positional)
+    for newid in sorted(rng.sample(range(100000), n_news)):
+        for position in sorted(rng.sample(range(5000), rng.randint(1, 6))):
+            posting_list.add(newid, position)
+    return posting_list
+
+
+class VarintTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [0, 1, 127, 128, 255, 300, 16383, 16384, 2 ** 31, 2 ** 32 - 1]
+        data = bytearray()
+        encode_varints(values, data)
+        self.assertEqual(decode_varints(data, len(values)), (values, len(data)))
+
+    def test_decode_from_position(self):
+        data = bytearray()
+        encode_varints([5, 1000], data)
+        first, pos = decode_varints(data, 1)
+        self.assertEqual(first, [5])
+        self.assertEqual(decode_varints(data, 1, pos), ([1000], len(data)))
+
+    def test_small_values_take_one_byte(self):
+        data = bytearray()
+        encode_varints(range(128), data)
+        self.assertEqual(len(data), 128)
+
+    def test_gaps_round_trip(self):
+        values = [3, 4, 10, 500, 501, 70000]
+        self.assertEqual(gaps(values), [3, 1, 6, 490, 1, 69499])
+        self.assertEqual(accumulate_gaps(gaps(values)), values)
+
+
+class PostingListTest(unittest.TestCase):
+
+    def assertSamePostings(self, decoded, original):
+        self.assertEqual(decoded.docs, original.docs)
+        self.assertEqual(decoded.count, original.count)
+        self.assertEqual(decoded.get_freqs(), original.get_freqs())
+        if original.positions is not None:
+            for k in range(len(original)):
+                self.assertEqual(list(decoded.get_positions(k)), list(original.get_positions(k)))
+
+    def test_add(self):
+        posting_list = PostingList(positional=True)
+        for newid, position in [(0, 1), (0, 4), (3, 0), (7, 2), (7, 9), (7, 11)]:
+            posting_list.add(newid, position)
+        self.assertEqual(list(posting_list.docs), [0, 3, 7])
+        self.assertEqual(list(posting_list.get_freqs()), [2, 1, 3])
+        self.assertEqual(list(posting_list.get_positions(2)), [2, 9, 11])
+        self.assertEqual(posting_list.count, 6)
+
+    def test_encode_decode(self):
+        rng = random.Random(0)
+        for positional in (False, True):
+            with self.subTest(positional=positional):
+                original = random_posting_list(rng, positional)
+                decoded = PostingList.decode(original.encode(), len(original), original.count, positional)
+                self.assertSamePostings(decoded, original)
+
+    def test_decode_from_memoryview(self):
+        # Al leer el indice de disco se decodifica directamente del fichero mapeado con mmap
+        original = random_posting_list(random.Random(1), True)
+        data = memoryview(b'xx' + original.encode())[2:]
+        self.assertSamePostings(PostingList.decode(data, len(original), original.count, True), original)
+
+    def test_pickle(self):
+        rng = random.Random(2)
+        for positional in (False, True):
+            with self.subTest(positional=positional):
+                original = random_posting_list(rng, positional)
+                self.assertSamePostings(pickle.loads(pickle.dumps(original)), original)
+
+    def test_extend(self):
+        rng = random.Random(3)
+        first = random_posting_list(rng, True)
+        second = random_posting_list(rng, True)
+        merged = PostingList(positional=True)
+        merged.extend(first)
+        merged.extend(second, 100000)
+        self.assertEqual(list(merged.docs), list(first.docs) + [newid + 100000 for newid in second.docs])
+        self.assertEqual(merged.count, first.count + second.count)
+        self.assertEqual(list(merged.get_positions(len(first))), list(second.get_positions(0)))
+
+
+class BitmapTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = random.Random(4)
+        total = 1000
+        docs = array('I', sorted(rng.sample(range(total), 300)))
+        bitmap = Bitmap.from_postings(docs, total)
+        self.assertEqual(len(bitmap), len(docs))
+        self.assertEqual(list(bitmap), list(docs))
+        self.assertEqual(list(Bitmap.from_bytes(bitmap.to_bytes(), total)), list(docs))
+
+    def test_complement(self):
+        total = 20
+        bitmap = Bitmap.from_postings([1, 5, 19], total)
+        self.assertEqual(list(bitmap.complement()), [n for n in range(total) if n not in (1, 5, 19)])
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_merge_sorted(self):
+        postings = [array('I', [1, 4, 9]), array('I', [2, 4, 10]), array('I', []), array('I', [0, 9])]
+        self.assertEqual(list(merge_sorted(postings)), [0, 1, 2, 4, 9, 10])
+
+
+class PositionMatchTest(unittest.TestCase):
+    """
+    match_phrase y match_near sobre una noticia con pocas palabras distintas, comparados con una busqueda
+    exhaustiva de las posiciones.
+    """
+
+    def cursors(self, words, terms):
+        # Un cursor por termino de la consulta, aunque el termino se repita, como en SAR_Project.get_positionals
+        posting_lists = {}
+        for position, word in enumerate(words):
+            posting_lists.setdefault(word, PostingList(True)).add(0, position)
+        return [PositionCursor(posting_lists[term]) for term in terms]
+
+    def near(self, words, terms, distance):
+        occurrences = [[i for i, word in enumerate(words) if word == term] for term in terms]
+        for positions in itertools.product(*occurrences):
+            if len(set(positions)) == len(positions) and max(positions) - min(positions) <= distance + len(terms) - 1:
+                return True
+        return False
+
+    def test_phrase(self):
+        rng = random.Random(11)
+        for _ in range(300):
+            words = [rng.choice('abcd') for _ in range(rng.randint(1, 30))]
+            terms = [rng.choice('abcd') for _ in range(rng.randint(1, 3))]
+            if any(term not in words for term in terms):
+                continue
+            expected = any(words[i:i + len(terms)] == terms for i in range(len(words)))
+            self.assertEqual(match_phrase(self.cursors(words, terms)), expected, (words, terms))
+
+    def test_near(self):
+        rng = random.Random(12)
+        for _ in range(300):
+            words = [rng.choice('abcd') for _ in range(rng.randint(1, 30))]
+            terms = [rng.choice('abcd') for _ in range(rng.randint(2, 3))]
+            if any(term not in words for term in terms):
+                continue
+            distance = rng.randint(0, 4)
+            self.assertEqual(match_near(self.cursors(words, terms), distance), self.near(words, terms, distance),
+                             (words, terms, distance))
+
+    def test_near_same_term(self):
+        # Un termino que aparece una sola vez no esta cerca de si mismo
+        self.assertFalse(match_near(self.cursors(['a', 'b', 'c'], ['a', 'a']), 3))
+        self.assertTrue(match_near(self.cursors(['a', 'b', 'a'], ['a', 'a']), 1))
+        self.assertFalse(match_near(self.cursors(['a', 'b', 'b', 'a'], ['a', 'a']), 1))
+        self.assertTrue(match_near(self.cursors(['a', 'b', 'a', 'a'], ['a', 'a', 'a']), 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
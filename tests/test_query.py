@@ -0,0 +1,104 @@
+"""
+Compilacion de consultas (ver SAR_query): el arbol de la consulta y el plan optimizado dan el mismo resultado
+que la consulta evaluada directamente con conjuntos.
+"""
+
+import random
+import unittest
+
+from SAR_query import QueryCompiler, optimize_query, parse_query, tokenize_query
+
+TERMS = 'abcde'
+UNIVERSE = frozenset(range(40))
+
+
+def random_sets(rng):
+    return {term: frozenset(n for n in UNIVERSE if rng.random() < 0.4) for term in TERMS}
+
+
+def evaluate(node, sets):
+    """
+    Evalua un nodo del arbol o del plan con conjuntos de noticias.
+    """
+    kind = node[0]
+    if kind == 'term':
+        return sets[node[1]]
+    if kind == 'not':
+        return UNIVERSE - evaluate(node[1], sets)
+    if kind == 'minus':
+        result = evaluate(node[1], sets)
+        for child in node[2]:
+            result = result - evaluate(child, sets)
+        return result
+    results = [evaluate(child, sets) for child in node[1]]
+    if kind == 'and':
+        return frozenset.intersection(*results)
+    return frozenset.union(*results)
+
+
+def random_query(rng, depth=0):
+    """
+    Devuelve una consulta al azar con todos sus operadores entre parentesis, y su arbol.
+    """
+    choice = rng.random()
+    if depth >= 3 or choice < 0.3:
+        term = rng.choice(TERMS)
+        return term, ('term', term)
+    if choice < 0.45:
+        text, node = random_query(rng, depth + 1)
+        return 'not ' + text, ('not', node)
+    operator = rng.choice(['and', 'or'])
+    children = [random_query(rng, depth + 1) for _ in range(rng.randint(2, 4))]
+    text = '(' + (' %s ' % operator).join(text for text, node in children) + ')'
+    return text, (operator, tuple(node for text, node in children))
+
+
+class OptimizerTest(unittest.TestCase):
+
+    def test_random_queries(self):
+        rng = random.Random(6)
+        for _ in range(500):
+            query, tree = random_query(rng)
+            sets = random_sets(rng)
+            parsed = parse_query(tokenize_query(query))
+            plan = optimize_query(parsed)
+            expected = evaluate(tree, sets)
+            self.assertEqual(evaluate(parsed, sets), expected, query)
+            self.assertEqual(evaluate(plan, sets), expected, (query, plan))
+
+    def test_left_to_right(self):
+        # and y or tienen la misma prioridad: "a or b and c" es "(a or b) and c"
+        sets = {'a': frozenset([1]), 'b': frozenset([2]), 'c': frozenset([2, 3]), 'd': frozenset(), 'e': frozenset()}
+        plan = optimize_query(parse_query(tokenize_query('a or b and c')))
+        self.assertEqual(evaluate(plan, sets), frozenset([2]))
+
+    def test_simplifications(self):
+        def plan(query):
+            return optimize_query(parse_query(tokenize_query(query)))
+        a, b, c = ('term', 'a'), ('term', 'b'), ('term', 'c')
+        self.assertEqual(plan('not not a'), a)
+        self.assertEqual(plan('a and (b and c)'), ('and', (a, b, c)))
+        self.assertEqual(plan('(a or b) or (a or c)'), ('or', (a, b, c)))
+        self.assertEqual(plan('a and not b and not c'), ('minus', a, (b, c)))
+        self.assertEqual(plan('not a and not b'), ('not', ('or', (a, b))))
+        self.assertEqual(plan('a and a'), a)
+
+
+class PlanCacheTest(unittest.TestCase):
+
+    def test_normalized_queries_share_plan(self):
+        compiler = QueryCompiler()
+        plan = compiler.compile('a and not b')
+        self.assertIs(compiler.compile('  A   AND not b '), plan)
+        self.assertEqual(compiler.plans.stats()['hits'], 1)
+
+    def test_size(self):
+        compiler = QueryCompiler(max_size=2)
+        for query in ['a', 'b', 'c', 'a']:
+            compiler.compile(query)
+        self.assertEqual(len(compiler.plans), 2)
+        self.assertEqual(compiler.plans.stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
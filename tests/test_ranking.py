@@ -0,0 +1,75 @@
+"""
+Ranking con BM25 (ver SAR_ranking): top_k con MaxScore devuelve las mismas noticias, en el mismo orden, que
+puntuar todos los candidatos y ordenarlos.
+"""
+
+from array import array
+import random
+import unittest
+
+from SAR_ranking import TermScorer, merge_freqs, top_k
+
+TOTAL = 500
+
+
+def random_terms(rng, n_terms, equal=False):
+    """
+    Devuelve las posting lists con frecuencias de unos terminos al azar. Con "equal" todas las frecuencias y
+    longitudes son iguales, asi que muchas noticias empatan.
+    """
+    terms = []
+    for _ in range(n_terms):
+        docs = array('I', sorted(rng.sample(range(TOTAL), rng.choice([1, 10, 100, 400]))))
+        freqs = array('I', (1 if equal else rng.randint(1, 5) for _ in docs))
+        terms.append((docs, freqs))
+    lengths = array('I', (50 if equal else rng.randint(10, 100) for _ in range(TOTAL)))
+    return terms, lengths
+
+
+def scorers(terms, lengths):
+    return [TermScorer(docs, freqs, lengths, 55.0, TOTAL) for (docs, freqs) in terms]
+
+
+def full_sort(candidates, terms, lengths):
+    """
+    Puntua todos los candidatos y los ordena. Los terminos se suman en el mismo orden que en top_k (de mayor a
+    menor cota) para que las puntuaciones sean identicas.
+    """
+    term_scorers = sorted(scorers(terms, lengths), key=lambda s: s.max_score, reverse=True)
+    scored = [(sum(s.score(newid) for s in term_scorers), newid) for newid in candidates]
+    return sorted(scored, key=lambda x: (-x[0], x[1]))
+
+
+class TopKTest(unittest.TestCase):
+
+    def check(self, rng, equal):
+        for _ in range(100):
+            terms, lengths = random_terms(rng, rng.randint(1, 4), equal)
+            candidates = sorted(set().union(*(docs for (docs, freqs) in terms)))
+            if rng.random() < 0.5:
+                # Como en un and: solo algunas de las noticias de los terminos son candidatas
+                candidates = sorted(rng.sample(candidates, len(candidates) // 2))
+            expected = full_sort(candidates, terms, lengths)
+            for k in [1, 3, 10, len(candidates), len(candidates) + 5]:
+                self.assertEqual(top_k(candidates, scorers(terms, lengths), k), expected[:k], k)
+
+    def test_random(self):
+        self.check(random.Random(14), False)
+
+    def test_ties(self):
+        # A igual puntuacion van primero los newids mas bajos, tambien si el corte de las k cae en un empate
+        self.check(random.Random(15), True)
+
+    def test_small_k(self):
+        terms, lengths = random_terms(random.Random(16), 2)
+        self.assertEqual(top_k(list(terms[0][0]), scorers(terms, lengths), 0), [])
+        self.assertEqual(top_k([], scorers(terms, lengths), 10), [])
+
+    def test_merge_freqs(self):
+        first = (array('I', [1, 4, 7]), array('I', [2, 1, 1]))
+        second = (array('I', [0, 4, 9]), array('I', [1, 3, 2]))
+        self.assertEqual(merge_freqs([first, second]), (array('I', [0, 1, 4, 7, 9]), array('I', [1, 2, 4, 1, 2])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Servidor de consultas (ver SAR_Server): lectura de las peticiones y estados HTTP de las respuestas.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import SAR_Server
+from SAR_Server import MAX_BODY, parse_request
+from tests.corpus import build_index, make_corpus
+
+
+class ParseRequestTest(unittest.TestCase):
+
+    def test_post(self):
+        request = parse_request('POST', '/search', json.dumps({'query': 'a and b', 'rank': 1, 'all': True}).encode())
+        self.assertEqual(request, {'query': 'a and b', 'count': False, 'snippet': False, 'stem': False,
+                                   'rank': True, 'all': True})
+
+    def test_get(self):
+        request = parse_request('GET', '/search?query=title%3A%22el+pa%C3%ADs%22&count=1&stem=true&rank=no', b'')
+        self.assertEqual(request['query'], 'title:"el país"')
+        self.assertEqual([request[option] for option in SAR_Server.OPTIONS], [True, False, True, False, False])
+
+    def test_errors(self):
+        for method, target, body in [('GET', '/search', b''), ('GET', '/search?query=', b''),
+                                     ('POST', '/search', b''), ('POST', '/search', b'{"query": 3}'),
+                                     ('POST', '/search', b'["a"]'), ('POST', '/search', b'{"query": "a"')]:
+            with self.subTest(target=target, body=body):
+                with self.assertRaises(ValueError):
+                    parse_request(method, target, body)
+
+
+class SyncPool:
+    """
+    Pool que ejecuta las funciones en el mismo proceso, para probar el servidor sin crear procesos.
+    """
+
+    def apply_async(self, function, args, callback, error_callback):
+        try:
+            result = function(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+
+class Writer:
+    """
+    Sustituye al StreamWriter de la conexion guardando lo que se escribe.
+    """
+
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class HandleTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix='sar_test_')
+        newsdir = os.path.join(cls.tmp, 'news')
+        make_corpus(newsdir)
+        SAR_Server.searcher = build_index(newsdir, os.path.join(cls.tmp, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        SAR_Server.searcher = None
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def request(self, data, pool=None):
+        """
+        Atiende una conexion que envia "data" y devuelve el estado y el cuerpo JSON de la respuesta.
+        """
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            writer = Writer()
+            await SAR_Server.handle(reader, writer, pool or SyncPool())
+            return writer
+        writer = asyncio.run(run())
+        self.assertTrue(writer.closed)
+        head, _, body = writer.data.partition(b'\r\n\r\n')
+        status_line = head.split(b'\r\n')[0].decode('latin-1')
+        self.assertIn(b'Content-Length: %d' % len(body), head)
+        return int(status_line.split()[1]), json.loads(body.decode('utf-8'))
+
+    def post(self, body, target='/search'):
+        return b'POST %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (target.encode(), len(body)) + body
+
+    def test_search(self):
+        status, response = self.request(b'GET /search?query=gobierno&count=1 HTTP/1.1\r\n\r\n')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['count'], len(SAR_Server.searcher.solve_query('gobierno')))
+        status, response = self.request(self.post(json.dumps({'query': 'gobierno', 'rank': True}).encode()))
+        self.assertEqual(status, 200)
+        self.assertEqual(response['count'], len(SAR_Server.searcher.solve_query('gobierno')))
+        self.assertGreater(len(response['results']), 0)
+
+    def test_health(self):
+        self.assertEqual(self.request(b'GET /health HTTP/1.1\r\n\r\n'),
+                         (200, {'status': 'ok', 'news': SAR_Server.searcher.total_news}))
+
+    def test_errors(self):
+        cases = [
+            (b'\r\n', 400),
+            (b'GET /search HTTP/1.1\r\n\r\n', 400),
+            (self.post(b'{"query": '), 400),
+            (self.post(b'{"query": "\xff"}'), 400),
+            # Consultas no validas: errores con excepcion y errores que se imprimen y terminan con exit()
+            (self.post(b'{"query": "gobierno and"}'), 400),
+            (self.post(b'{"query": "title:[2015-01-01 to 2015-01-02]"}'), 400),
+            (b'GET /otra HTTP/1.1\r\n\r\n', 404),
+            (b'DELETE /search HTTP/1.1\r\n\r\n', 404),
+            (b'POST /search HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (MAX_BODY + 1), 413),
+        ]
+        for data, expected in cases:
+            with self.subTest(data=data[:40]):
+                status, response = self.request(data)
+                self.assertEqual(status, expected)
+                self.assertTrue(response['error'].startswith('ERROR'), response)
+
+    def test_pool(self):
+        # Con un pool de procesos creado despues de cargar el indice, como en el servidor
+        pool = multiprocessing.get_context('fork').Pool(1)
+        try:
+            status, response = self.request(b'GET /search?query=gobierno&count=1 HTTP/1.1\r\n\r\n', pool)
+            self.assertEqual((status, response['count']), (200, len(SAR_Server.searcher.solve_query('gobierno'))))
+            status, response = self.request(self.post(b'{"query": "gobierno and"}'), pool)
+            self.assertEqual(status, 400)
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+if __name__ == '__main__':
+    unittest.main()